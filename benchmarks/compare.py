@@ -0,0 +1,74 @@
+"""
+Compare two json reports of run.py, exiting with 1 when a benchmark regressed beyond the threshold
+
+    python benchmarks/compare.py before.json after.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+# measure -> whether higher is better
+MEASURES = {
+    'ops_per_s': True,
+    'p50_ms': False,
+    'p99_ms': False,
+    'rss_growth_mb': False,
+    'connections': False,
+}
+# growths of the rss below this many MB are noise
+RSS_NOISE_MB = 2.0
+
+
+def _change(before, after):
+    if before is None or after is None:
+        return None
+    if before == 0:
+        return 0.0 if after == 0 else float('inf')
+    return (after - before) / before
+
+
+def compare(before, after, threshold=0.1):
+    """
+    return the rows (name, measure, before, after, change, regressed) of the benchmarks found in both reports
+    """
+    previous = {result['name']: result for result in before['results']}
+    rows = []
+    for result in after['results']:
+        old = previous.get(result['name'])
+        if old is None:
+            continue
+        for measure, higher_is_better in MEASURES.items():
+            change = _change(old.get(measure), result.get(measure))
+            if change is None:
+                continue
+            worse = -change if higher_is_better else change
+            if measure == 'rss_growth_mb':
+                regressed = result[measure] - old[measure] > max(RSS_NOISE_MB, threshold * old[measure])
+            else:
+                regressed = worse > threshold
+            rows.append((result['name'], measure, old[measure], result[measure], change, regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two benchmark reports of benchmarks/run.py')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change counted as a regression')
+    args = parser.parse_args(argv)
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"{before.get('sdk_version')} -> {after.get('sdk_version')}")
+    regressions = 0
+    for name, measure, old, new, change, regressed in compare(before, after, args.threshold):
+        regressions += regressed
+        print(f"{'!' if regressed else ' '} {name:<48} {measure:<14} {old:>12} {new:>12} {change:>+8.1%}")
+    if regressions:
+        print(f'{regressions} regressions beyond {args.threshold:.0%}')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,340 @@
+"""
+Throughput and latency benchmarks of the installed SDK against a local stand-in IDP server, written as json to
+compare versions of the SDK with compare.py
+
+    pip install -e .      # or PYTHONPATH=. to benchmark a checkout
+    python benchmarks/run.py --output after.json
+    python benchmarks/compare.py before.json after.json
+
+Only the public api of the released versions is used, the benchmarks of later methods are skipped when the SDK
+does not have them. The stand-in server, benchmarks/stub_server.py, runs in a subprocess from this directory, so
+that it does not change with the SDK and the peak RSS and CPU time measured are the client's only.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import sixe_idp
+import sixe_idp.api
+from sixe_idp.api import Client, OauthClient, compute_hmac_sha256, verify_app_header_for_mode3
+from stub_server import STATS_PATH, TOKEN_PATH
+
+KB = 1024
+MB = 1024 * KB
+SECRET = 'benchmark-secret'
+
+
+def _rss():
+    """
+    return the resident set size of the process in bytes, None where it cannot be read
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * KB
+    except ImportError:
+        return None
+
+
+class _RssSampler(object):
+    """
+    peak resident set size of the process while the context is entered
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.baseline = self.peak = _rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = _rss()
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+
+
+class StubServerProcess(object):
+    """
+    benchmarks/stub_server.py in a subprocess, on a free port
+    """
+
+    def __init__(self, *args):
+        self.args = [str(arg) for arg in args]
+        self.url = None
+        self._process = None
+
+    def __enter__(self):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_server.py')
+        self._process = subprocess.Popen([sys.executable, script, '--port', '0'] + self.args,
+                                         stdout=subprocess.PIPE, universal_newlines=True)
+        match = re.search(r'(http://\S+?),', self._process.stdout.readline())
+        if match is None:
+            self._process.kill()
+            raise RuntimeError('the stub server did not start')
+        self.url = match.group(1)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._process.terminate()
+        self._process.wait()
+        self._process.stdout.close()
+
+    def stats(self):
+        return requests.get(self.url + STATS_PATH).json()
+
+    def client(self):
+        oauth_client = OauthClient(oauth2_authorization_url=self.url + TOKEN_PATH, client_id='benchmark',
+                                   client_secret=SECRET)
+        return Client(http_host=self.url, oauth_client=oauth_client)
+
+
+def wait_done(client, application_id, timeout=60, min_interval=0.05, max_interval=2.0):
+    """
+    poll extraction_result until the task is no longer being processed, with an exponential backoff
+    """
+    deadline = time.monotonic() + timeout
+    interval = min_interval
+    while True:
+        result = client.extraction_result(application_id)
+        if result['data']['taskStatus'] not in ('Init', 'Doing'):
+            return result
+        if time.monotonic() + interval > deadline:
+            raise TimeoutError(f'task {application_id} not done after {timeout}s')
+        time.sleep(interval)
+        interval = min(max_interval, interval * 1.6)
+
+
+def _percentile(values, percent):
+    """
+    nearest-rank percentile of sorted values
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(percent / 100.0 * len(values))) - 1))]
+
+
+def measure(name, operation, ops, concurrency=1, server=None, **info):
+    """
+    Run operation(i) for i in range(ops) from concurrency threads and return its measures
+    :param server: :class:`StubServerProcess` whose calls and connections are counted
+    :param info: extra fields of the result, e.g. the payload size
+    """
+    latencies = []
+    errors = []
+
+    def run(i):
+        started = time.perf_counter()
+        try:
+            operation(i)
+        except Exception as e:
+            errors.append(repr(e))
+            return
+        latencies.append(time.perf_counter() - started)
+
+    before = server.stats() if server is not None else {}
+    cpu = time.process_time()
+    with _RssSampler() as rss:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(run, range(ops)))
+        seconds = time.perf_counter() - started
+    cpu = time.process_time() - cpu
+    after = server.stats() if server is not None else {}
+    latencies.sort()
+    result = {
+        'name': name,
+        'ops': ops,
+        'concurrency': concurrency,
+        'errors': len(errors),
+        'seconds': round(seconds, 4),
+        'ops_per_s': round(len(latencies) / seconds, 2) if seconds else None,
+        'p50_ms': round(_percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p99_ms': round(_percentile(latencies, 99) * 1000, 3) if latencies else None,
+        'cpu_s': round(cpu, 4),
+        'peak_rss_mb': round(rss.peak / MB, 2) if rss.peak is not None else None,
+        'rss_growth_mb': round((rss.peak - rss.baseline) / MB, 2) if rss.peak is not None else None,
+    }
+    if server is not None:
+        result['requests'] = after.get('requests', 0) - before.get('requests', 0)
+        result['connections'] = after.get('connections', 0) - before.get('connections', 0)
+    if errors:
+        result['first_error'] = errors[0]
+    result.update(info)
+    return result
+
+
+def _sample_file(directory, size, suffix='.pdf'):
+    path = os.path.join(directory, f'sample-{size}{suffix}')
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.4\n')
+        f.write(os.urandom(size - 9))
+    return path
+
+
+def _create(client, path):
+    # a file object, the released versions do not take paths
+    with open(path, 'rb') as f:
+        return client.extraction_async_create(file=f, file_type='CBKS')
+
+
+def _faas_create(client, path):
+    with open(path, 'rb') as f:
+        return client.extraction_faas_create(files={'file': f}, customerType=1)
+
+
+def bench_create(args, directory):
+    results = []
+    with StubServerProcess('--latency', args.latency) as server:
+        client = server.client()
+        for size, ops, concurrency in ((100 * KB, 500, 16), (20 * MB, 20, 4)):
+            path = _sample_file(directory, size)
+            results.append(measure(f'extraction_async_create[{size // KB}KB]', lambda i: _create(client, path),
+                                   args.scale(ops), concurrency, server, payload_bytes=size))
+    return results
+
+
+def bench_polling(args, directory):
+    results = []
+    path = _sample_file(directory, 10 * KB)
+    with StubServerProcess('--latency', args.latency, '--completion-time', 0) as server:
+        client = server.client()
+        extraction = _create(client, path).task_id
+        faas = _faas_create(client, path).task_id
+        for name, operation in (('extraction_result', lambda i: client.extraction_result(extraction)),
+                                ('extraction_faas_status', lambda i: client.extraction_faas_status(faas)),
+                                ('extraction_faas_result', lambda i: client.extraction_faas_result(faas))):
+            results.append(measure(name, operation, args.scale(2000), 16, server))
+    # submit and wait, the tasks taking 0.5s on average, the latency is the time to the final result
+    with StubServerProcess('--latency', args.latency, '--completion-time', 0.5) as server:
+        client = server.client()
+
+        def submit_and_wait(i):
+            wait_done(client, _create(client, path).task_id)
+
+        results.append(measure('extraction_submit_and_wait', submit_and_wait, args.scale(200), 32, server))
+    return results
+
+
+def bench_export(args, directory):
+    results = []
+    path = _sample_file(directory, 10 * KB)
+    for size, ops in ((64 * KB, 500), (MB, 200), (16 * MB, 20)):
+        with StubServerProcess('--latency', args.latency, '--completion-time', 0, '--export-size', size) as server:
+            client = server.client()
+            faas = _faas_create(client, path).task_id
+            results.append(measure(f'extraction_faas_export[{size // KB}KB]',
+                                   lambda i: client.extraction_faas_export(faas),
+                                   args.scale(ops), 4, server, payload_bytes=size))
+            if not hasattr(client, 'extraction_faas_export_stream'):
+                continue
+
+            def export_stream(i):
+                for _ in client.extraction_faas_export_stream(faas):
+                    pass
+
+            results.append(measure(f'extraction_faas_export_stream[{size // KB}KB]', export_stream,
+                                   args.scale(ops), 4, server, payload_bytes=size))
+    return results
+
+
+def bench_verify(args, directory):
+    results = []
+    result = json.dumps({'applicationId': '100000', 'taskStatus': 'Done', 'fields': [
+        {'fieldCode': f'F_{i}', 'value': f'value {i}'} for i in range(50)]})
+    excel = os.urandom(64 * KB)
+    for size, ops in ((MB, 200), (16 * MB, 20)):
+        pdf = os.urandom(size)
+        # text parts, the released versions encode the joined payload as utf-8 before signing it
+        parts = (result, pdf.decode('latin-1'), excel.decode('latin-1'), result)
+        signature = compute_hmac_sha256(SECRET, ''.join(parts).encode('utf-8'))
+        path = os.path.join(directory, f'callback-{size}.pdf')
+        with open(path, 'wb') as f:
+            f.write(parts[1].encode('utf-8'))
+
+        def verify(i):
+            if not verify_app_header_for_mode3(*parts, signature, SECRET):
+                raise AssertionError('signature mismatch')
+
+        def verify_file(i):
+            with open(path, 'rb') as f:
+                if not verify_app_header_for_mode3(result, f, parts[2], result, signature, SECRET):
+                    raise AssertionError('signature mismatch')
+
+        results.append(measure(f'verify_app_header_for_mode3[{size // KB}KB]', verify, args.scale(ops),
+                               payload_bytes=size))
+        if hasattr(sixe_idp.api, 'HmacVerifier'):
+            # file objects are only verified by the versions signing incrementally
+            results.append(measure(f'verify_app_header_for_mode3_file[{size // KB}KB]', verify_file,
+                                   args.scale(ops), payload_bytes=size))
+        del pdf, parts
+    return results
+
+
+BENCHMARKS = {
+    'create': bench_create,
+    'polling': bench_polling,
+    'export': bench_export,
+    'verify': bench_verify,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the IDP client against a local stand-in server')
+    parser.add_argument('--output', '-o', help='json file of the results, printed when not given')
+    parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS), help='groups of benchmarks to run')
+    parser.add_argument('--latency', type=float, default=0.0, help='latency of the stand-in server calls in seconds')
+    parser.add_argument('--quick', action='store_true', help='run a tenth of the operations')
+    args = parser.parse_args(argv)
+    args.scale = (lambda ops: max(1, ops // 10)) if args.quick else (lambda ops: ops)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='sixe-idp-benchmarks-') as directory:
+        for name in args.only or BENCHMARKS:
+            for result in BENCHMARKS[name](args, directory):
+                print(f"{result['name']:<48} {result['ops_per_s'] or 0:>10.1f} ops/s"
+                      f"  p50 {result['p50_ms'] or 0:>9.2f}ms  p99 {result['p99_ms'] or 0:>9.2f}ms"
+                      f"  rss +{result['rss_growth_mb'] or 0:.1f}MB"
+                      f"  connections {result.get('connections', '-')}", file=sys.stderr)
+                results.append(result)
+    report = {
+        'sdk_version': sixe_idp.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'server_latency': args.latency,
+        'quick': args.quick,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
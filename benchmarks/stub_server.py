@@ -0,0 +1,188 @@
+"""
+Stand-in of the IDP api for the benchmarks, with the standard library only, so that the server under test does
+not change with the version of the SDK being benchmarked. It serves the oauth2 token, the extraction create and
+result calls and the faas create, status, result and export calls.
+
+    python benchmarks/stub_server.py --port 8000 --latency 0.02 --completion-time 0.5
+"""
+import argparse
+import io
+import itertools
+import json
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+STATS_PATH = '/stub/stats'
+TOKEN_PATH = '/api/token'
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class StubServer(object):
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, completion_time=2.0, export_size=64 * 1024):
+        """
+        :param latency: seconds added to every call
+        :param completion_time: seconds after which a task is Done
+        :param export_size: size in bytes of the exported zip files
+        """
+        self.latency = latency
+        self.completion_time = completion_time
+        self.export = self._export_bytes(export_size)
+        self.stats = {'requests': 0, 'connections': 0, 'bytes_received': 0}
+        self._done_at = {}
+        self._ids = itertools.count(100000)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+        self.url = f'http://{host}:{self._server.server_address[1]}'
+
+    @staticmethod
+    def _export_bytes(size):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+            zf.writestr('result.json', bytes(max(0, size - 200)))
+        return buffer.getvalue()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + value
+
+    def create(self):
+        with self._lock:
+            application_id = str(next(self._ids))
+            self._done_at[application_id] = time.time() + self.completion_time
+        return application_id
+
+    def status(self, body):
+        """
+        return the (application id, status) of the task of a status call, the status is None for unknown tasks
+        """
+        application_id = str(body.get('applicationId', body.get('application_id')))
+        with self._lock:
+            done_at = self._done_at.get(application_id)
+        if done_at is None:
+            return application_id, None
+        return application_id, 'Done' if time.time() >= done_at else 'Doing'
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def shutdown(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _ok(data):
+    return 200, {'code': 200, 'message': 'success', 'data': data}
+
+
+def _not_found():
+    return 400, {'code': 400, 'message': 'Task not found'}
+
+
+def _handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            stub.count('connections')
+
+        def log_message(self, format, *args):
+            pass
+
+        def _body(self):
+            if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                body = bytearray()
+                while True:
+                    size = int(self.rfile.readline().split(b';')[0], 16)
+                    if not size:
+                        self.rfile.readline()
+                        break
+                    body += self.rfile.read(size)
+                    self.rfile.readline()
+                return bytes(body)
+            remaining = int(self.headers.get('Content-Length') or 0)
+            parts = []
+            while remaining:
+                part = self.rfile.read(min(remaining, READ_CHUNK_SIZE))
+                if not part:
+                    break
+                parts.append(part)
+                remaining -= len(part)
+            return b''.join(parts)
+
+        def _reply(self, status, body, content_type='application/json'):
+            if not isinstance(body, bytes):
+                body = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if urlsplit(self.path).path == STATS_PATH:
+                with stub._lock:
+                    stats = dict(stub.stats)
+                return self._reply(200, stats)
+            self._reply(404, {'code': 404, 'message': 'Not found'})
+
+        def do_POST(self):
+            raw = self._body()
+            stub.count('requests')
+            stub.count('bytes_received', len(raw))
+            if stub.latency:
+                time.sleep(stub.latency)
+            path = urlsplit(self.path).path
+            body = {}
+            if 'json' in self.headers.get('Content-Type', ''):
+                body = json.loads(raw or b'{}')
+            if path == TOKEN_PATH:
+                return self._reply(*_ok({'value': f'token-{time.time()}', 'expired': False}))
+            if path in ('/customer/extraction/fields/async', '/customer/extraction/faas/analysis'):
+                return self._reply(*_ok(stub.create()))
+            application_id, status = stub.status(body)
+            if status is None:
+                return self._reply(*_not_found())
+            if path == '/customer/extraction/field/async/result':
+                data = {'applicationId': application_id, 'taskStatus': status}
+                if status == 'Done':
+                    data['fields'] = [{'fieldCode': f'F_CBKS_{i}', 'value': f'value {i}'} for i in range(5)]
+                return self._reply(*_ok(data))
+            if path == '/customer/extraction/faas/analysis/status':
+                return self._reply(*_ok({'applicationId': application_id, 'analysisStatus': status}))
+            if path == '/customer/extraction/faas/analysis/result':
+                return self._reply(*_ok({'applicationId': application_id, 'analysisStatus': status,
+                                         'insight': {'monthlyAverageBalance': 1000.0, 'transactions': 42}}))
+            if path == '/customer/extraction/faas/analysis/export':
+                return self._reply(200, stub.export, 'application/octet-stream')
+            self._reply(404, {'code': 404, 'message': f'No route {path}'})
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stand-in IDP server of the benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every call')
+    parser.add_argument('--completion-time', type=float, default=2.0, help='seconds for a task to be Done')
+    parser.add_argument('--export-size', type=int, default=64 * 1024, help='size of the exported files')
+    args = parser.parse_args(argv)
+    stub = StubServer(args.host, args.port, latency=args.latency, completion_time=args.completion_time,
+                      export_size=args.export_size)
+    print(f'stub IDP server on {stub.url}, token url {stub.url}{TOKEN_PATH}', flush=True)
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,15 @@ Read more on https://idp-sdk-doc.6estates.com/
     license='BSD 2-clause',
     packages=['sixe_idp'],
     install_requires=['requests'],
+    extras_require={
+        'async': ['aiohttp'],
+        'fast': ['orjson'],
+        'columnar': ['numpy'],
+        'parquet': ['pyarrow'],
+    },
+    entry_points={
+        'console_scripts': ['sixe-idp-history=sixe_idp.history:main'],
+    },
 
     classifiers=[
         'Programming Language :: Python :: 3.7',
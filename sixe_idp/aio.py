@@ -0,0 +1,382 @@
+"""
+Asyncio client of the 6Estates IDP API, mirroring :class:`sixe_idp.api.Client`
+
+It needs aiohttp, which can be installed with ``pip install 6estates-idp[async]``
+"""
+import asyncio
+import json
+import os
+import time
+from types import MappingProxyType
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .api import (DEFAULT_TIMEOUT, BaseClient, IDPConfigurationException, IDPException, Task, build_add_hitl_data,
+                  build_application_data, build_card_fields_data, build_doc_agent_create_data,
+                  build_doc_agent_export_data, build_extraction_create_data, build_faas_create_data,
+                  build_split_and_extraction_create_data, build_task_history_params, build_token_request_data,
+                  check_export, check_faas_export, check_response, parse_token_response)
+
+
+def _require_aiohttp():
+    if aiohttp is None:
+        raise IDPConfigurationException(
+            'aiohttp is required for the asyncio client, please install it with: pip install 6estates-idp[async]')
+
+
+def _form_value(value):
+    if isinstance(value, (str, bytes)):
+        return value
+    return str(value)
+
+
+def client_timeout(timeout):
+    """
+    return the aiohttp.ClientTimeout of a requests timeout, a (connect, read) tuple or a number of seconds,
+    None means waiting forever
+    """
+    if timeout is None:
+        return aiohttp.ClientTimeout(total=None)
+    connect, read = timeout if isinstance(timeout, (list, tuple)) else (timeout, timeout)
+    return aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read)
+
+
+def build_form_data(data, files, opened=None):
+    """
+    return the multipart aiohttp.FormData of the form data and files, encoded the same way as requests does
+    :param data: form data, list values are sent as repeated fields
+    :type data: dict
+    :param files: files to upload, like {"file": file} or {"files": ("test.zip", file)}, where file can also be
+        a path, which is opened here
+    :type files: dict
+    :param opened: list the files opened from paths are appended to, which the caller closes once the request
+        is done, whether it was sent or not
+    :type opened: list
+    """
+    form = aiohttp.FormData()
+    for key, value in data.items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        for v in values:
+            form.add_field(key, _form_value(v))
+    for name, file in files.items():
+        content_type = None
+        if isinstance(file, (list, tuple)):
+            if len(file) > 2:
+                content_type = file[2]
+            filename, file = file[0], file[1]
+        elif isinstance(file, (str, os.PathLike)):
+            filename = os.path.basename(file)
+        else:
+            filename = os.path.basename(getattr(file, 'name', None) or name)
+        if isinstance(file, (str, os.PathLike)):
+            file = open(file, 'rb')
+            if opened is not None:
+                opened.append(file)
+        form.add_field(name, file, filename=filename, content_type=content_type)
+    return form
+
+
+class AsyncOauthClient(object):
+    def __init__(self, client_id=None, client_secret=None,
+                 oauth2_authorization_url='https://oauth-sea.6estates.com/api/token', refresh_interval=90 * 60,
+                 refresh_ahead=5 * 60):
+        """
+        Initializes the asyncio Oauth Client, the token is fetched on first use and refreshed every refresh_interval
+        :param client_id: client id found on web
+        :type client_id: str
+        :param client_secret: client secret found on web
+        :type client_secret: str
+        :param oauth2_authorization_url: full url of the oauth2 token api
+        :type oauth2_authorization_url: str
+        :param refresh_interval: seconds after which the token is refreshed
+        :type refresh_interval: int
+        :param refresh_ahead: seconds before refresh_interval at which a background refresh is started, while
+            the callers keep using the current token
+        :type refresh_ahead: int
+        :returns: :class:`AsyncOauthClient <AsyncOauthClient>`
+        """
+        if client_id is None or client_secret is None:
+            raise IDPException("client_id and client_secret are required for Oauth2Client")
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.oauth2_authorization_url = oauth2_authorization_url
+        self.refresh_interval = refresh_interval
+        self.refresh_ahead = refresh_ahead
+        self.token_header = None
+        self.last_authorization_time = None
+        self._lock = None
+        self._refresh_task = None
+
+    def _token_is_fresh(self, interval=None):
+        if self.token_header is None:
+            return False
+        interval = self.refresh_interval if interval is None else interval
+        return int(time.time() * 1000) - self.last_authorization_time <= interval * 1000
+
+    async def _refresh(self, session, interval=None):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._token_is_fresh(interval):
+                await self.get_IDP_new_authorization(session)
+
+    async def _refresh_ahead(self, session):
+        try:
+            await self._refresh(session, max(self.refresh_interval - self.refresh_ahead, 0))
+        except Exception:
+            # the current token is still valid, the next caller starts another attempt
+            pass
+        finally:
+            self._refresh_task = None
+
+    async def get_IDP_new_authorization(self, session):
+        """
+        Fetches a new token from the oauth2 server
+        :param session: aiohttp.ClientSession used for the request
+        """
+        headers = {"Content-Type": "application/json"}
+        data = build_token_request_data(self.client_id, self.client_secret)
+        async with session.post(self.oauth2_authorization_url, headers=headers, json=data) as r:
+            payload = json.loads(await r.read())
+            authorization_value = parse_token_response(r.status < 400, payload)
+        self.last_authorization_time = int(time.time() * 1000)
+        self.token_header = MappingProxyType({"Authorization": authorization_value})
+
+    async def get_token_header(self, session):
+        """
+        return the authorization header, concurrent callers share a single refresh of an expired token
+        :param session: aiohttp.ClientSession used if the token needs to be refreshed
+        """
+        if self._token_is_fresh():
+            if self._refresh_task is None and not self._token_is_fresh(self.refresh_interval - self.refresh_ahead):
+                self._refresh_task = asyncio.ensure_future(self._refresh_ahead(session))
+            return self.token_header
+        await self._refresh(session)
+        return self.token_header
+
+
+class AsyncClient(BaseClient):
+    def __init__(self, http_host, oauth_client: AsyncOauthClient, session=None, limit=100, limit_per_host=0,
+                 keepalive_timeout=30, timeout=DEFAULT_TIMEOUT):
+        """
+        Initializes the asyncio IDP Client, every method is a coroutine taking the same params as the
+        method of the same name on :class:`sixe_idp.api.Client`
+        :param http_host: need full host url, e.g. https://idp-sea.6estates.com
+        :param oauth_client: AsyncOauthClient object
+        :param session: aiohttp.ClientSession to use, a pooled keep-alive session is created if not given
+        :param limit: maximum number of simultaneous connections, when session is not given
+        :param limit_per_host: maximum number of simultaneous connections to one host, 0 means no limit
+        :param keepalive_timeout: seconds an idle connection is kept alive
+        :param timeout: timeout of the calls, a (connect, read) tuple or a number of seconds as with
+            :class:`sixe_idp.api.HttpTransport`, None means waiting forever
+        :returns: :class:`AsyncClient <AsyncClient>` object
+
+        Use it as an async context manager, or call close() when done:
+
+            async with AsyncClient(http_host, oauth_client) as client:
+                task = await client.extraction_async_create(file=open(path, 'rb'), file_type='CBKS')
+        """
+        _require_aiohttp()
+        super().__init__(http_host)
+        self.oauth_client = oauth_client
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self._timeout = client_timeout(timeout)
+        self._session = session
+        self._owns_session = session is None
+
+    @property
+    def session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self._timeout)
+        return self._session
+
+    async def close(self):
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _request(self, method, url, **kwargs):
+        """
+        return the http ok flag and the raw body of an authorized request
+        """
+        headers = await self.oauth_client.get_token_header(self.session)
+        kwargs.setdefault('timeout', self._timeout)
+        async with self.session.request(method, url, headers=headers, **kwargs) as r:
+            return r.status < 400, await r.read()
+
+    async def _request_json(self, method, url, **kwargs):
+        ok, body = await self._request(method, url, **kwargs)
+        return check_response(ok, json.loads(body))
+
+    async def _request_form(self, url, data, files):
+        """
+        return the checked json payload of a multipart POST, the files opened from paths are closed afterwards
+        """
+        opened = []
+        try:
+            form = build_form_data(data, files, opened)
+            return await self._request_json('POST', url, data=form)
+        finally:
+            for file in opened:
+                file.close()
+
+    async def extraction_async_create(self, file=None, file_type=None, fileTypeFrom=None, lang=None, customer=None,
+                                      customer_param=None, callback=None, auto_callback=None, callback_mode=None,
+                                      hitl=None, extractMode=None, includingFieldCodes=None, autoChecks=None,
+                                      remark=None):
+        """
+        see :meth:`sixe_idp.api.Client.extraction_async_create`
+        """
+        data = build_extraction_create_data(file=file, file_type=file_type, fileTypeFrom=fileTypeFrom, lang=lang,
+                                            customer=customer, customer_param=customer_param, callback=callback,
+                                            auto_callback=auto_callback, callback_mode=callback_mode, hitl=hitl,
+                                            extractMode=extractMode, includingFieldCodes=includingFieldCodes,
+                                            autoChecks=autoChecks, remark=remark)
+        return Task(await self._request_form(self.extraction_async_create_url, data, {"file": file}))
+
+    async def extraction_result(self, application_id=None):
+        """
+        see :meth:`sixe_idp.api.Client.extraction_result`
+        """
+        data = build_application_data(application_id)
+        return await self._request_json('POST', self.extraction_result_url, json=data)
+
+    async def extraction_task_history(self, page=None, limit=None, sortColumn=None, sortOrder=None, status=None,
+                                      fileTypeCode=None, source=None, edited=None, hitl=None, fileName=None,
+                                      startCreateTime=None, endCreateTime=None):
+        """
+        see :meth:`sixe_idp.api.Client.extraction_task_history`
+        """
+        data = build_task_history_params(page=page, limit=limit, sortColumn=sortColumn, sortOrder=sortOrder,
+                                         status=status, fileTypeCode=fileTypeCode, source=source, edited=edited,
+                                         hitl=hitl, fileName=fileName, startCreateTime=startCreateTime,
+                                         endCreateTime=endCreateTime)
+        params = {k: _form_value(v) for k, v in data.items()}
+        return await self._request_json('GET', self.extraction_task_history_url, params=params)
+
+    async def extraction_task_add_hitl(self, applicationId, callback=None, autoCallback=None, callbackMode=None):
+        """
+        see :meth:`sixe_idp.api.Client.extraction_task_add_hitl`
+        """
+        data = build_add_hitl_data(applicationId=applicationId, callback=callback, autoCallback=autoCallback,
+                                   callbackMode=callbackMode)
+        return await self._request_json('POST', self.extraction_task_add_hitl_url, json=data)
+
+    async def extraction_faas_create(self, files, customerType: int, countryId: str = None, regionId: str = None,
+                                     informationType: int = None, cifNumber: str = None, borrowerName: str = None,
+                                     loanAmount: float = None, applicationNumber: str = None,
+                                     applicationDate: str = None, currency: str = None, rateDateType: int = None,
+                                     rateFrom: int = None, rateDate: str = None, automatic: bool = True,
+                                     hitlType: int = 0, industryType: str = None, industryBiCode: str = None,
+                                     ebitdaRatio: str = None, relatedParties: str = None, supplierBuyer: str = None,
+                                     checkAccountStr: str = None, callbackUrl: str = None, autoCallback: bool = True,
+                                     callbackMode: int = 0):
+        """
+        see :meth:`sixe_idp.api.Client.extraction_faas_create`
+        """
+        data = build_faas_create_data(files=files, customerType=customerType, countryId=countryId,
+                                      regionId=regionId, informationType=informationType, cifNumber=cifNumber,
+                                      borrowerName=borrowerName, loanAmount=loanAmount,
+                                      applicationNumber=applicationNumber, applicationDate=applicationDate,
+                                      currency=currency, rateDateType=rateDateType, rateFrom=rateFrom,
+                                      rateDate=rateDate, automatic=automatic, hitlType=hitlType,
+                                      industryType=industryType, industryBiCode=industryBiCode,
+                                      ebitdaRatio=ebitdaRatio, relatedParties=relatedParties,
+                                      supplierBuyer=supplierBuyer, checkAccountStr=checkAccountStr,
+                                      callbackUrl=callbackUrl, autoCallback=autoCallback, callbackMode=callbackMode)
+        return Task(await self._request_form(self.extraction_faas_create_url, data, files))
+
+    async def extraction_faas_status(self, application_id=None):
+        """
+        see :meth:`sixe_idp.api.Client.extraction_faas_status`
+        """
+        data = build_application_data(application_id)
+        payload = await self._request_json('POST', self.extraction_faas_status_url, json=data)
+        return payload['data']['analysisStatus']
+
+    async def extraction_faas_result(self, application_id=None):
+        """
+        see :meth:`sixe_idp.api.Client.extraction_faas_result`
+        """
+        data = build_application_data(application_id)
+        ok, body = await self._request('POST', self.extraction_faas_result_url, json=data)
+        return json.loads(body)
+
+    async def extraction_faas_export(self, application_id=None):
+        """
+        see :meth:`sixe_idp.api.Client.extraction_faas_export`
+        """
+        data = build_application_data(application_id)
+        ok, body = await self._request('POST', self.extraction_faas_export_url, json=data)
+        return check_faas_export(body)
+
+    async def extraction_doc_agent_create(self, flowCode: int, file, callback: str = None, autoCallback: bool = None,
+                                          callbackMode: int = None, callbackQaCodes: str = None,
+                                          fileDocTypeList: list = None):
+        """
+        see :meth:`sixe_idp.api.Client.extraction_doc_agent_create`
+        """
+        data = build_doc_agent_create_data(flowCode=flowCode, file=file, callback=callback,
+                                           autoCallback=autoCallback, callbackMode=callbackMode,
+                                           callbackQaCodes=callbackQaCodes, fileDocTypeList=fileDocTypeList)
+        return Task(await self._request_form(self.extraction_doc_agent_create_url, data, {"file": file}))
+
+    async def extraction_doc_agent_status(self, applicationId):
+        """
+        see :meth:`sixe_idp.api.Client.extraction_doc_agent_status`
+        """
+        data = build_application_data(applicationId)
+        return await self._request_json('POST', self.extraction_doc_agent_status_url, json=data)
+
+    async def extraction_doc_agent_export(self, applicationId, task_codes=None):
+        """
+        see :meth:`sixe_idp.api.Client.extraction_doc_agent_export`
+        """
+        data = build_doc_agent_export_data(applicationId=applicationId, task_codes=task_codes)
+        ok, body = await self._request('POST', self.extraction_doc_agent_export_url, json=data)
+        return check_export(ok, body)
+
+    async def extraction_card_fields_sync(self, file=None, file_type=None, lang='EN'):
+        """
+        see :meth:`sixe_idp.api.Client.extraction_card_fields_sync`
+        """
+        data = build_card_fields_data(file=file, file_type=file_type, lang=lang)
+        return await self._request_form(self.extraction_card_fields_url, data, {"file": file})
+
+    async def split_and_extraction_async_create(self, file=None, group_id=None, lang='EN', hitl=None,
+                                                extract_mode=None):
+        """
+        see :meth:`sixe_idp.api.Client.split_and_extraction_async_create`
+        """
+        data = build_split_and_extraction_create_data(file=file, group_id=group_id, lang=lang, hitl=hitl,
+                                                      extract_mode=extract_mode)
+        return Task(await self._request_form(self.split_and_extraction_async_create_url, data, {"file": file}))
+
+    async def split_and_extraction_status(self, application_id=None):
+        """
+        see :meth:`sixe_idp.api.Client.split_and_extraction_status`
+        """
+        data = build_application_data(application_id, name='application_id')
+        return await self._request_json('POST', self.split_and_extraction_async_status_url, json=data)
+
+    async def split_and_extraction_export(self, application_id=None):
+        """
+        see :meth:`sixe_idp.api.Client.split_and_extraction_export`
+        """
+        data = build_application_data(application_id, name='application_id')
+        ok, body = await self._request('POST', self.split_and_extraction_async_export_url, json=data)
+        return check_export(ok, body)
@@ -1,9 +1,27 @@
 import hashlib
 import hmac
+import os
+import json
+import threading
 import time
+import weakref
 from enum import Enum
+from types import MappingProxyType
 
 import requests
+import requests.adapters
+
+from .hooks import AFTER_RESPONSE, BEFORE_REQUEST, ON_ERROR, ON_RETRY, ON_TOKEN_REFRESH, Hooks, RequestEvent
+from .multipart import MultipartEncoder
+from .results import ExtractionResult, Result, loads
+from .retry import RetryPolicy, is_transient_error, was_not_sent
+
+# default (connect, read) timeouts in seconds of the api calls, the read timeout bounds each wait for data
+DEFAULT_TIMEOUT = (10, 120)
+
+
+# statuses after which the result of a task no longer changes
+TERMINAL_STATUSES = frozenset({'Done', 'Fail', 'Invalid'})
 
 
 class ExtractMode(Enum):
@@ -29,66 +47,435 @@ def build_sha256_str(clientId, clientSecret, timestamp):
     return sha256_hash
 
 
+# size of the chunks read from the file objects being signed
+HMAC_CHUNK_SIZE = 64 * 1024
+
+
+class HmacVerifier(object):
+    def __init__(self, secret, digestmod=hashlib.sha256):
+        """
+        HMAC of a callback payload computed incrementally over its parts, without joining them
+        :param secret: the secret to be used for hmac
+        :type secret: str or bytes
+
+            verifier = HmacVerifier(secret)
+            verifier.update(result_bytes)
+            verifier.update(open('/path/to/file.pdf', 'rb'))
+            verifier.verify(sig_header_signature)
+        """
+        if isinstance(secret, str):
+            secret = secret.encode('utf-8')
+        self._hmac = hmac.new(secret, digestmod=digestmod)
+
+    def update(self, part):
+        """
+        add a part of the payload to the hmac
+        :param part: str (utf-8 encoded), bytes, bytearray or memoryview, a binary file object read in chunks
+            from its current position, or an iterable of those, e.g. a generator of chunks. None is skipped.
+        """
+        if part is None:
+            return self
+        if isinstance(part, str):
+            self._hmac.update(part.encode('utf-8'))
+        elif isinstance(part, (bytes, bytearray, memoryview)):
+            self._hmac.update(part)
+        elif hasattr(part, 'readinto'):
+            buffer = bytearray(HMAC_CHUNK_SIZE)
+            view = memoryview(buffer)
+            while True:
+                n = part.readinto(buffer)
+                if not n:
+                    break
+                self._hmac.update(view[:n])
+        elif hasattr(part, 'read'):
+            while True:
+                chunk = part.read(HMAC_CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.update(chunk)
+        else:
+            for p in part:
+                self.update(p)
+        return self
+
+    def hexdigest(self):
+        return self._hmac.hexdigest()
+
+    def verify(self, sig_header_signature):
+        """
+        return whether the hmac of the payload is the given signature, compared in constant time
+        :param sig_header_signature: hex signature found in the callback headers
+        :type sig_header_signature: str or bytes
+        """
+        if isinstance(sig_header_signature, bytes):
+            try:
+                sig_header_signature = sig_header_signature.decode('ascii')
+            except UnicodeDecodeError:
+                return False
+        if not isinstance(sig_header_signature, str) or not sig_header_signature.isascii():
+            return False
+        return hmac.compare_digest(self.hexdigest(), sig_header_signature.strip().lower())
+
+
 def compute_hmac_sha256(key, message):
     """
     return the hmac_sha256 of the message with the given key and message
     param key: the key to be used for hmac
         :type key: str
-    param message: the message to be used for hmac
-        :type message: str
+    param message: the message to be used for hmac, anything accepted by HmacVerifier.update
+        :type message: str or bytes
     """
-    hasher = hmac.new(key.encode('utf-8'), message, hashlib.sha256)
-    hash_result = hasher.hexdigest()
-    return hash_result
+    return HmacVerifier(key).update(message).hexdigest()
 
 
 def verify_app_header(payload, sig_header_signature, secret):
     """
     return verify the signature of the payload and compare with the given one
-    param payload: the payload to be verified
+    param payload: the payload to be verified, str, bytes, a binary file object, or a list of those parts
+        which are signed one after the other without being joined
         :type payload: str
     param sig_header_signature: the signature to be compared with
         :type sig_header_signature: str
     param secret: the secret to be used for hmac
         :type secret: str
     """
-    expected_signature = None
     try:
-        expected_signature = compute_hmac_sha256(secret, payload.encode('utf-8'))
+        verifier = HmacVerifier(secret).update(payload)
     except Exception as e:
         raise IDPException("Unable to compute signature for payload", sig_header_signature)
-
-    if expected_signature != sig_header_signature:
-        return False
-        # raise IDPException("Signature found not match the expected signature for payload", sig_header_signature)
-    else:
-        return True
+    return verifier.verify(sig_header_signature)
 
 
 def verify_app_header_for_mode2(result_bytes, file_bytes, sig_header_signature, secret):
     """
     return verify the signature of the payload and compare with the given one for callback mode 2
-    param result_bytes
+    param result_bytes: the result part of the callback
+    param file_bytes: the pdf file, bytes or a binary file object, e.g. the spooled upload of the callback
     """
-    combined_array = result_bytes + file_bytes
-    mode2_verify = verify_app_header(combined_array, sig_header_signature, secret)
-    return mode2_verify
+    return verify_app_header([result_bytes, file_bytes], sig_header_signature, secret)
 
 
 def verify_app_header_for_mode3(result_bytes, file_bytes, result_in_excel_bytes, result_in_json_bytes,
                                 sig_header_signature, secret):
     """
-    return verify the signature of the payload and compare with the given one for callback mode 3
+    return verify the signature of the payload and compare with the given one for callback mode 3,
+    each part can be bytes or a binary file object
+    """
+    return verify_app_header([result_bytes, file_bytes, result_in_excel_bytes, result_in_json_bytes],
+                             sig_header_signature, secret)
+
+
+# Payload building and error handling shared by the sync Client and the sixe_idp.aio.AsyncClient
+
+def remove_none_values(data):
+    """
+    return a copy of the request data without the params which are not set
+    """
+    return {k: v for k, v in data.items() if v is not None}
+
+
+def check_response(ok, payload):
+    """
+    return the decoded json payload of a response, or raise the IDPException carried by a failed one
+    :param ok: whether the http status of the response is successful
+    :type ok: bool
+    :param payload: decoded json body of the response
+    :type payload: dict
+    """
+    if ok:
+        return payload
+    raise IDPException(payload['message'])
+
+
+def check_export(ok, content):
+    """
+    return the exported file content, or raise the IDPException carried by the json body of a failed export
+    """
+    if ok:
+        return content
+    raise IDPException(json.loads(content)['message'])
+
+
+def check_faas_export(content):
+    """
+    return the exported faas content, the faas export api answers errors with a json body and http 200
+    """
+    if b'errorCode' in content:
+        raise IDPException(content.decode('utf-8', errors='replace'))
+    return content
+
+
+def write_chunks(chunks, dest):
+    """
+    write an iterator of bytes chunks to dest, return the number of bytes written
+    :param dest: file path, or file object opened in binary mode
+    """
+    written = 0
+    if hasattr(dest, 'write'):
+        for chunk in chunks:
+            dest.write(chunk)
+            written += len(chunk)
+        return written
+    with open(dest, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def build_token_request_data(clientId, clientSecret):
+    """
+    json data of the oauth2 token api, signed with the current timestamp
+    """
+    current_timestamp = int(time.time() * 1000)
+    signature = build_sha256_str(clientId, clientSecret, current_timestamp)
+    return {
+        "clientId": clientId,
+        "timestamp": current_timestamp,
+        "signature": signature
+    }
+
+
+def parse_token_response(ok, payload):
+    """
+    return the authorization value of an oauth2 token response
+    """
+    if not ok:
+        raise IDPException(payload['message'])
+    if payload['data']['expired']:
+        raise IDPException(
+            "This IDP Authorization is expired, please re-send the request to get new IDP Authorization. " +
+            payload['message'])
+    return payload['data']['value']
+
+
+def build_extraction_create_data(file=None, file_type=None, fileTypeFrom=None, lang=None, customer=None,
+                                 customer_param=None, callback=None, auto_callback=None, callback_mode=None,
+                                 hitl=None, extractMode=None, includingFieldCodes=None, autoChecks=None,
+                                 remark=None):
+    """
+    form data of :meth:`Client.extraction_async_create`
+    """
+    if file is None:
+        raise IDPException("File is required")
+    if file_type is None:
+        raise IDPException("file_type is required")
+    return remove_none_values({'fileType': file_type, 'lang': lang, 'customer': customer,
+                               'customerParam': customer_param, 'callback': callback,
+                               'autoCallback': auto_callback, 'callbackMode': callback_mode,
+                               'hitl': hitl, 'ExtractMode': extractMode, 'includingFieldCodes': includingFieldCodes,
+                               'autoChecks': autoChecks, 'fileTypeFrom': fileTypeFrom, 'remark': remark
+                               })
+
+
+def build_task_history_params(page=None, limit=None, sortColumn=None, sortOrder=None, status=None,
+                              fileTypeCode=None, source=None, edited=None, hitl=None, fileName=None,
+                              startCreateTime=None, endCreateTime=None):
+    """
+    query params of :meth:`Client.extraction_task_history`
+    """
+    if page is None:
+        raise IDPException("page is required")
+    if limit is None:
+        raise IDPException("limit is required")
+    return remove_none_values({'page': page,
+                               'limit': limit,
+                               'sortColumn': sortColumn,
+                               'sortOrder': sortOrder,
+                               'status': status,
+                               'fileTypeCode': fileTypeCode,
+                               'source': source,
+                               'edited': edited,
+                               'hitl': hitl,
+                               'fileName': fileName,
+                               'startCreateTime': startCreateTime,
+                               'endCreateTime': endCreateTime})
+
+
+def build_add_hitl_data(applicationId=None, callback=None, autoCallback=None, callbackMode=None):
+    """
+    json data of :meth:`Client.extraction_task_add_hitl`
+    """
+    if applicationId is None:
+        raise IDPException('applicationId is required')
+    return remove_none_values({'applicationId': applicationId,
+                               'callback': callback,
+                               'autoCallback': autoCallback,
+                               'callbackMode': callbackMode})
+
+
+def build_faas_create_data(files=None, customerType=None, countryId=None, regionId=None, informationType=None,
+                           cifNumber=None, borrowerName=None, loanAmount=None, applicationNumber=None,
+                           applicationDate=None, currency=None, rateDateType=None, rateFrom=None, rateDate=None,
+                           automatic=True, hitlType=0, industryType=None, industryBiCode=None, ebitdaRatio=None,
+                           relatedParties=None, supplierBuyer=None, checkAccountStr=None, callbackUrl=None,
+                           autoCallback=True, callbackMode=0):
+    """
+    form data of :meth:`Client.extraction_faas_create`
+    """
+    if files is None:
+        raise IDPException("Files are required")
+    return remove_none_values({"customerType": customerType,
+                               "countryld": countryId,
+                               "regionld": regionId,
+                               "informationType": informationType,
+                               "cifNumber": cifNumber,
+                               "borrowerName": borrowerName,
+                               "loanAmount": loanAmount,
+                               "applicationNumber": applicationNumber,
+                               "applicationDate": applicationDate,
+                               "currency": currency,
+                               "rateDateType": rateDateType,
+                               "rateFrom": rateFrom,
+                               "rateDate": rateDate,
+                               "automatic": automatic,
+                               "hitlType": hitlType,
+                               "industryType": industryType,
+                               "industryBiCode": industryBiCode,
+                               "ebitdaRatio": ebitdaRatio,
+                               "relatedParties": relatedParties,
+                               "supplierBuyer": supplierBuyer,
+                               "checkAccountStr": checkAccountStr,
+                               "callbackUrl": callbackUrl,
+                               "autoCallback": autoCallback,
+                               "callbackMode": callbackMode
+                               })
+
+
+def build_doc_agent_create_data(flowCode=None, file=None, callback=None, autoCallback=None, callbackMode=None,
+                                callbackQaCodes=None, fileDocTypeList=None):
+    """
+    form data of :meth:`Client.extraction_doc_agent_create`
+    """
+    if file is None:
+        raise IDPException("File is required")
+    if flowCode is None:
+        raise IDPException("flowCode is required")
+    return remove_none_values({
+        "flowCode": flowCode,
+        "callback": callback,
+        "autoCallback": autoCallback,
+        "callbackMode": callbackMode,
+        "callbackQaCodes": callbackQaCodes,
+        "fileDocTypeList": fileDocTypeList if fileDocTypeList is not None else [],
+    })
+
+
+def build_doc_agent_export_data(applicationId=None, task_codes=None):
+    """
+    json data of :meth:`Client.extraction_doc_agent_export`
+    """
+    if applicationId is None:
+        raise IDPException("applicationId is required")
+    return remove_none_values({"applicationId": applicationId,
+                               "taskCodes": task_codes})
+
+
+def build_card_fields_data(file=None, file_type=None, lang='EN'):
+    """
+    form data of :meth:`Client.extraction_card_fields_sync`
+    """
+    if file is None:
+        raise IDPException("File is required")
+    if file_type is None:
+        raise IDPException("file_type is required")
+    return remove_none_values({'fileType': file_type, 'lang': lang})
+
+
+def build_split_and_extraction_create_data(file=None, group_id=None, lang='EN', hitl=None, extract_mode=None):
+    """
+    form data of :meth:`Client.split_and_extraction_async_create`
+    """
+    if file is None:
+        raise IDPException("File is required")
+    if group_id is None:
+        raise IDPException("group_id is required")
+    return remove_none_values({
+        'lang': lang,
+        'hitl': hitl,
+        'extractMode': extract_mode,
+        'groupId': group_id
+    })
+
+
+def build_application_data(application_id=None, name='applicationId'):
+    """
+    json data of the status/result/export apis, which only take the application id
     """
-    combined_array = result_bytes + file_bytes + result_in_excel_bytes + result_in_json_bytes
-    mode3_verify = verify_app_header(combined_array, sig_header_signature, secret)
-    return mode3_verify
+    if application_id is None:
+        raise IDPException(f"{name} is required")
+    return {"applicationId": application_id}
+
+
+class HttpTransport(object):
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False, keep_alive=True,
+                 timeout=DEFAULT_TIMEOUT):
+        """
+        Initializes a pooled keep-alive HTTP transport, which can be shared by
+        :class:`OauthClient <OauthClient>` and one or more :class:`Client <Client>` objects
+        :param pool_connections: number of per-host connection pools to keep, one per IDP/oauth host
+        :type pool_connections: int
+        :param pool_maxsize: maximum number of connections kept open for a single host
+        :type pool_maxsize: int
+        :param pool_block: if True, a request waits for a free connection when pool_maxsize connections
+            to the host are busy, otherwise an extra connection is opened and dropped after use
+        :type pool_block: bool
+        :param keep_alive: if False, every request asks the server to close the connection
+        :type keep_alive: bool
+        :param timeout: default requests timeout of the calls, a (connect, read) tuple or a number of seconds,
+            None means waiting forever
+        :returns: :class:`HttpTransport <HttpTransport>` object
+
+        The connection pools are thread-safe and shared by all threads, while every thread gets its own
+        requests session on top of them, so one transport can be used by many worker threads at once.
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections,
+                                                     pool_maxsize=pool_maxsize,
+                                                     pool_block=pool_block)
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        """
+        requests session of the calling thread, mounted on the shared connection pools
+        """
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', self.adapter)
+            session.mount('http://', self.adapter)
+            if not self.keep_alive:
+                session.headers['Connection'] = 'close'
+            self._local.session = session
+        return session
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        """
+        Closes all the pooled connections, the transport can still be used afterwards
+        """
+        self.adapter.close()
 
 
 class OauthClient(object):
     def __init__(self, oauth_type='oauth2', oauth_authorization_url=None,
                  oauth2_authorization_url='https://oauth-sea.6estates.com/api/token', client_id=None,
-                 client_secret=None, authorization=None):
+                 client_secret=None, authorization=None, transport: HttpTransport = None, auto_refresh=False,
+                 refresh_interval=90 * 60, refresh_ahead=5 * 60):
         """
         Initializes the Oauth Client
         :returns: :class:`OauthClient <OauthClient>`
@@ -102,6 +489,12 @@ class OauthClient(object):
         : For possible network change, you need to input the full host name for oauth_authorization_url or oauth2_authorization_url,
         Like https://oauth-sea.6estates.com/api/token for oauth2
         https://oauth-sea.6estates.com/oauth/token?grant_type=client_bind for oauth
+        :param transport: :class:`HttpTransport <HttpTransport>` used to talk to the oauth server,
+            a new pooled transport is created if not given
+        :param auto_refresh: refresh the token from a background daemon thread, refresh_ahead seconds before it is
+            refresh_interval seconds old, so that api calls never wait for the oauth server, off by default
+        :param refresh_interval: seconds after which the token is refreshed
+        :param refresh_ahead: seconds before refresh_interval at which the background refresh happens
         """
 
         self.oauth_type = oauth_type  # Can be oauth, oauth2, x_access_token
@@ -114,6 +507,10 @@ class OauthClient(object):
         self.client_secret = client_secret
         self.token_header = None
         self.last_authorization_time = None
+        self.transport = transport if transport is not None else HttpTransport()
+        self.refresh_interval = refresh_interval
+        self._refresh_lock = threading.Lock()
+        self._auto_refresh_stop = None
 
         if oauth_authorization_url is None and oauth2_authorization_url is None:
             raise IDPException("need at least one url to get authorization")
@@ -132,6 +529,8 @@ class OauthClient(object):
                 raise IDPException("client_id and client_secret are required for Oauth2Client")
         else:
             raise IDPException("oauth_type must be oauth2")
+        if auto_refresh:
+            self.start_auto_refresh(refresh_interval, refresh_ahead)
 
     # def get_IDP_authorization(self, authorization):
     #     """
@@ -164,32 +563,24 @@ class OauthClient(object):
         self.oauth_type = 'oauth2'
 
         headers = {"Content-Type": "application/json"}
-        current_timestamp = int(time.time() * 1000)
-        signature = build_sha256_str(self.client_id, self.client_secret, current_timestamp)
-        data = {
-            "clientId": clientId,
-            "timestamp": current_timestamp,
-            "signature": signature
-        }
-
-        r = requests.post(self.oauth2_authorization_url, headers=headers, json=data)
-        if r.ok:
-            if not r.json()['data']['expired']:
-                self.last_authorization_time = int(time.time() * 1000)
-                self.set_token_header(r.json()['data']['value'])
-            else:
-                raise IDPException(
-                    "This IDP Authorization is expired, please re-send the request to get new IDP Authorization. " +
-                    r.json()['message'])
-        else:
-            raise IDPException(r.json()['message'])
+        data = build_token_request_data(self.client_id, self.client_secret)
+
+        r = self.transport.post(self.oauth2_authorization_url, headers=headers, json=data)
+        authorization_value = parse_token_response(r.ok, r.json())
+        # the header is swapped before the time, so that a fresh time never comes with a stale header
+        self.set_token_header(authorization_value)
+        self.last_authorization_time = int(time.time() * 1000)
 
     def set_token_header(self, server_authorization_value):
-        self.token_header = {
+        # read-only snapshot, a request keeps using the header it read even if the token is refreshed meanwhile
+        self.token_header = MappingProxyType({
             "Authorization": server_authorization_value,
             # "Content-Type": "application/json",
             # "accept": "*/*"
-        }
+        })
+
+    def _token_age_exceeds(self, refresh_interval):
+        return int(time.time() * 1000) - self.last_authorization_time > refresh_interval * 1000
 
     def refresh_oauth(self, refresh_interval=90 * 60):
         """
@@ -200,30 +591,78 @@ class OauthClient(object):
             raise IDPException('oauth client needs to be initialized and created successfully before refresh_oauth')
         if refresh_interval == 0:
             pass
-        elif int(time.time() * 1000) - self.last_authorization_time > refresh_interval * 1000:
-            # if self.oauth_type == 'oauth':
-            #     self.get_IDP_authorization(self.authorization)
-            # elif self.oauth_type == 'oauth2':
-            if self.oauth_type == 'oauth2':
-                self.get_IDP_new_authorization(self.client_id, self.client_secret)
-            else:
-                raise IDPConfigurationException(
-                    'oauth client needs to be initialized and created successfully before refresh_oauth')
+        elif self._token_age_exceeds(refresh_interval):
+            # single flight: concurrent callers wait for one refresh instead of all calling the oauth server
+            with self._refresh_lock:
+                if not self._token_age_exceeds(refresh_interval):
+                    return
+                # if self.oauth_type == 'oauth':
+                #     self.get_IDP_authorization(self.authorization)
+                # elif self.oauth_type == 'oauth2':
+                if self.oauth_type == 'oauth2':
+                    self.get_IDP_new_authorization(self.client_id, self.client_secret)
+                else:
+                    raise IDPConfigurationException(
+                        'oauth client needs to be initialized and created successfully before refresh_oauth')
         else:
             pass
 
+    def start_auto_refresh(self, refresh_interval=90 * 60, refresh_ahead=5 * 60):
+        """
+        Refresh the token from a daemon thread refresh_ahead seconds before it is refresh_interval seconds old.
+        The thread stops with stop_auto_refresh(), or when the OauthClient is garbage collected.
+        """
+        if self.last_authorization_time is None:
+            raise IDPException('oauth client needs to be initialized and created successfully before auto refresh')
+        self.stop_auto_refresh()
+        self.refresh_interval = refresh_interval
+        self._auto_refresh_stop = threading.Event()
+        thread = threading.Thread(target=_auto_refresh_loop, name='sixe-idp-token-refresh', daemon=True,
+                                  args=(weakref.ref(self), self._auto_refresh_stop,
+                                        max(refresh_interval - refresh_ahead, 1)))
+        thread.start()
+        return self
+
+    def stop_auto_refresh(self):
+        if self._auto_refresh_stop is not None:
+            self._auto_refresh_stop.set()
+            self._auto_refresh_stop = None
 
-class Client(object):
-    def __init__(self, http_host, oauth_client: OauthClient):
+
+def _auto_refresh_loop(oauth_client_ref, stop, refresh_after):
+    """
+    body of the OauthClient background refresh thread, it only holds a weak reference to the OauthClient
+    """
+    retry_delay = 1
+    while True:
+        oauth_client = oauth_client_ref()
+        if oauth_client is None:
+            return
+        delay = oauth_client.last_authorization_time / 1000 + refresh_after - time.time()
+        del oauth_client
+        # wake up at least every minute to notice a garbage collected OauthClient
+        if delay > 0 and stop.wait(min(delay, 60)):
+            return
+        oauth_client = oauth_client_ref()
+        if oauth_client is None or stop.is_set():
+            return
+        try:
+            oauth_client.refresh_oauth(refresh_after)
+            retry_delay = 1
+        except Exception:
+            # the token is still valid until refresh_interval, keep retrying in the background
+            if stop.wait(retry_delay):
+                return
+            retry_delay = min(retry_delay * 2, 60)
+
+
+class BaseClient(object):
+    def __init__(self, http_host):
         """
-        Initializes the IDP Client
+        Holds the api urls of an IDP host, shared by :class:`Client <Client>` and sixe_idp.aio.AsyncClient
         :param http_host: need full host url, e.g. https://idp-sea.6estates.com
-        :param oauth_client: OauthClient object
-        :returns: :class:`Client <Client>` object
         """
         self.http_host = http_host.rstrip('/')
-        self.oauth_client = oauth_client
-        self.headers = self.oauth_client.token_header
 
         self.extraction_async_create_url = f"{http_host}/customer/extraction/fields/async"
         self.extraction_result_url = f"{http_host}/customer/extraction/field/async/result"
@@ -245,15 +684,107 @@ class Client(object):
         self.split_and_extraction_async_status_url = f"{http_host}/customer/extraction/split/ext/status"
         self.split_and_extraction_async_export_url = f"{http_host}/customer/extraction/split/ext/download/zip"
 
+
+EXPORT_CHUNK_SIZE = 256 * 1024
+
+
+def _upload_name(file):
+    """
+    return the file name of an upload, a path, a file object or a requests style (filename, file) tuple, or None
+    """
+    if isinstance(file, (list, tuple)):
+        return file[0] if file else None
+    name = file if isinstance(file, (str, os.PathLike)) else getattr(file, 'name', None)
+    return os.path.basename(name) if isinstance(name, (str, os.PathLike)) else None
+
+
+def _iter_response_chunks(r, first, chunks):
+    """
+    yield the first chunk and the rest of a streamed response, then release its connection to the pool
+    """
+    try:
+        if first:
+            yield first
+        for chunk in chunks:
+            yield chunk
+    finally:
+        r.close()
+
+
+class Client(BaseClient):
+    def __init__(self, http_host, oauth_client: OauthClient, transport: HttpTransport = None,
+                 submission_cache=None, result_cache=None, rate_limiter=None, retry_policy=None, hooks=None,
+                 lazy_results=False):
+        """
+        Initializes the IDP Client
+        :param http_host: need full host url, e.g. https://idp-sea.6estates.com
+        :param oauth_client: OauthClient object
+        :param transport: :class:`HttpTransport <HttpTransport>` used for every api call,
+            the transport of the oauth_client is shared if not given
+        :param submission_cache: :class:`sixe_idp.cache.SubmissionCache`, files already submitted with the same
+            params then return the existing task instead of being uploaded again
+        :param result_cache: :class:`sixe_idp.cache.ResultCache`, the results of finished tasks are then fetched
+            only once by extraction_result and extraction_faas_result
+        :param rate_limiter: :class:`sixe_idp.ratelimit.RateLimiter` shaping the api calls of each endpoint family
+        :param retry_policy: :class:`sixe_idp.retry.RetryPolicy` of the api calls, by default the read-only calls
+            are retried up to 4 times within 5 minutes, RetryPolicy(max_attempts=1) turns retries off
+        :param hooks: :class:`sixe_idp.hooks.Hooks` called on the lifecycle events of the api calls,
+            an empty registry by default, see client.hooks.register
+        :param lazy_results: extraction_result and extraction_faas_result return
+            :class:`sixe_idp.results.ExtractionResult` and :class:`sixe_idp.results.Result` objects, read-only
+            mappings decoded on first access to their content, instead of dicts
+        :type lazy_results: bool
+        :returns: :class:`Client <Client>` object
+        """
+        super().__init__(http_host)
+        self.oauth_client = oauth_client
+        self.transport = transport if transport is not None else oauth_client.transport
+        self.submission_cache = submission_cache
+        self.result_cache = result_cache
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.hooks = hooks if hooks is not None else Hooks()
+        self.lazy_results = lazy_results
+        # api url -> endpoint name reported to the hooks, e.g. extraction_result
+        self._endpoints = {url: name[:-len('_url')] for name, url in vars(self).items() if name.endswith('_url')}
+        # task family -> sixe_idp.polling.PollBackoff, tuned by the tasks waited on
+        self.poll_backoffs = {}
+        # (headers, token header they replace) assigned to client.headers
+        self._assigned_headers = None
+
     def refresh_token(self, refresh_interval=90 * 60):
         """
         refresh_interval: seconds to last refresh oauth token
         Refreshes the oauth client token, if
         """
+        if not self.hooks:
+            self.oauth_client.refresh_oauth(refresh_interval)
+            return self
+        last_authorization_time = self.oauth_client.last_authorization_time
+        started = time.perf_counter()
         self.oauth_client.refresh_oauth(refresh_interval)
-        self.headers = self.oauth_client.token_header
+        if self.oauth_client.last_authorization_time != last_authorization_time:
+            self.hooks.emit(ON_TOKEN_REFRESH, RequestEvent(
+                'oauth_token', method='POST', url=self.oauth_client.oauth2_authorization_url,
+                timings={'token': time.perf_counter() - started}))
         return self
 
+    @property
+    def headers(self):
+        """
+        read-only snapshot of the current authorization header, or the headers assigned to client.headers
+        until the token is refreshed
+        """
+        token_header = self.oauth_client.token_header
+        assigned = self._assigned_headers
+        if assigned is not None and assigned[1] is token_header:
+            return assigned[0]
+        return token_header
+
+    @headers.setter
+    def headers(self, headers):
+        self._assigned_headers = (headers, self.oauth_client.token_header)
+
     def extraction_async_create(self, file=None, file_type=None, fileTypeFrom=None,
                                 lang=None,
                                 customer=None, customer_param=None, callback=None,
@@ -261,8 +792,9 @@ class Client(object):
                                 extractMode=None, includingFieldCodes=None,
                                 autoChecks=None, remark=None):
         """
-        :param file: Pdf/image file. Only one file is allowed to be uploaded each time
-        :type file: file
+        :param file: Pdf/image file. Only one file is allowed to be uploaded each time,
+            given as a path or a binary file object, it is streamed from disk while uploading
+        :type file: str or file
         :param file_type: The str of the file type (e.g., CBKS), this could be CBKS,CINV those publick file type and can also be self-defined file type if fileTypeFrom is set to be 2
         :type file_type: str
         :param lang: English: EN, Default is EN
@@ -293,30 +825,12 @@ class Client(object):
         :param fileTypeFrom: 1 means ordinary using system defined file type, 2 means using user defined file type, 1 as default
         :param remark:
         """
-        if file is None:
-            raise IDPException("File is required")
-        if file_type is None:
-            raise IDPException("file_type is required")
-
-        files = {"file": file}
-        data = {'fileType': file_type, 'lang': lang, 'customer': customer,
-                'customerParam': customer_param, 'callback': callback,
-                'autoCallback': auto_callback, 'callbackMode': callback_mode,
-                'hitl': hitl, 'ExtractMode': extractMode, 'includingFieldCodes': includingFieldCodes,
-                'autoChecks': autoChecks, 'fileTypeFrom': fileTypeFrom, 'remark': remark
-                }
-        trash_bin = []
-        for key in data:
-            if data[key] is None:
-                trash_bin.append(key)
-        for key in trash_bin:
-            del data[key]
-        self.refresh_token()
-        r = requests.post(self.extraction_async_create_url, headers=self.headers,
-                          files=files, data=data)
-        if r.ok:
-            return Task(r.json())
-        raise IDPException(r.json()['message'])
+        data = build_extraction_create_data(file=file, file_type=file_type, fileTypeFrom=fileTypeFrom, lang=lang,
+                                            customer=customer, customer_param=customer_param, callback=callback,
+                                            auto_callback=auto_callback, callback_mode=callback_mode, hitl=hitl,
+                                            extractMode=extractMode, includingFieldCodes=includingFieldCodes,
+                                            autoChecks=autoChecks, remark=remark)
+        return self._create('extraction_async_create', self.extraction_async_create_url, data, {"file": file})
 
     def extraction_result(self, application_id=None):
         """
@@ -327,17 +841,19 @@ class Client(object):
         :rtype: :class:`TaskResult <TaskResult>`
 
         """
-        if application_id is None:
-            raise IDPException("applicationId is required")
-        self.refresh_token()
-        data = {"applicationId": application_id}
-        r = requests.post(self.extraction_result_url,
-                          headers=self.headers,
-                          json=data)
+        data = build_application_data(application_id)
+        result_class = ExtractionResult if self.lazy_results else None
+        cache = self.result_cache
+        if cache is not None:
+            result = cache.get('extraction', application_id)
+            if result is not None:
+                return self._wrap_result(result, result_class)
+        r = self._request('status', 'POST', self.extraction_result_url, json=data)
         # r = requests.get(self.extraction_result_url + str(task_id), headers=self.headers)
-        if r.ok:
-            return r.json()
-        raise IDPException(r.json()['message'])
+        result = check_response(r.ok, self._decode(r, result_class))
+        if cache is not None and cache.is_terminal('extraction', application_id, result):
+            cache.put('extraction', application_id, result)
+        return result
 
     def extraction_task_history(self, page=None, limit=None, sortColumn=None, sortOrder=None, status=None,
                                 fileTypeCode=None,
@@ -360,35 +876,33 @@ class Client(object):
         startCreateTime	Filter task list by task created time range start, format is "yyyy-MM-dd", will append "00:00:00.000" automatic.	query	optional	Integer
         endCreateTime	Filter task list by task created time range end, format is "yyyy-MM-dd", will append "23:59:59.999" automatic.	query	optional	Integer
         """
-        if page is None:
-            raise IDPException("page is required")
-        if limit is None:
-            raise IDPException("limit is required")
-        data = {'page': page,
-                'limit': limit,
-                'sortColumn': sortColumn,
-                'sortOrder': sortOrder,
-                'status': status,
-                'fileTypeCode': fileTypeCode,
-                'source': source,
-                'edited': edited,
-                'hitl': hitl,
-                'fileName': fileName,
-                'startCreateTime': startCreateTime,
-                'endCreateTime': endCreateTime}
-        trash_bin = []
-        for key in data:
-            if data[key] is None:
-                trash_bin.append(key)
-        for key in trash_bin:
-            del data[key]
-        # print(data)
-        self.refresh_token()
-        r = requests.get(self.extraction_task_history_url, headers=self.headers, params=data)
-        if r.ok:
-            return r.json()
-        else:
-            raise IDPException(r.json()['message'])
+        data = build_task_history_params(page=page, limit=limit, sortColumn=sortColumn, sortOrder=sortOrder,
+                                         status=status, fileTypeCode=fileTypeCode, source=source, edited=edited,
+                                         hitl=hitl, fileName=fileName, startCreateTime=startCreateTime,
+                                         endCreateTime=endCreateTime)
+        r = self._request('history', 'GET', self.extraction_task_history_url, params=data)
+        return check_response(r.ok, self._decode(r))
+
+    def extraction_task_history_iter(self, limit=100, prefetch=4, max_pages=None, sortColumn=None, sortOrder=None,
+                                     status=None, fileTypeCode=None, source=None, edited=None, hitl=None,
+                                     fileName=None, startCreateTime=None, endCreateTime=None):
+        """
+        Iterate over all the history tasks matching the filters, the pages are fetched concurrently,
+        up to prefetch of them ahead, and the tasks are yielded in the order of the pages
+        :param limit: tasks per page
+        :type limit: int
+        :param prefetch: number of pages fetched at once
+        :type prefetch: int
+        :param max_pages: stop after this many pages, None means until the last page
+
+        The filters are the same as extraction_task_history.
+        """
+        from .history import iter_task_history
+
+        return iter_task_history(self, limit=limit, prefetch=prefetch, max_pages=max_pages, sortColumn=sortColumn,
+                                 sortOrder=sortOrder, status=status, fileTypeCode=fileTypeCode, source=source,
+                                 edited=edited, hitl=hitl, fileName=fileName, startCreateTime=startCreateTime,
+                                 endCreateTime=endCreateTime)
 
     def extraction_task_add_hitl(self, applicationId, callback=None, autoCallback=None, callbackMode=None):
         """
@@ -401,25 +915,14 @@ class Client(object):
         mode 2: callback request contains task status, extracted fields results and pdf file.
         mode 3: callback request contains task status, extracted fields results,pdf file,export Excel file, export json file.	RequestBody	Optional	Integer
         """
-        if applicationId is None:
-            raise IDPException('applicationId is required')
-
-        data = {'applicationId': applicationId,
-                'callback': callback,
-                'autoCallback': autoCallback,
-                'callbackMode': callbackMode}
-        trash_bin = []
-        for key in data:
-            if data[key] is None:
-                trash_bin.append(key)
-        for key in trash_bin:
-            del data[key]
-        # print(data)
-        self.refresh_token()
-        r = requests.post(self.extraction_task_add_hitl_url, headers=self.headers, json=data)
-        if r.ok:
-            return r.json()
-        raise IDPException(r.json()['message'])
+        data = build_add_hitl_data(applicationId=applicationId, callback=callback, autoCallback=autoCallback,
+                                   callbackMode=callbackMode)
+        r = self._request('create', 'POST', self.extraction_task_add_hitl_url, json=data)
+        result = check_response(r.ok, self._decode(r))
+        if self.result_cache is not None:
+            # the result changes once the task is reviewed
+            self.result_cache.discard('extraction', applicationId)
+        return result
 
     def extraction_faas_create(self, files,
                                customerType: int,
@@ -449,6 +952,7 @@ class Client(object):
         """
         Args:
             files (files): Support PDF/IMG/Zip file. Please make sure only pdf/image file in zip file.
+                Like {"files": ("test.zip", file)}, where file is a path or a binary file object streamed from disk.
             customerType (str): Customer type: 1 means Individual/Retail or Consumer Loan, 2 means Company/Business or Productive Loan.
             countryId (str, optional): Id of country. Defaults to None.
             regionId (str, optional): Id of region. Defaults to None.
@@ -476,46 +980,17 @@ class Client(object):
 
             For those params are not clearly defined, please refer to the API documentation. https://idp-sea.6estates.com/document
         """
-        if files is None:
-            raise IDPException("Files are required")
-
-        data = {"customerType": customerType,
-                "countryld": countryId,
-                "regionld": regionId,
-                "informationType": informationType,
-                "cifNumber": cifNumber,
-                "borrowerName": borrowerName,
-                "loanAmount": loanAmount,
-                "applicationNumber": applicationNumber,
-                "applicationDate": applicationDate,
-                "currency": currency,
-                "rateDateType": rateDateType,
-                "rateFrom": rateFrom,
-                "rateDate": rateDate,
-                "automatic": automatic,
-                "hitlType": hitlType,
-                "industryType": industryType,
-                "industryBiCode": industryBiCode,
-                "ebitdaRatio": ebitdaRatio,
-                "relatedParties": relatedParties,
-                "supplierBuyer": supplierBuyer,
-                "checkAccountStr": checkAccountStr,
-                "callbackUrl": callbackUrl,
-                "autoCallback": autoCallback,
-                "callbackMode": callbackMode
-                }
-        trash_bin = []
-        for key in data:
-            if data[key] is None:
-                trash_bin.append(key)
-        for key in trash_bin:
-            del data[key]
-        # print(data)
-        self.refresh_token()
-        r = requests.post(self.extraction_faas_create_url, headers=self.headers, files=files, data=data)
-        if r.ok:
-            return Task(r.json())
-        raise IDPException(r.json()['message'])
+        data = build_faas_create_data(files=files, customerType=customerType, countryId=countryId,
+                                      regionId=regionId, informationType=informationType, cifNumber=cifNumber,
+                                      borrowerName=borrowerName, loanAmount=loanAmount,
+                                      applicationNumber=applicationNumber, applicationDate=applicationDate,
+                                      currency=currency, rateDateType=rateDateType, rateFrom=rateFrom,
+                                      rateDate=rateDate, automatic=automatic, hitlType=hitlType,
+                                      industryType=industryType, industryBiCode=industryBiCode,
+                                      ebitdaRatio=ebitdaRatio, relatedParties=relatedParties,
+                                      supplierBuyer=supplierBuyer, checkAccountStr=checkAccountStr,
+                                      callbackUrl=callbackUrl, autoCallback=autoCallback, callbackMode=callbackMode)
+        return self._create('extraction_faas_create', self.extraction_faas_create_url, data, files)
 
     def extraction_faas_status(self, application_id=None):
         """
@@ -526,18 +1001,13 @@ class Client(object):
         :rtype: :class:`TaskResult <TaskResult>`
 
         """
-        if application_id is None:
-            raise IDPException("applicationId is required")
-        self.refresh_token()
+        data = build_application_data(application_id)
         # r = requests.get(self.extraction_faas_status_url + str(task_id), headers=self.headers)
-        data = {"applicationId": application_id}
-        r = requests.post(self.extraction_faas_status_url,
-                          headers=self.headers,
-                          json=data)
-        if r.ok:
-            return r.json()['data']['analysisStatus']
-        else:
-            raise IDPException(r.json()['message'])
+        r = self._request('status', 'POST', self.extraction_faas_status_url, json=data)
+        status = check_response(r.ok, self._decode(r))['data']['analysisStatus']
+        if self.result_cache is not None and status in TERMINAL_STATUSES:
+            self.result_cache.mark_terminal('faas', application_id)
+        return status
 
     def extraction_faas_result(self, application_id=None):
         """
@@ -548,15 +1018,19 @@ class Client(object):
         :rtype: :class:`TaskResult <TaskResult>`
 
         """
-        if application_id is None:
-            raise IDPException("applicationId is required")
-        self.refresh_token()
+        data = build_application_data(application_id)
+        result_class = Result if self.lazy_results else None
+        cache = self.result_cache
+        if cache is not None:
+            result = cache.get('faas', application_id)
+            if result is not None:
+                return self._wrap_result(result, result_class)
         # r = requests.get(self.extraction_faas_result_url + str(task_id), headers=self.headers)
-        data = {"applicationId": application_id}
-        r = requests.post(self.extraction_faas_result_url,
-                          headers=self.headers,
-                          json=data)
-        return r.json()
+        r = self._request('status', 'POST', self.extraction_faas_result_url, json=data)
+        result = self._decode(r, result_class)
+        if cache is not None and r.ok and cache.is_terminal('faas', application_id, result):
+            cache.put('faas', application_id, result)
+        return result
         # return FaasTaskResult(r.json())
 
     def extraction_faas_export(self, application_id=None):
@@ -568,19 +1042,50 @@ class Client(object):
         :rtype: :class:`TaskResult <TaskResult>`
 
         """
-        if application_id is None:
-            raise IDPException("applicationId is required")
-        self.refresh_token()
+        data = build_application_data(application_id)
         # r = requests.get(self.extraction_faas_export_url + str(task_id), headers=self.headers)
         # you might need to read the r.content as a result zip file
-        data = {"applicationId": application_id}
-        r = requests.post(self.extraction_faas_export_url,
-                          headers=self.headers,
-                          json=data)
-        if 'errorCode' in r.text:
-            raise IDPException(r.text)
-        else:
-            return r.content
+        r = self._request('export', 'POST', self.extraction_faas_export_url, json=data)
+        return check_faas_export(r.content)
+
+    def extraction_faas_export_stream(self, application_id=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        Stream the exported faas result, with constant memory whatever the size of the file.
+        :param application_id: application_id
+        :type application_id: str
+        :param chunk_size: size of the chunks read from the network
+        :type chunk_size: int
+        :returns: iterator of bytes chunks of the xlsx/zip file, an IDPException is raised by this call
+            if the export failed
+        """
+        data = build_application_data(application_id)
+        return self._export_stream(self.extraction_faas_export_url, data, chunk_size)
+
+    def extraction_faas_export_to_file(self, application_id=None, dest=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        Download the exported faas result straight to disk.
+        :param application_id: application_id
+        :type application_id: str
+        :param dest: file path, or file object opened in binary mode, it is only created once the export succeeded
+        :param chunk_size: size of the chunks read from the network
+        :type chunk_size: int
+        :returns: number of bytes written
+        :rtype: int
+        """
+        if dest is None:
+            raise IDPException("dest is required")
+        return write_chunks(self.extraction_faas_export_stream(application_id, chunk_size), dest)
+
+    def extraction_faas_export_members(self, application_id=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        Iterate over the members of the exported faas zip file as they download, see
+        split_and_extraction_export_members.
+        :param application_id: application_id
+        :type application_id: str
+        :returns: iterator of :class:`sixe_idp.zipstream.ZipMember`
+        """
+        from .zipstream import iter_zip
+        return iter_zip(self.extraction_faas_export_stream(application_id, chunk_size))
 
     def extraction_doc_agent_create(self, flowCode: int,
                                     file,
@@ -588,11 +1093,12 @@ class Client(object):
                                     autoCallback: bool = None,
                                     callbackMode: int = None,
                                     callbackQaCodes: str = None,
-                                    fileDocTypeList: list = []):
+                                    fileDocTypeList: list = None):
         """
         Args:
             flowCode (int): The code of task flow, please contact 6E admin to obtain the task flow code.
             file (str): Support PDF/IMG/Zip file. Please make sure only pdf/image file in zip file.
+                    A path or a binary file object, it is streamed from disk while uploading.
             callback (str, optional): A http(s) link for callback after completing the task.
                     If you need to use the callback parameter, please communicate with us if your callback system needs any authentication mechanism.
             autoCallback (bool, optional): Callback request will request automatic if autoCallback is true, otherwise, the user needs to manually trigger the callback.
@@ -605,75 +1111,61 @@ class Client(object):
 
             For those params are not clearly defined, please refer to the API documentation. https://idp-sea.6estates.com/document
         """
-        if file is None:
-            raise IDPException("File is required")
-        if flowCode is None:
-            raise IDPException("flowCode is required")
-        data = {
-            "flowCode": flowCode,
-            "callback": callback,
-            "autoCallback": autoCallback,
-            "callbackMode": callbackMode,
-            "callbackQaCodes": callbackQaCodes,
-            "fileDocTypeList": fileDocTypeList,
-        }
-        files = {"file": file}
-        trash_bin = []
-        for key in data:
-            if data[key] is None:
-                trash_bin.append(key)
-        for key in trash_bin:
-            del data[key]
-        # print(data)
-        self.refresh_token()
-        r = requests.post(self.extraction_doc_agent_create_url, headers=self.headers, files=files, data=data)
-        if r.ok:
-            return Task(r.json())
-        raise IDPException(r.json()['message'])
+        data = build_doc_agent_create_data(flowCode=flowCode, file=file, callback=callback,
+                                           autoCallback=autoCallback, callbackMode=callbackMode,
+                                           callbackQaCodes=callbackQaCodes, fileDocTypeList=fileDocTypeList)
+        r = self._post_multipart(self.extraction_doc_agent_create_url, data, {"file": file})
+        return Task(check_response(r.ok, self._decode(r)))
 
     def extraction_doc_agent_status(self, applicationId):
         """
             Get the status of a task.
         """
-        if applicationId is None:
-            raise IDPException("applicationId is required")
-        # self.refresh_token()
         # r = requests.post(self.extraction_doc_agent_status_url + applicationId, headers=self.headers)
-        data = {"applicationId": applicationId}
-        self.refresh_token()
-        r = requests.post(self.extraction_doc_agent_status_url,
-                          headers=self.headers,
-                          json=data)
-        if r.ok:
-            return r.json()
-        else:
-            raise IDPException(r.json()['message'])
+        data = build_application_data(applicationId)
+        r = self._request('status', 'POST', self.extraction_doc_agent_status_url, json=data)
+        return check_response(r.ok, self._decode(r))
 
     def extraction_doc_agent_export(self, applicationId, task_codes=None):
         """
             Get the result of a task.
         """
-        if applicationId is None:
-            raise IDPException("applicationId is required")
-        data = {"applicationId": applicationId,
-                "taskCodes": task_codes}
-        # remove blank values
-        data = {k: v for k, v in data.items() if v is not None}
-        self.refresh_token()
+        data = build_doc_agent_export_data(applicationId=applicationId, task_codes=task_codes)
         # r = requests.post(self.extraction_doc_agent_export_url + applicationId, headers=self.headers)
-        r = requests.post(self.extraction_doc_agent_export_url,
-                          headers=self.headers,
-                          json=data)
-        if r.ok:
-            return r.content
-        else:
-            raise IDPException(r.json()['message'])
+        r = self._request('export', 'POST', self.extraction_doc_agent_export_url, json=data)
+        return check_export(r.ok, r.content)
+
+    def extraction_doc_agent_export_stream(self, applicationId, task_codes=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+            Stream the result of a task, returns an iterator of bytes chunks, see extraction_faas_export_stream.
+        """
+        data = build_doc_agent_export_data(applicationId=applicationId, task_codes=task_codes)
+        return self._export_stream(self.extraction_doc_agent_export_url, data, chunk_size)
+
+    def extraction_doc_agent_export_to_file(self, applicationId, dest=None, task_codes=None,
+                                            chunk_size=EXPORT_CHUNK_SIZE):
+        """
+            Download the result of a task straight to dest, a path or a binary file object, see
+            extraction_faas_export_to_file.
+        """
+        if dest is None:
+            raise IDPException("dest is required")
+        return write_chunks(self.extraction_doc_agent_export_stream(applicationId, task_codes, chunk_size), dest)
+
+    def extraction_doc_agent_export_members(self, applicationId, task_codes=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+            Iterate over the members of the result zip file of a task as they download, see
+            split_and_extraction_export_members.
+        """
+        from .zipstream import iter_zip
+        return iter_zip(self.extraction_doc_agent_export_stream(applicationId, task_codes, chunk_size))
 
     def extraction_card_fields_sync(self, file=None, file_type=None, lang='EN'):
         """
         Synchronously extract fields from a card image or PDF file.
-        :param file: Pdf/image file. Only one file is allowed to be uploaded each time
-        :type file: file
+        :param file: Pdf/image file. Only one file is allowed to be uploaded each time,
+            given as a path or a binary file object, it is streamed from disk while uploading
+        :type file: str or file
         :param file_type: The code of the card file type (e.g., NPWP). Please see details of File Type Code
         :type file_type: str
         :param lang: Language, default is EN
@@ -681,34 +1173,18 @@ class Client(object):
         :return: JSON content of the extraction result
         :rtype: dict
         """
-        self.refresh_token()
-        if file is None:
-            raise IDPException("File is required")
-        if file_type is None:
-            raise IDPException("file_type is required")
-
-        files = {"file": file}
-        data = {'fileType': file_type, 'lang': lang}
-
-        # remove blank values
-        data = {k: v for k, v in data.items() if v is not None}
-
-        # self.refresh_token()
-        r = requests.post(self.extraction_card_fields_url,
-                          headers=self.headers,
-                          files=files,
-                          data=data)
-        if r.ok:
-            return r.json()
-        raise IDPException(r.json()['message'])
+        data = build_card_fields_data(file=file, file_type=file_type, lang=lang)
+        r = self._post_multipart(self.extraction_card_fields_url, data, {"file": file})
+        return check_response(r.ok, self._decode(r))
 
     def split_and_extraction_async_create(self, file=None, group_id=None, lang='EN', hitl=None, extract_mode=None):
         """
         Asynchronously submit file for split and fields extraction.
         The uploaded file will be split into one file per page, then each page will be identified and extracted.
 
-        :param file: Pdf file. Only one file is allowed to be uploaded each time
-        :type file: file
+        :param file: Pdf file. Only one file is allowed to be uploaded each time,
+            given as a path or a binary file object, it is streamed from disk while uploading
+        :type file: str or file
         :param group_id: File type group id
             1: "Invoice","Delivery Order","Purchase Order","Tanda Terima Receipt", "Faktur Pajak Tax Invoice"
             2: "Air Waybill","Bill of Lading","Invoice","Packing List","Formulir Pengajuan Dokumen Ekspor"
@@ -725,30 +1201,10 @@ class Client(object):
         :return: Task object containing task id
         :rtype: :class:`Task <Task>`
         """
-        if file is None:
-            raise IDPException("File is required")
-        if group_id is None:
-            raise IDPException("group_id is required")
-
-        files = {"file": file}
-        data = {
-            'lang': lang,
-            'hitl': hitl,
-            'extractMode': extract_mode,
-            'groupId': group_id
-        }
-
-        # Remove None values
-        data = {k: v for k, v in data.items() if v is not None}
-
-        self.refresh_token()
-        r = requests.post(self.split_and_extraction_async_create_url,
-                          headers=self.headers,
-                          files=files,
-                          data=data)
-        if r.ok:
-            return Task(r.json())
-        raise IDPException(r.json()['message'])
+        data = build_split_and_extraction_create_data(file=file, group_id=group_id, lang=lang, hitl=hitl,
+                                                      extract_mode=extract_mode)
+        return self._create('split_and_extraction_async_create', self.split_and_extraction_async_create_url, data,
+                            {"file": file})
 
     def split_and_extraction_status(self, application_id=None):
         """
@@ -758,17 +1214,9 @@ class Client(object):
         :return: Task or error message
         :rtype: Task
         """
-        if application_id is None:
-            raise IDPException("application_id is required")
-
-        data = {"applicationId": application_id}
-        self.refresh_token()
-        r = requests.post(self.split_and_extraction_async_status_url,
-                          headers=self.headers,
-                          json=data)
-        if r.ok:
-            return r.json()
-        raise IDPException(r.json()['message'])
+        data = build_application_data(application_id, name='application_id')
+        r = self._request('status', 'POST', self.split_and_extraction_async_status_url, json=data)
+        return check_response(r.ok, self._decode(r))
 
     def split_and_extraction_export(self, application_id=None):
         """
@@ -778,19 +1226,418 @@ class Client(object):
         :return: Task or error message
         :rtype: Task
         """
-        self.refresh_token()
-        if application_id is None:
-            raise IDPException("application_id is required")
+        data = build_application_data(application_id, name='application_id')
+        r = self._request('export', 'POST', self.split_and_extraction_async_export_url, json=data)
+        return check_export(r.ok, r.content)
+
+    def split_and_extraction_export_stream(self, application_id=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        stream the task zip file of a split_and_extraction completed task.
+        :param application_id: task ID
+        :type application_id: str
+        :param chunk_size: size of the chunks read from the network
+        :type chunk_size: int
+        :return: iterator of bytes chunks of the zip file, an IDPException is raised by this call if the export failed
+        """
+        data = build_application_data(application_id, name='application_id')
+        return self._export_stream(self.split_and_extraction_async_export_url, data, chunk_size)
+
+    def split_and_extraction_export_to_file(self, application_id=None, dest=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        download the task zip file of a split_and_extraction completed task straight to disk.
+        :param application_id: task ID
+        :type application_id: str
+        :param dest: file path, or file object opened in binary mode, it is only created once the export succeeded
+        :return: number of bytes written
+        :rtype: int
+        """
+        if dest is None:
+            raise IDPException("dest is required")
+        return write_chunks(self.split_and_extraction_export_stream(application_id, chunk_size), dest)
+
+    def split_and_extraction_export_members(self, application_id=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        iterate over the members of the task zip file of a split_and_extraction completed task while it downloads.
+        :param application_id: task ID
+        :type application_id: str
+        :return: iterator of :class:`sixe_idp.zipstream.ZipMember`, binary streams only readable until the next
+            member, see :func:`sixe_idp.zipstream.iter_zip`
+
+            for member in client.split_and_extraction_export_members(application_id):
+                if member.filename.endswith('.pdf'):
+                    shutil.copyfileobj(member, open(member.filename, 'wb'))
+        """
+        from .zipstream import iter_zip
+        return iter_zip(self.split_and_extraction_export_stream(application_id, chunk_size))
 
-        data = {"applicationId": application_id}
+    def _send(self, family, method, url, headers, event=None, **kwargs):
+        """
+        send one attempt of an api call, through the rate limiter of its family if any
+        :param event: :class:`sixe_idp.hooks.RequestEvent` of the attempt, whose timings are filled
+        """
+        started = time.perf_counter()
         self.refresh_token()
-        r = requests.post(self.split_and_extraction_async_export_url,
-                          headers=self.headers,
-                          json=data)
-        if r.ok:
-            return r.content
+        refreshed = time.perf_counter()
+        headers = dict(self.headers, **headers) if headers else self.headers
+        limiter = self.rate_limiter
+        if limiter is None:
+            sent = refreshed
+            r = self.transport.request(method, url, headers=headers, **kwargs)
         else:
-            raise IDPException(r.json()['message'])
+            with limiter.slot(family) as slot:
+                sent = time.perf_counter()
+                r = self.transport.request(method, url, headers=headers, **kwargs)
+                slot.record(r.status_code, r.headers.get('Retry-After'))
+        if event is not None:
+            event.timings.update(token=refreshed - started, limiter=sent - refreshed,
+                                 network=time.perf_counter() - sent)
+        return r
+
+    def _request(self, family, method, url, headers=None, **kwargs):
+        """
+        send an api call with the authorization header, retried according to the retry policy: the read-only
+        families on transient errors and statuses, the create family only when the call did not reach the server
+        :param family: create, status, export or history, see :class:`sixe_idp.ratelimit.RateLimiter`
+        :param headers: headers added to the authorization one
+        :param encode_time: seconds spent encoding the body, reported to the hooks
+        :raises IDPRateLimitException: when the server still throttled the call after the retries
+
+        With hooks, the after_response event of the json families is emitted by _decode, once the body is decoded.
+        """
+        from .ratelimit import parse_retry_after
+
+        policy = self.retry_policy
+        timeout = kwargs.pop('timeout', getattr(self.transport, 'timeout', None))
+        encode_time = kwargs.pop('encode_time', None)
+        body = kwargs.get('data')
+        hooks = self.hooks
+        event = None
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            if attempt > 1 and hasattr(body, 'rewind'):
+                body.rewind()
+            if hooks:
+                event = self._request_event(family, method, url, attempt, encode_time, kwargs)
+                hooks.emit(BEFORE_REQUEST, event)
+                attempt_started = time.perf_counter()
+            try:
+                r = self._send(family, method, url, headers, event, timeout=policy.timeout(timeout, started), **kwargs)
+            except requests.exceptions.RequestException as e:
+                retryable = was_not_sent(e) if family == 'create' else is_transient_error(e)
+                delay = policy.delay(attempt)
+                if not retryable or not policy.can_retry(attempt, started, delay):
+                    if event is not None:
+                        self._emit_failure(ON_ERROR, event, attempt_started, e)
+                    raise
+                if event is not None:
+                    self._emit_failure(ON_RETRY, event, attempt_started, e, delay)
+            except Exception as e:
+                # e.g. a failed token refresh
+                if event is not None:
+                    self._emit_failure(ON_ERROR, event, attempt_started, e)
+                raise
+            else:
+                retryable = r.status_code == 429 if family == 'create' else r.status_code in policy.retry_statuses
+                delay = policy.delay(attempt, parse_retry_after(r.headers.get('Retry-After'))) if retryable else None
+                if event is not None:
+                    self._record_response(event, r, kwargs.get('stream'))
+                if not retryable or not policy.can_retry(attempt, started, delay):
+                    if r.status_code == 429:
+                        e = IDPRateLimitException.from_response(r)
+                        if event is not None:
+                            self._emit_failure(ON_ERROR, event, attempt_started, e)
+                        raise e
+                    if event is not None:
+                        event.timings['total'] = time.perf_counter() - attempt_started
+                        if family == 'export':
+                            hooks.emit(AFTER_RESPONSE, event)
+                        else:
+                            r.hook_event = event
+                    return r
+                if event is not None:
+                    self._emit_failure(ON_RETRY, event, attempt_started, None, delay)
+                r.close()
+            time.sleep(delay)
+
+    def _request_event(self, family, method, url, attempt, encode_time, kwargs):
+        """
+        return the :class:`sixe_idp.hooks.RequestEvent` of an attempt
+        """
+        payload = kwargs.get('json') or kwargs.get('params') or {}
+        application_id = payload.get('applicationId', payload.get('application_id'))
+        event = RequestEvent(self._endpoints.get(url, url), family=family, method=method, url=url,
+                             application_id=application_id, attempt=attempt)
+        if encode_time is not None:
+            event.timings['encode'] = encode_time
+        if kwargs.get('data') is not None:
+            event.bytes_sent = len(kwargs['data'])
+        return event
+
+    @staticmethod
+    def _record_response(event, r, stream):
+        event.status_code = r.status_code
+        if r.request is not None and isinstance(r.request.body, (bytes, str)):
+            event.bytes_sent = len(r.request.body)
+        if not stream:
+            event.bytes_received = len(r.content)
+        elif r.headers.get('Content-Length', '').isdigit():
+            event.bytes_received = int(r.headers['Content-Length'])
+
+    def _emit_failure(self, name, event, attempt_started, error, delay=None):
+        event.timings['total'] = time.perf_counter() - attempt_started
+        event.error = error
+        event.delay = delay
+        self.hooks.emit(name, event)
+
+    def _decode(self, r, result_class=None):
+        """
+        return the json body of a response, emitting its after_response event with the decode time
+        :param result_class: :class:`sixe_idp.results.Result` class wrapping the body, decoded on first access,
+            instead of a dict
+        """
+        event = getattr(r, 'hook_event', None)
+        if event is None:
+            return result_class.from_response(r) if result_class is not None else loads(r.content)
+        del r.hook_event
+        started = time.perf_counter()
+        try:
+            payload = result_class.from_response(r) if result_class is not None else loads(r.content)
+        except ValueError as e:
+            payload, event.error = None, e
+        event.timings['decode'] = time.perf_counter() - started
+        event.timings['total'] += event.timings['decode']
+        if event.error is not None:
+            self.hooks.emit(ON_ERROR, event)
+            raise event.error
+        if event.family == 'create' and event.application_id is None and isinstance(payload, dict):
+            data = payload.get('data')
+            if isinstance(data, (str, int)):
+                event.application_id = str(data)
+        event.payload = payload
+        self.hooks.emit(AFTER_RESPONSE, event)
+        return payload
+
+    @staticmethod
+    def _wrap_result(result, result_class):
+        """
+        return a cached result as result_class, if it is a decoded dict
+        """
+        if result_class is not None and isinstance(result, dict):
+            return result_class(raw=result)
+        return result
+
+    def _create(self, endpoint, url, data, files):
+        """
+        submit a task through the submission cache, if any
+        """
+        cache = self.submission_cache
+        key = cache.key(endpoint, data, files) if cache is not None else None
+        if key is not None:
+            task = cache.get(key)
+            if task is not None:
+                return task
+        task = self._submit(endpoint, url, data, files)
+        if key is not None:
+            cache.put(key, endpoint, task.task_id)
+        return task
+
+    def _submit(self, endpoint, url, data, files):
+        """
+        upload a task, retried after an ambiguous failure only if the retry policy allows it and the task carries
+        a customerParam or remark, which is first looked up in the history so a task is never created twice
+        """
+        policy = self.retry_policy
+        marker = {k: data[k] for k in ('customerParam', 'remark') if data.get(k) is not None}
+        if not policy.retry_creates or not marker or endpoint != 'extraction_async_create':
+            r = self._post_multipart(url, data, files)
+            return Task(check_response(r.ok, self._decode(r)))
+        started = time.monotonic()
+        submitted_at = time.time()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                r = self._post_multipart(url, data, files)
+                if r.status_code < 500:
+                    return Task(check_response(r.ok, self._decode(r)))
+                error = IDPException(f'HTTP {r.status_code} while creating the task')
+            except requests.exceptions.RequestException as e:
+                error = e
+            delay = policy.delay(attempt)
+            if not policy.can_retry(attempt, started, delay):
+                raise error
+            time.sleep(delay)
+            try:
+                application_id = self._find_submission(marker, submitted_at, data.get('fileType'),
+                                                       _upload_name(files.get('file')))
+            except IDPException:
+                # the history cannot tell whether the task was created, it is not created again
+                raise error
+            if application_id is not None:
+                return Task({'data': application_id})
+
+    def _find_submission(self, marker, submitted_at, file_type=None, file_name=None):
+        """
+        return the application id of the task created since the day before submitted_at with the customerParam/remark
+        marker, or None. All the tasks of that window are scanned, narrowed by the server on the file type and name,
+        as the history api cannot filter on the marker. This relies on the history records carrying the
+        customerParam and remark of the tasks: an IDPException is raised when they do not.
+        """
+        since = time.localtime(submitted_at - 86400)
+        first_create_time = time.strftime('%Y-%m-%d %H:%M:%S', since)
+        for record in self.extraction_task_history_iter(limit=100, sortColumn='create_time', sortOrder='descending',
+                                                        fileTypeCode=file_type, fileName=file_name,
+                                                        startCreateTime=time.strftime('%Y-%m-%d', since)):
+            if not any(k in record for k in marker):
+                raise IDPException('The task history does not carry the customerParam or remark of the tasks')
+            if all(record.get(k) == v for k, v in marker.items()):
+                return record.get('applicationId') or record.get('id')
+            create_time = record.get('createTime')
+            if isinstance(create_time, str) and create_time < first_create_time:
+                return None
+        return None
+
+    def _post_multipart(self, url, data, files):
+        """
+        post a multipart form streamed from the files, which can be paths, file objects or (filename, file) tuples
+        """
+        started = time.perf_counter()
+        with MultipartEncoder(data, files) as body:
+            return self._request('create', 'POST', url, headers={'Content-Type': body.content_type}, data=body,
+                                 encode_time=time.perf_counter() - started)
+
+    def _export_stream(self, url, data, chunk_size):
+        """
+        start a streamed export, and return the iterator over its chunks once the export is known to be successful.
+        Errors come as a json body, they are detected from the status and the content type, never from the
+        exported content, so a file is never decoded as a whole.
+        """
+        r = self._request('export', 'POST', url, json=data, stream=True)
+        try:
+            if not r.ok:
+                check_export(False, r.content)
+            chunks = r.iter_content(chunk_size=chunk_size)
+            first = next(chunks, b'')
+            if 'json' in r.headers.get('Content-Type', ''):
+                # a json body is an error message, small enough to be read whole
+                first = check_faas_export(first + b''.join(chunks))
+        except BaseException:
+            r.close()
+            raise
+        return _iter_response_chunks(r, first, chunks)
+
+    def extraction_wait(self, application_id=None, timeout=600, submitted_at=None):
+        """
+        Wait for an extraction task to finish, polling extraction_result with an adaptive jittered backoff
+        tuned to the durations of the tasks waited on before.
+        :param application_id: application_id
+        :type application_id: str
+        :param timeout: seconds to wait before raising an IDPException
+        :type timeout: float
+        :param submitted_at: time.time() when the task was created, helps aiming the first poll at the expected
+            completion time
+        :type submitted_at: float
+        :returns: the final extraction_result response, check ['data']['taskStatus'] for Done/Fail/Invalid
+        :rtype: dict
+        """
+        from .polling import wait_for
+        return wait_for(self, 'extraction', application_id, timeout=timeout, submitted_at=submitted_at)
+
+    def extraction_faas_wait(self, application_id=None, timeout=12 * 60, submitted_at=None):
+        """
+        Wait for a faas task to finish, polling extraction_faas_status with an adaptive jittered backoff.
+        :param application_id: application_id
+        :type application_id: str
+        :param timeout: seconds to wait before raising an IDPException
+        :type timeout: float
+        :param submitted_at: time.time() when the task was created
+        :type submitted_at: float
+        :returns: the extraction_faas_result response, an IDPException is raised if the analysis is not Done
+        :rtype: dict
+        """
+        from .polling import wait_for
+        return wait_for(self, 'faas', application_id, timeout=timeout, submitted_at=submitted_at)
+
+    def extraction_doc_agent_wait(self, applicationId=None, timeout=600, submitted_at=None):
+        """
+        Wait for a doc agent task to finish, polling extraction_doc_agent_status with an adaptive jittered backoff.
+        :param applicationId: application id
+        :type applicationId: str
+        :param timeout: seconds to wait before raising an IDPException
+        :type timeout: float
+        :param submitted_at: time.time() when the task was created
+        :type submitted_at: float
+        :returns: the final extraction_doc_agent_status response, the result can then be exported
+        :rtype: dict
+        """
+        from .polling import wait_for
+        return wait_for(self, 'doc_agent', applicationId, timeout=timeout, submitted_at=submitted_at)
+
+    def split_and_extraction_wait(self, application_id=None, timeout=600, submitted_at=None):
+        """
+        Wait for a split and extraction task to finish, polling split_and_extraction_status with an adaptive
+        jittered backoff.
+        :param application_id: application id
+        :type application_id: str
+        :param timeout: seconds to wait before raising an IDPException
+        :type timeout: float
+        :param submitted_at: time.time() when the task was created
+        :type submitted_at: float
+        :returns: the final split_and_extraction_status response, the zip result can then be exported
+        :rtype: dict
+        """
+        from .polling import wait_for
+        return wait_for(self, 'split_and_extraction', application_id, timeout=timeout, submitted_at=submitted_at)
+
+    def submit_many(self, jobs, max_concurrency=8, max_inflight_bytes=256 * 1024 * 1024,
+                    endpoint='extraction_async_create', **defaults):
+        """
+        Submit many tasks concurrently and iterate over the results as the uploads complete.
+        :param jobs: iterable of jobs, each one is a dict of params of the create endpoint, or just the file
+            (a path, file object or (filename, file) tuple), also for extraction_faas_create. Files given as paths
+            are only opened while being uploaded.
+        :param max_concurrency: maximum number of uploads in flight
+        :type max_concurrency: int
+        :param max_inflight_bytes: maximum total size of the files being uploaded at once
+        :type max_inflight_bytes: int
+        :param endpoint: extraction_async_create, extraction_faas_create, extraction_doc_agent_create
+            or split_and_extraction_async_create
+        :type endpoint: str
+        :param defaults: params shared by all the jobs, e.g. file_type='CBKS'
+        :returns: iterator of :class:`sixe_idp.bulk.SubmitResult`, in completion order, holding the task or
+            the error of each job
+
+            for result in client.submit_many(glob.iglob('/data/*.pdf'), max_concurrency=16, file_type='CBKS'):
+                print(result.job, result.task_id if result.ok else result.error)
+        """
+        from .bulk import submit_many
+        return submit_many(self, jobs, max_concurrency=max_concurrency, max_inflight_bytes=max_inflight_bytes,
+                           endpoint=endpoint, **defaults)
+
+    def export_results(self, dest, application_ids=None, history=None, format=None, fields=None, rows=False,
+                       table=None, file_type=None, max_concurrency=8, row_group_size=1000):
+        """
+        Fetch the extraction results of many tasks concurrently and write them incrementally to a JSONL, CSV or
+        Parquet file, one row per result, or per table row with rows=True.
+        :param dest: path of the file, or a template such as 'out/{file_type}.parquet' writing a file per file type
+        :param application_ids: iterable of application ids, or of task history records
+        :param history: filters of extraction_task_history_iter, e.g. {'fileTypeCode': 'CBKS'}
+        :param fields: field codes of the columns, a list or a dict of file type -> list, by default those of the
+            first row group of each file
+        :param row_group_size: rows buffered per file before being written
+        :type row_group_size: int
+        :returns: :class:`sixe_idp.exporter.ExportSummary`, holding the rows written per file and the failed tasks
+
+            summary = client.export_results('warehouse/{file_type}.parquet', history={'status': 3}, max_concurrency=16)
+        """
+        from .exporter import export_results
+        return export_results(self, dest, application_ids=application_ids, history=history, format=format,
+                              fields=fields, rows=rows, table=table, file_type=file_type,
+                              max_concurrency=max_concurrency, row_group_size=row_group_size)
+
+
 class IDPException(Exception):
     """
         An IDP processing error occurred.
@@ -798,6 +1645,27 @@ class IDPException(Exception):
     pass
 
 
+class IDPRateLimitException(IDPException):
+    """
+        The IDP server throttled the call, retry_after is the number of seconds it asked to wait, if any.
+    """
+
+    def __init__(self, message, status_code=429, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_response(cls, r):
+        from .ratelimit import parse_retry_after
+
+        try:
+            message = r.json()['message']
+        except (ValueError, KeyError, TypeError):
+            message = f'Too many requests: HTTP {r.status_code}'
+        return cls(message, r.status_code, parse_retry_after(r.headers.get('Retry-After')))
+
+
 class IDPConfigurationException(Exception):
     """
         An IDP configuration error occurred.
@@ -809,9 +1677,13 @@ class Task(object):
     """
         The :class:`Task <Task>` object, which contains a server's response to an IDP task creating request.
     """
+    __slots__ = ('raw', 'result', 'cached')
 
-    def __init__(self, raw=None):
+    def __init__(self, raw=None, result=None, cached=False):
         self.raw = raw
+        # final result of a task found in the submission cache, if already known
+        self.result = result
+        self.cached = cached
 
     @property
     def task_id(self):
@@ -819,6 +1691,8 @@ class Task(object):
 
 
 class TaskResult(object):
+    __slots__ = ('raw',)
+
     def __init__(self, raw):
         self.raw = raw
 
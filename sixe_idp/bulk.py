@@ -0,0 +1,131 @@
+"""
+Bulk submission of IDP tasks with bounded concurrency, see :meth:`sixe_idp.api.Client.submit_many`
+"""
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# create endpoint name -> name of its file param
+CREATE_ENDPOINTS = {
+    'extraction_async_create': 'file',
+    'extraction_faas_create': 'files',
+    'extraction_doc_agent_create': 'file',
+    'split_and_extraction_async_create': 'file',
+}
+
+
+class SubmitResult(object):
+    """
+        The :class:`SubmitResult <SubmitResult>` object, which holds the outcome of one job of a bulk submission.
+    """
+
+    def __init__(self, job, task=None, error=None):
+        self.job = job
+        self.task = task
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def task_id(self):
+        return self.task.task_id if self.task is not None else None
+
+    def __repr__(self):
+        if self.ok:
+            return f'<SubmitResult task_id={self.task_id}>'
+        return f'<SubmitResult error={self.error!r}>'
+
+
+def _is_path(value):
+    return isinstance(value, (str, bytes, os.PathLike))
+
+
+def _file_size(value):
+    """
+    return the upload size of a path, a file object, or a requests style (filename, file) tuple
+    """
+    if isinstance(value, (list, tuple)):
+        return _file_size(value[1])
+    if _is_path(value):
+        return os.path.getsize(value)
+    try:
+        return os.fstat(value.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+
+def _job_size(job, file_key):
+    files = job.get(file_key)
+    if isinstance(files, dict):
+        return sum(_file_size(f) for f in files.values())
+    if files is None:
+        return 0
+    return _file_size(files)
+
+
+def submit_many(client, jobs, max_concurrency=8, max_inflight_bytes=256 * 1024 * 1024,
+                endpoint='extraction_async_create', **defaults):
+    """
+    Submit many tasks to a create endpoint on a pool of worker threads, and yield a
+    :class:`SubmitResult <SubmitResult>` for every job as soon as its upload completes
+
+    :param client: :class:`sixe_idp.api.Client` used for the uploads
+    :param jobs: iterable of jobs, each one is a dict of params of the create endpoint, or just the file
+        (a path, file object or (filename, file) tuple), which extraction_faas_create uploads as its files
+        part. Files given as paths are opened by the worker only while uploading.
+        The iterable is consumed lazily, so it can be a generator over a huge directory.
+    :param max_concurrency: maximum number of uploads in flight, which also bounds the opened file handles
+    :type max_concurrency: int
+    :param max_inflight_bytes: maximum total size of the files being uploaded at once, a single larger
+        file is still uploaded, but alone
+    :type max_inflight_bytes: int
+    :param endpoint: name of the create method, one of extraction_async_create, extraction_faas_create,
+        extraction_doc_agent_create and split_and_extraction_async_create
+    :type endpoint: str
+    :param defaults: params shared by all jobs, e.g. file_type='CBKS', a job's own params take precedence
+    """
+    from .api import IDPException
+
+    if endpoint not in CREATE_ENDPOINTS:
+        raise IDPException(f"endpoint must be one of {', '.join(CREATE_ENDPOINTS)}")
+    if max_concurrency < 1:
+        raise IDPException("max_concurrency must be at least 1")
+    file_key = CREATE_ENDPOINTS[endpoint]
+
+    pending = {}
+    inflight_bytes = 0
+
+    def finished(futures):
+        nonlocal inflight_bytes
+        for future in futures:
+            job, size = pending.pop(future)
+            inflight_bytes -= size
+            error = future.exception()
+            if error is not None:
+                yield SubmitResult(job, error=error)
+            else:
+                yield SubmitResult(job, task=future.result())
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        for job in jobs:
+            kwargs = dict(defaults)
+            kwargs.update(job if isinstance(job, dict) else {file_key: job})
+            if file_key == 'files' and kwargs.get(file_key) is not None and not isinstance(kwargs[file_key], dict):
+                # extraction_faas_create takes a dict of files, e.g. {"files": ("test.zip", file)}
+                kwargs[file_key] = {file_key: kwargs[file_key]}
+            try:
+                size = _job_size(kwargs, file_key)
+            except OSError as e:
+                yield SubmitResult(job, error=e)
+                continue
+            while pending and (len(pending) >= max_concurrency or inflight_bytes + size > max_inflight_bytes):
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from finished(done)
+            # files given as paths are opened by the create method only for the time of the upload
+            future = executor.submit(getattr(client, endpoint), **kwargs)
+            pending[future] = (job, size)
+            inflight_bytes += size
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from finished(done)
@@ -0,0 +1,354 @@
+"""
+Local caches of the IDP submissions and results, see :class:`SubmissionCache` and :class:`ResultCache`
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .api import TERMINAL_STATUSES, Task
+from .results import Result, dumps
+
+# size of the chunks read from the files being hashed
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# create endpoint -> task family
+SUBMISSION_ENDPOINTS = {
+    'extraction_async_create': 'extraction',
+    'extraction_faas_create': 'faas',
+    'split_and_extraction_async_create': 'split_and_extraction',
+}
+# params never part of the key, they only change how the task is reported back, every other param is keyed
+UNKEYED_PARAMS = {'customer', 'customerParam', 'callback', 'callbackUrl', 'autoCallback', 'callbackMode', 'remark'}
+
+
+def _file_digest(value):
+    """
+    return the sha256 of a file given as a path, bytes, a seekable file object or a (filename, file) tuple,
+    None if the file cannot be read without consuming it
+    """
+    if isinstance(value, (list, tuple)):
+        return _file_digest(value[1])
+    digest = hashlib.sha256()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        digest.update(value)
+        return digest.hexdigest()
+    if isinstance(value, (str, os.PathLike)):
+        with open(value, 'rb') as f:
+            return _file_digest(f)
+    try:
+        position = value.tell()
+        while True:
+            chunk = value.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+        value.seek(position)
+    except (AttributeError, OSError, ValueError):
+        return None
+    return digest.hexdigest()
+
+
+def submission_key(endpoint, data, files):
+    """
+    return the cache key of a submission: the sha256 of its files and of its params but the UNKEYED_PARAMS,
+    None if a file cannot be hashed
+    :param endpoint: name of the create method
+    :param data: form data of the create request
+    :param files: files of the create request, name -> file
+    """
+    params = sorted(k for k in data if k not in UNKEYED_PARAMS)
+    key = hashlib.sha256(endpoint.encode('utf-8'))
+    key.update(json.dumps({k: data.get(k) for k in params}, sort_keys=True, default=str).encode('utf-8'))
+    for name in sorted(files):
+        digest = _file_digest(files[name])
+        if digest is None:
+            return None
+        key.update(f'\0{name}\0{digest}'.encode('utf-8'))
+    return key.hexdigest()
+
+
+class SubmissionCache(object):
+    def __init__(self, path, ttl=7 * 24 * 3600, max_entries=100000):
+        """
+        Content-addressed cache of the submitted tasks, stored in a sqlite database. A file submitted again with
+        the same params returns the existing application id, and its final result once a wait method got it,
+        without uploading the file. Failed tasks are dropped from the cache so that they are submitted again.
+
+        :param path: path of the sqlite database, ':memory:' for a cache local to the process
+        :type path: str
+        :param ttl: seconds a submission is reused after it was made, None means forever
+        :type ttl: float
+        :param max_entries: maximum number of submissions kept, the least recently used ones are evicted
+        :type max_entries: int
+
+            cache = SubmissionCache('/var/cache/idp/submissions.sqlite3', ttl=30 * 24 * 3600)
+            client = Client(http_host, oauth_client, submission_cache=cache)
+            task = client.extraction_async_create(file='/path/to/file.pdf', file_type='CBKS')
+            result = task.result or client.extraction_wait(task.task_id)
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS submissions (key TEXT PRIMARY KEY, family TEXT NOT NULL, '
+                         'application_id TEXT NOT NULL, result TEXT, created REAL NOT NULL, accessed REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS submissions_application ON submissions (family, application_id)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS submissions_accessed ON submissions (accessed)')
+        self._size = self._db.execute('SELECT COUNT(*) FROM submissions').fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def key(self, endpoint, data, files):
+        return submission_key(endpoint, data, files)
+
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, key):
+        """
+        return the cached :class:`Task <sixe_idp.api.Task>` of a submission key, with its result if known, or None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute('SELECT application_id, result, created FROM submissions WHERE key = ?',
+                                   (key,)).fetchone()
+            if row is not None and self._expired(row[2], now):
+                self._db.execute('DELETE FROM submissions WHERE key = ?', (key,))
+                self._size -= 1
+                self.expirations += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute('UPDATE submissions SET accessed = ? WHERE key = ?', (now, key))
+            self.hits += 1
+        result = json.loads(row[1]) if row[1] is not None else None
+        return Task({'data': row[0]}, result=result, cached=True)
+
+    def put(self, key, endpoint, application_id):
+        """
+        cache the application id of a new submission
+        """
+        now = time.time()
+        family = SUBMISSION_ENDPOINTS[endpoint]
+        with self._lock:
+            replaced = self._db.execute('SELECT 1 FROM submissions WHERE key = ?', (key,)).fetchone() is not None
+            self._db.execute('INSERT OR REPLACE INTO submissions VALUES (?, ?, ?, NULL, ?, ?)',
+                             (key, family, str(application_id), now, now))
+            self.stores += 1
+            if not replaced:
+                self._size += 1
+            if self.max_entries is not None and self._size > self.max_entries:
+                evicted = self._db.execute('DELETE FROM submissions WHERE key IN (SELECT key FROM submissions '
+                                           'ORDER BY accessed LIMIT ?)', (self._size - self.max_entries,)).rowcount
+                self._size -= evicted
+                self.evictions += evicted
+
+    def result(self, family, application_id):
+        """
+        return the cached final result of an application, or None
+        """
+        with self._lock:
+            row = self._db.execute('SELECT result, created FROM submissions WHERE family = ? AND application_id = ? '
+                                   'AND result IS NOT NULL', (family, str(application_id))).fetchone()
+        if row is None or self._expired(row[1], time.time()):
+            return None
+        return json.loads(row[0])
+
+    def put_result(self, family, application_id, result):
+        """
+        cache the final result of a successful application
+        """
+        with self._lock:
+            self._db.execute('UPDATE submissions SET result = ? WHERE family = ? AND application_id = ?',
+                             (dumps(result), family, str(application_id)))
+
+    def discard(self, family, application_id):
+        """
+        drop an application from the cache, e.g. because it failed
+        """
+        with self._lock:
+            deleted = self._db.execute('DELETE FROM submissions WHERE family = ? AND application_id = ?',
+                                       (family, str(application_id))).rowcount
+            self._size -= deleted
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM submissions')
+            self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def stats(self):
+        """
+        hit/miss counters of this process, and the current size of the cache
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                'stores': self.stores, 'evictions': self.evictions, 'expirations': self.expirations,
+                'size': self._size}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def result_status(result):
+    """
+    return the task status found in a result payload, or None
+    """
+    if isinstance(result, Result):
+        # read from the body of a lazy result without decoding it
+        return result.status
+    data = result.get('data') if isinstance(result, dict) else None
+    if isinstance(data, dict):
+        for key in ('taskStatus', 'analysisStatus', 'status'):
+            if isinstance(data.get(key), str):
+                return data[key]
+    return None
+
+
+class ResultCache(object):
+    def __init__(self, max_entries=1024, path=None, ttl=None):
+        """
+        Read-through cache of the results of finished tasks, used by Client.extraction_result and
+        Client.extraction_faas_result. Only results in a terminal status (Done, Fail, Invalid) are stored,
+        in an in-memory LRU and optionally in a sqlite database shared by the processes using the same path.
+        It is safe to share across threads, the cached results are shared too and must not be modified.
+
+        :param max_entries: maximum number of results kept in memory
+        :type max_entries: int
+        :param path: path of the sqlite database of the on-disk tier, None for memory only
+        :type path: str
+        :param ttl: seconds a result is kept, None means forever
+        :type ttl: float
+
+            result_cache = ResultCache(max_entries=4096, path='/var/cache/idp/results.sqlite3')
+            client = Client(http_host, oauth_client, result_cache=result_cache)
+        """
+        self.max_entries = max_entries
+        self.path = path
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        # applications seen in a terminal status, whose result payload does not carry the status
+        self._terminal = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            if path != ':memory:':
+                self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS results (family TEXT NOT NULL, application_id TEXT NOT NULL, '
+                             'result TEXT NOT NULL, stored REAL NOT NULL, PRIMARY KEY (family, application_id))')
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _expired(self, stored, now):
+        return self.ttl is not None and now - stored > self.ttl
+
+    def _remember(self, key, result, stored):
+        self._memory[key] = (result, stored)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, family, application_id):
+        """
+        return the cached result of an application, or None
+        """
+        key = (family, str(application_id))
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry[1], now):
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if self._db is not None:
+                row = self._db.execute('SELECT result, stored FROM results WHERE family = ? AND application_id = ?',
+                                       key).fetchone()
+                if row is not None and not self._expired(row[1], now):
+                    result = json.loads(row[0])
+                    self._remember(key, result, row[1])
+                    self.disk_hits += 1
+                    return result
+            self.misses += 1
+            return None
+
+    def mark_terminal(self, family, application_id):
+        """
+        record that an application reached a terminal status, so that its result is cached once fetched
+        """
+        with self._lock:
+            self._terminal[(family, str(application_id))] = True
+            while len(self._terminal) > self.max_entries:
+                self._terminal.popitem(last=False)
+
+    def is_terminal(self, family, application_id, result):
+        status = result_status(result)
+        if status is not None:
+            return status in TERMINAL_STATUSES
+        with self._lock:
+            return (family, str(application_id)) in self._terminal
+
+    def put(self, family, application_id, result):
+        """
+        cache the result of an application which reached a terminal status
+        """
+        key = (family, str(application_id))
+        now = time.time()
+        with self._lock:
+            self._terminal.pop(key, None)
+            self._remember(key, result, now)
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                                 key + (dumps(result), now))
+
+    def discard(self, family, application_id):
+        """
+        drop the result of an application, e.g. because it was sent to HITL again
+        """
+        key = (family, str(application_id))
+        with self._lock:
+            self._memory.pop(key, None)
+            self._terminal.pop(key, None)
+            if self._db is not None:
+                self._db.execute('DELETE FROM results WHERE family = ? AND application_id = ?', key)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._terminal.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM results')
+
+    def __len__(self):
+        return len(self._memory)
+
+    @property
+    def stats(self):
+        """
+        hit/miss counters of this process, and the number of results in memory
+        """
+        lookups = self.hits + self.disk_hits + self.misses
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0, 'size': len(self._memory)}
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,601 @@
+"""
+Receiver of the IDP task callbacks, as a WSGI or ASGI app, see :class:`CallbackReceiver`
+"""
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future
+from email.parser import HeaderParser
+
+from .api import HmacVerifier, IDPException
+from .multipart import MultipartEncoder
+
+# size of the chunks read from the request body
+READ_CHUNK_SIZE = 64 * 1024
+# maximum size of the headers of a multipart part
+MAX_PART_HEADER_SIZE = 16 * 1024
+# default header holding the hmac signature of a callback
+SIGNATURE_HEADER = 'X-Signature'
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 405: 'Method Not Allowed',
+            413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class CallbackFile(object):
+    """
+        The :class:`CallbackFile <CallbackFile>` object, a file part of a mode 2 or mode 3 callback spooled to disk.
+    """
+
+    def __init__(self, name, filename, content_type, path):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.path = path
+        self.size = 0
+        self._owned = True
+
+    def open(self):
+        return open(self.path, 'rb')
+
+    def read(self):
+        with self.open() as f:
+            return f.read()
+
+    def save(self, dest):
+        """
+        move the spooled file to dest, it is then no longer deleted with the event
+        """
+        shutil.move(self.path, dest)
+        self.path = dest
+        self._owned = False
+        return dest
+
+    def close(self):
+        if self._owned:
+            self._owned = False
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __repr__(self):
+        return f'<CallbackFile {self.name} {self.filename} size={self.size}>'
+
+
+class CallbackEvent(object):
+    """
+        The :class:`CallbackEvent <CallbackEvent>` object, a callback received from IDP.
+    """
+
+    def __init__(self, result, fields=None, files=None, verified=None, headers=None):
+        self.result = result
+        self.fields = fields or {}
+        self.files = files or {}
+        self.verified = verified
+        self.headers = headers or {}
+        self._claimed = False
+
+    def _get(self, *keys):
+        for payload in (self.result, (self.result or {}).get('data')):
+            if isinstance(payload, dict):
+                for key in keys:
+                    if payload.get(key) is not None:
+                        return payload[key]
+        return None
+
+    @property
+    def application_id(self):
+        return self._get('applicationId', 'application_id', 'taskId')
+
+    @property
+    def customer_param(self):
+        return self._get('customerParam', 'customer_param')
+
+    @property
+    def status(self):
+        return self._get('taskStatus', 'status', 'analysisStatus')
+
+    @property
+    def mode(self):
+        """
+        callback mode of the task: 0 status only, 1 with the fields, 2 with the pdf file, 3 with all the exports
+        """
+        mode = self._get('callbackMode')
+        if mode is not None:
+            return int(mode)
+        if self.files:
+            return 2 if len(self.files) == 1 else 3
+        return 1 if self._get('fields') is not None else 0
+
+    def close(self):
+        """
+        delete the spooled files which were not saved
+        """
+        for f in self.files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __repr__(self):
+        return f'<CallbackEvent {self.application_id} mode={self.mode} status={self.status}>'
+
+
+def _boundary(content_type):
+    parser = HeaderParser().parsestr(f'Content-Type: {content_type}\r\n\r\n')
+    boundary = parser.get_param('boundary')
+    if not boundary:
+        raise IDPException('multipart callback without boundary')
+    return boundary.encode('latin-1')
+
+
+class _MultipartParser(object):
+    """
+    push parser of a multipart/form-data body, calling on_part(headers), on_data(bytes) and on_end()
+    for each part as the body arrives
+    """
+
+    def __init__(self, boundary, on_part, on_data, on_end):
+        self.delimiter = b'\r\n--' + boundary
+        # the first boundary is not preceded by a line break
+        self.buffer = bytearray(b'\r\n')
+        self.state = 'preamble'
+        self.on_part = on_part
+        self.on_data = on_data
+        self.on_end = on_end
+
+    def feed(self, data):
+        self.buffer += data
+        keep = len(self.delimiter) - 1
+        while True:
+            if self.state == 'preamble':
+                i = self.buffer.find(self.delimiter)
+                if i < 0:
+                    del self.buffer[:max(0, len(self.buffer) - keep)]
+                    return
+                del self.buffer[:i + len(self.delimiter)]
+                self.state = 'delimiter'
+            elif self.state == 'delimiter':
+                if len(self.buffer) < 2:
+                    return
+                if self.buffer[:2] == b'--':
+                    self.state = 'end'
+                elif self.buffer[:2] == b'\r\n':
+                    del self.buffer[:2]
+                    self.state = 'headers'
+                else:
+                    raise IDPException('malformed multipart callback')
+            elif self.state == 'headers':
+                i = self.buffer.find(b'\r\n\r\n')
+                if i < 0:
+                    if len(self.buffer) > MAX_PART_HEADER_SIZE:
+                        raise IDPException('multipart callback part headers too large')
+                    return
+                headers = HeaderParser().parsestr(self.buffer[:i + 4].decode('utf-8', 'replace'))
+                del self.buffer[:i + 4]
+                self.on_part(headers)
+                self.state = 'body'
+            elif self.state == 'body':
+                i = self.buffer.find(self.delimiter)
+                if i < 0:
+                    safe = len(self.buffer) - keep
+                    if safe > 0:
+                        self.on_data(bytes(self.buffer[:safe]))
+                        del self.buffer[:safe]
+                    return
+                if i:
+                    self.on_data(bytes(self.buffer[:i]))
+                del self.buffer[:i + len(self.delimiter)]
+                self.on_end()
+                self.state = 'delimiter'
+            else:
+                self.buffer.clear()
+                return
+
+    def close(self):
+        if self.state != 'end':
+            raise IDPException('truncated multipart callback')
+
+
+class _CallbackRequest(object):
+    """
+    one callback being received: the body is hashed as it arrives, the file parts are spooled to disk
+    """
+
+    def __init__(self, receiver, headers):
+        self.receiver = receiver
+        self.headers = headers
+        self.verifier = HmacVerifier(receiver.secret) if receiver.secret is not None else None
+        self.size = 0
+        self.fields = {}
+        self.files = {}
+        self.body = bytearray()
+        self.parser = None
+        self._part = None
+        self._buffer = None
+        self._spool = None
+        content_type = headers.get('content-type', '')
+        if content_type.lower().startswith('multipart/'):
+            self.parser = _MultipartParser(_boundary(content_type), self._on_part, self._on_data, self._on_end)
+
+    def _on_part(self, headers):
+        name = headers.get_param('name', header='content-disposition')
+        filename = headers.get_param('filename', header='content-disposition')
+        if filename is None:
+            self._part = (name, None)
+            self._buffer = bytearray()
+            return
+        self._spool = tempfile.NamedTemporaryFile(dir=self.receiver.spool_dir, prefix='sixe-idp-callback-',
+                                                  delete=False)
+        part = CallbackFile(name, filename, headers.get_content_type(), self._spool.name)
+        self.files[name] = part
+        self._part = (name, part)
+
+    def _on_data(self, data):
+        if self.verifier is not None:
+            self.verifier.update(data)
+        name, part = self._part
+        if part is None:
+            self._buffer += data
+        else:
+            self._spool.write(data)
+            part.size += len(data)
+
+    def _on_end(self):
+        name, part = self._part
+        if part is None:
+            self.fields[name] = self._buffer.decode('utf-8')
+        else:
+            self._spool.close()
+            self._spool = None
+        self._part = None
+
+    def feed(self, data):
+        self.size += len(data)
+        if self.receiver.max_body_size is not None and self.size > self.receiver.max_body_size:
+            raise _HttpError(413, 'callback too large')
+        if self.parser is not None:
+            self.parser.feed(data)
+        else:
+            if self.verifier is not None:
+                self.verifier.update(data)
+            self.body += data
+
+    def finish(self):
+        """
+        return the CallbackEvent of the received body
+        """
+        if self.parser is not None:
+            self.parser.close()
+            text = self.fields.get('result')
+            if text is None and self.fields:
+                text = next(iter(self.fields.values()))
+        else:
+            text = self.body.decode('utf-8')
+        try:
+            result = json.loads(text) if text else None
+        except ValueError:
+            raise IDPException('callback result is not json')
+        verified = None
+        if self.verifier is not None:
+            signature = self.headers.get(self.receiver.signature_header.lower())
+            verified = signature is not None and self.verifier.verify(signature)
+        return CallbackEvent(result, fields=self.fields, files=self.files, verified=verified, headers=self.headers)
+
+    def abort(self):
+        if self._spool is not None:
+            self._spool.close()
+        for f in self.files.values():
+            f.close()
+
+
+class _HttpError(IDPException):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class CallbackReceiver(object):
+    def __init__(self, secret=None, signature_header=SIGNATURE_HEADER, spool_dir=None, max_body_size=None):
+        """
+        Receives the callbacks of the tasks submitted with callback=<url of the receiver>, as a WSGI app
+        (the receiver itself) or an ASGI app (receiver.asgi), for all callback modes 0 to 3.
+        The signature is checked while the body arrives, the file parts are spooled to disk, and the callback
+        is dispatched to the handlers registered for its application id or customerParam.
+
+        :param secret: the secret to check the hmac signatures with, callbacks with a missing or wrong signature
+            are answered with 401. None turns off the check.
+        :type secret: str
+        :param signature_header: name of the header holding the signature
+        :type signature_header: str
+        :param spool_dir: directory of the spooled file parts, the system temporary directory by default
+        :type spool_dir: str
+        :param max_body_size: callbacks larger than this are answered with 413, None means no limit
+        :type max_body_size: int
+
+            receiver = CallbackReceiver(secret=client_secret)
+
+            @receiver.on(customer_param='batch-42')
+            def done(event):
+                print(event.application_id, event.status, event.result)
+                event.files['file'].save(f'/data/{event.application_id}.pdf')
+
+            # any WSGI server, e.g. gunicorn 'module:receiver', or the local one
+            make_server(receiver, port=8080).serve_forever()
+        """
+        self.secret = secret
+        self.signature_header = signature_header
+        self.spool_dir = spool_dir
+        self.max_body_size = max_body_size
+        self._by_application = {}
+        self._by_customer_param = {}
+        self._default = []
+        self._lock = threading.Lock()
+
+    def on(self, application_id=None, customer_param=None, handler=None, once=False):
+        """
+        Register a handler called with the CallbackEvent, for an application id, a customerParam, or for the
+        callbacks matching no other handler when both are None. It can be used as a decorator.
+        :param once: remove the handler after its first call
+        :type once: bool
+        """
+        if handler is None:
+            def decorator(h):
+                return self.on(application_id, customer_param, h, once)
+            return decorator
+        with self._lock:
+            if application_id is not None:
+                self._by_application.setdefault(str(application_id), []).append((handler, once))
+            elif customer_param is not None:
+                self._by_customer_param.setdefault(str(customer_param), []).append((handler, once))
+            else:
+                self._default.append((handler, once))
+        return handler
+
+    def off(self, application_id=None, customer_param=None, handler=None):
+        """
+        Remove the handlers of an application id or a customerParam, or only the given one
+        """
+        with self._lock:
+            if application_id is None and customer_param is None:
+                self._default = [h for h in self._default if handler is not None and h[0] is not handler]
+                return
+            if application_id is not None:
+                registry, key = self._by_application, str(application_id)
+            else:
+                registry, key = self._by_customer_param, str(customer_param)
+            handlers = [h for h in registry.get(key, []) if handler is not None and h[0] is not handler]
+            if handlers:
+                registry[key] = handlers
+            else:
+                registry.pop(key, None)
+
+    def expect(self, application_id=None, customer_param=None):
+        """
+        return a concurrent.futures.Future resolved with the next CallbackEvent of an application id or a
+        customerParam, the spooled files of the event are then kept until event.close()
+
+            future = receiver.expect(customer_param='invoice-1')
+            client.extraction_async_create(file=path, file_type='CBKS', customer_param='invoice-1',
+                                           callback=receiver_url)
+            with future.result(timeout=600) as event:
+                print(event.result)
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+
+        def resolve(event):
+            event._claimed = True
+            future.set_result(event)
+
+        self.on(application_id, customer_param, resolve, once=True)
+        return future
+
+    def _handlers(self, event):
+        with self._lock:
+            for key, registry in ((event.application_id, self._by_application),
+                                  (event.customer_param, self._by_customer_param)):
+                if key is not None and str(key) in registry:
+                    handlers = registry[str(key)]
+                    registry[str(key)] = [h for h in handlers if not h[1]]
+                    if not registry[str(key)]:
+                        del registry[str(key)]
+                    return [h[0] for h in handlers]
+            handlers = self._default
+            self._default = [h for h in handlers if not h[1]]
+            return [h[0] for h in handlers]
+
+    def dispatch(self, event):
+        """
+        call the handlers of a verified CallbackEvent, then delete its spooled files unless expect() claimed it
+        """
+        try:
+            for handler in self._handlers(event):
+                handler(event)
+        finally:
+            if not event._claimed:
+                event.close()
+
+    def _begin(self, headers):
+        return _CallbackRequest(self, headers)
+
+    def _complete(self, request):
+        """
+        return the http status and json body answering a fully received callback
+        """
+        try:
+            event = request.finish()
+        except IDPException as e:
+            request.abort()
+            return 400, str(e)
+        if event.verified is False:
+            event.close()
+            return 401, 'invalid signature'
+        try:
+            self.dispatch(event)
+        except Exception as e:
+            return 500, f'callback handler failed: {e}'
+        return 200, 'ok'
+
+    def handle(self, headers, chunks):
+        """
+        receive a callback from its headers and an iterable of body chunks, return the http status and message
+        :param headers: request headers
+        :type headers: dict
+        """
+        try:
+            request = self._begin({k.lower(): v for k, v in headers.items()})
+        except IDPException as e:
+            return 400, str(e)
+        try:
+            for chunk in chunks:
+                request.feed(chunk)
+        except _HttpError as e:
+            request.abort()
+            return e.status, str(e)
+        except IDPException as e:
+            request.abort()
+            return 400, str(e)
+        except BaseException:
+            request.abort()
+            raise
+        return self._complete(request)
+
+    @staticmethod
+    def _response(status, message):
+        return json.dumps({'code': status, 'message': message}).encode('utf-8')
+
+    def __call__(self, environ, start_response):
+        """
+        WSGI app
+        """
+        if environ.get('REQUEST_METHOD') != 'POST':
+            status, message = 405, 'callbacks are POST requests'
+        else:
+            headers = {key[5:].replace('_', '-'): value for key, value in environ.items() if key.startswith('HTTP_')}
+            if environ.get('CONTENT_TYPE'):
+                headers['Content-Type'] = environ['CONTENT_TYPE']
+            status, message = self.handle(headers, _iter_wsgi_input(environ))
+        body = self._response(status, message)
+        start_response(f'{status} {_REASONS[status]}', [('Content-Type', 'application/json'),
+                                                         ('Content-Length', str(len(body)))])
+        return [body]
+
+    async def asgi(self, scope, receive, send):
+        """
+        ASGI app, the handlers are called from the default executor of the loop
+        """
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+        status, message = 200, None
+        if scope.get('method') != 'POST':
+            status, message = 405, 'callbacks are POST requests'
+        else:
+            headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])}
+            try:
+                request = self._begin(headers)
+            except IDPException as e:
+                status, message = 400, str(e)
+            else:
+                try:
+                    more_body = True
+                    while more_body:
+                        event = await receive()
+                        if event['type'] == 'http.disconnect':
+                            request.abort()
+                            return
+                        request.feed(event.get('body', b''))
+                        more_body = event.get('more_body', False)
+                except _HttpError as e:
+                    request.abort()
+                    status, message = e.status, str(e)
+                except IDPException as e:
+                    request.abort()
+                    status, message = 400, str(e)
+                except BaseException:
+                    request.abort()
+                    raise
+                if message is None:
+                    status, message = await asyncio.get_running_loop().run_in_executor(None, self._complete,
+                                                                                       request)
+        body = self._response(status, message)
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode('latin-1'))]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def _iter_wsgi_input(environ):
+    stream = environ['wsgi.input']
+    length = environ.get('CONTENT_LENGTH')
+    remaining = int(length) if length else None
+    while remaining is None or remaining > 0:
+        chunk = stream.read(READ_CHUNK_SIZE if remaining is None else min(READ_CHUNK_SIZE, remaining))
+        if not chunk:
+            return
+        if remaining is not None:
+            remaining -= len(chunk)
+        yield chunk
+
+
+def make_server(receiver, host='127.0.0.1', port=8080):
+    """
+    return a threaded wsgiref server of the receiver, for local use and tests, call serve_forever() on it
+    """
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+    from wsgiref.simple_server import make_server as wsgiref_make_server
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    return wsgiref_make_server(host, port, receiver, server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+
+
+def send_callback(url, result, secret=None, files=None, signature_header=SIGNATURE_HEADER, transport=None,
+                  result_name='result'):
+    """
+    Send a callback the way IDP does, to test a receiver locally
+    :param url: url of the receiver
+    :param result: callback result, a dict sent as json
+    :param secret: secret to sign the callback with, no signature header is sent if None
+    :param files: file parts of a mode 2 or mode 3 callback, name -> path, bytes, file object or
+        (filename, file[, content_type]) tuple, in the order they are signed
+    :type files: dict
+    :param transport: :class:`sixe_idp.api.HttpTransport`, a plain requests call by default
+    :returns: the requests.Response of the receiver
+    """
+    import requests
+
+    post = transport.post if transport is not None else requests.post
+    text = json.dumps(result)
+    headers = {}
+    if not files:
+        if secret is not None:
+            headers[signature_header] = HmacVerifier(secret).update(text).hexdigest()
+        headers['Content-Type'] = 'application/json'
+        return post(url, data=text.encode('utf-8'), headers=headers)
+    with MultipartEncoder({result_name: text}, files) as body:
+        if secret is not None:
+            headers[signature_header] = HmacVerifier(secret).update(text).update(body.iter_files()).hexdigest()
+            body.rewind()
+        headers['Content-Type'] = body.content_type
+        return post(url, data=body, headers=headers)
@@ -0,0 +1,265 @@
+"""
+Columnar tables of the fields and table rows of many extraction results, see :func:`fields_table` and
+:func:`rows_table`. The columns are NumPy arrays when NumPy is installed (``pip install 6estates-idp[columnar]``),
+and array.array or lists otherwise.
+"""
+import math
+import re
+from array import array
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .api import IDPException
+from .results import ExtractionResult, Result
+
+APPLICATION_ID = 'application_id'
+ROW_INDEX = 'row_index'
+# amounts as extracted, e.g. 1,234.50, -12.00, (12.00) or 12.00-, with one sign notation at most
+_NUMBER = re.compile(r'^(?:\((?P<parenthesized>[\d,]*\.?\d+)\)|[-+]?[\d,]*\.?\d+(?:[eE][-+]?\d+)?-?)$')
+# texts detected as amounts: with a decimal separator, thousands grouping or a negative notation
+_AMOUNT = re.compile(r'[.,(]|-$')
+# zero-padded numbers, e.g. ids, never detected as amounts
+_PADDED = re.compile(r'^[-+(]?0\d')
+
+
+def parse_number(value):
+    """
+    return the float of an extracted amount, or None if it is not a number
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    text = value.strip().replace(' ', '')
+    match = _NUMBER.match(text)
+    if match is None:
+        return None
+    if match.group('parenthesized') is not None:
+        return -float(match.group('parenthesized').replace(',', ''))
+    if text.endswith('-'):
+        if text[0] in '-+':
+            return None
+        return -float(text[:-1].replace(',', ''))
+    return float(text.replace(',', ''))
+
+
+def _is_amount(value):
+    """
+    whether a value parsed as a number looks like an amount rather than a code written with digits
+    """
+    return not isinstance(value, str) or _AMOUNT.search(value.strip()) is not None
+
+
+def _as_result(result):
+    if isinstance(result, ExtractionResult):
+        return result
+    if isinstance(result, Result):
+        return ExtractionResult(raw=result.raw)
+    if isinstance(result, dict):
+        return ExtractionResult(raw=result)
+    raise IDPException(f'Unexpected extraction result: {type(result).__name__}')
+
+
+class _Builder(object):
+    """
+    rows appended as dicts, stored column by column, the columns missing from a row are padded with None
+    """
+
+    def __init__(self):
+        self.columns = OrderedDict()
+        self.length = 0
+
+    def append(self, row):
+        for name, value in row.items():
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = [None] * self.length
+            column.append(value)
+        self.length += 1
+        for column in self.columns.values():
+            if len(column) < self.length:
+                column.append(None)
+
+    def build(self, numeric=None):
+        return ColumnTable(OrderedDict((name, _column(values, name, numeric))
+                                       for name, values in self.columns.items()), self.length)
+
+
+def _column(values, name, numeric):
+    """
+    return the array of the values, floats with NaN for the missing values if the column is numeric
+    :param numeric: None to detect the numeric columns, a collection of column names, or False
+    """
+    if name not in (APPLICATION_ID, ROW_INDEX) and numeric is not False and (numeric is None or name in numeric):
+        numbers = [parse_number(v) for v in values]
+        if numeric is None:
+            # detected when every value given is a number and one looks like an amount, so that ids such as 001234
+            # are kept as texts
+            given = [(n, v) for n, v in zip(numbers, values) if v is not None and v != '']
+            is_numeric = bool(given) and all(n is not None and not (isinstance(v, str) and _PADDED.match(v.strip()))
+                                             for n, v in given) and any(_is_amount(v) for _, v in given)
+        else:
+            is_numeric = True
+        if is_numeric:
+            numbers = [math.nan if n is None else n for n in numbers]
+            return numpy.array(numbers, dtype=numpy.float64) if numpy is not None else array('d', numbers)
+    if name == ROW_INDEX:
+        return numpy.array(values, dtype=numpy.int64) if numpy is not None else array('q', values)
+    return numpy.array(values, dtype=object) if numpy is not None else values
+
+
+def _all_missing(column):
+    return all(v is None for v in column) if not isinstance(column, array) else False
+
+
+def _missing(column, length):
+    """
+    return a column of length missing values of the same kind as column
+    """
+    if numpy is not None:
+        if column.dtype.kind == 'f':
+            return numpy.full(length, numpy.nan)
+        return numpy.full(length, None, dtype=object)
+    if isinstance(column, array) and column.typecode == 'd':
+        return array('d', [math.nan]) * length
+    return [None] * length
+
+
+class ColumnTable(object):
+    __slots__ = ('columns', 'length')
+
+    def __init__(self, columns, length):
+        """
+        Columns of the same length, by name: NumPy arrays if NumPy is installed, otherwise array.array for the
+        numeric columns and lists for the others. The missing numbers are NaN, the missing texts None.
+
+        :param columns: name -> column
+        :type columns: OrderedDict
+        :param length: number of rows
+        :type length: int
+        """
+        self.columns = columns
+        self.length = length
+
+    @property
+    def names(self):
+        return list(self.columns)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def rows(self):
+        """
+        yield the rows as dicts
+        """
+        names = self.names
+        for values in zip(*self.columns.values()):
+            yield dict(zip(names, values))
+
+    @classmethod
+    def concat(cls, tables):
+        """
+        return the table of the rows of all the tables, the columns missing from a table are filled with
+        missing values
+        """
+        tables = [t for t in tables if t.length]
+        # name -> column giving the kind of the joined column, preferably one with values
+        kinds = OrderedDict()
+        for table in tables:
+            for name, column in table.columns.items():
+                if name not in kinds or _all_missing(kinds[name]):
+                    kinds[name] = column
+        columns = OrderedDict()
+        for name, kind in kinds.items():
+            parts = [t.columns[name] if name in t.columns and not _all_missing(t.columns[name])
+                     else _missing(kind, t.length) for t in tables]
+            if numpy is not None:
+                if len({p.dtype.kind for p in parts}) > 1:
+                    # a column numeric in some tables only, kept as objects
+                    parts = [p.astype(object) for p in parts]
+                columns[name] = numpy.concatenate(parts)
+            elif isinstance(kind, array) and all(isinstance(p, array) and p.typecode == kind.typecode for p in parts):
+                columns[name] = array(kind.typecode)
+                for part in parts:
+                    columns[name].extend(part)
+            else:
+                columns[name] = [v for p in parts for v in p]
+        return cls(columns, sum(t.length for t in tables))
+
+    def __repr__(self):
+        return f'<ColumnTable rows={self.length} columns={len(self.columns)}>'
+
+
+def fields_table(results, numeric=None):
+    """
+    Table of one row per result, with a column per field code of the scalar fields, and the application_id column
+    :param results: extraction results, dicts or :class:`sixe_idp.results.Result` objects
+    :param numeric: None to store the columns of amounts as floats, whose values are all numbers, one of them with
+        a decimal separator, thousands grouping or a negative notation, a collection of field codes to store as
+        floats, or False
+    :rtype: :class:`ColumnTable <ColumnTable>`
+    """
+    builder = _Builder()
+    for result in results:
+        result = _as_result(result)
+        row = {APPLICATION_ID: result.application_id}
+        for field in result.fields:
+            if not field.is_table:
+                row.setdefault(field.code, field.value)
+        builder.append(row)
+    return builder.build(numeric)
+
+
+def rows_table(results, table=None, numeric=None):
+    """
+    Table of the rows of the table fields of the results, e.g. the transactions of bank statements, with a column
+    per cell field code, the application_id column and the row_index column numbering the rows of each table
+    :param results: extraction results, dicts or :class:`sixe_idp.results.Result` objects
+    :param table: field code of the table, all the tables if None
+    :param numeric: None to store the columns of amounts as floats, whose values are all numbers, one of them with
+        a decimal separator, thousands grouping or a negative notation, a collection of field codes to store as
+        floats, or False
+    :rtype: :class:`ColumnTable <ColumnTable>`
+    """
+    builder = _Builder()
+    for result in results:
+        result = _as_result(result)
+        application_id = result.application_id
+        for field_table in result.tables:
+            if table is not None and field_table.code != table:
+                continue
+            for index, record in enumerate(field_table.records()):
+                row = {APPLICATION_ID: application_id, ROW_INDEX: index}
+                row.update(record)
+                builder.append(row)
+    return builder.build(numeric)
+
+
+def iter_batches(results, batch_size=1000, rows=False, table=None, numeric=None):
+    """
+    Yield a :class:`ColumnTable <ColumnTable>` per batch of batch_size results, to process more results than fit
+    in memory, ColumnTable.concat joins them
+    :param rows: build rows_table batches rather than fields_table ones
+    """
+    if batch_size < 1:
+        raise IDPException('batch_size must be at least 1')
+    batch = []
+    for result in results:
+        batch.append(result)
+        if len(batch) == batch_size:
+            yield rows_table(batch, table, numeric) if rows else fields_table(batch, numeric)
+            batch = []
+    if batch:
+        yield rows_table(batch, table, numeric) if rows else fields_table(batch, numeric)
@@ -0,0 +1,298 @@
+"""
+Bulk export of the results of many extraction tasks to JSONL, CSV or Parquet files, see :func:`export_results`.
+Parquet needs pyarrow (``pip install 6estates-idp[parquet]``).
+"""
+import csv
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from .api import IDPException
+from .history import iter_task_history
+from .results import ExtractionResult, Result
+
+FORMATS = ('jsonl', 'csv', 'parquet')
+# columns of every row, before the field codes
+RESULT_COLUMNS = ('application_id', 'file_type', 'status')
+# columns of every row of the table rows exports
+ROW_COLUMNS = RESULT_COLUMNS + ('table', 'row_index')
+# json object of the fields whose code is not a column of the file
+EXTRA_COLUMN = 'extra_fields'
+# keys of the file type in the history records and the result payloads
+FILE_TYPE_KEYS = ('fileTypeCode', 'fileType')
+
+
+def _text(value):
+    """
+    return the value as stored in the files, every field is a string so that the schema does not change
+    with the values
+    """
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def _file_type(mapping):
+    for key in FILE_TYPE_KEYS:
+        if isinstance(mapping, dict) and mapping.get(key) is not None:
+            return str(mapping[key])
+    return None
+
+
+def result_rows(result, file_type=None, rows=False, table=None):
+    """
+    yield the rows exported for a result, dicts of column -> value
+
+    :param result: extraction result, a dict or a :class:`sixe_idp.results.Result`
+    :param file_type: file type code of the task, read from the result when None
+    :param rows: one row per row of the table fields, with the table and row_index columns, rather than one row
+        per result whose table fields are json texts
+    :param table: field code of the table whose rows are exported, all the tables if None
+    """
+    if not isinstance(result, ExtractionResult):
+        result = ExtractionResult(raw=result.raw if isinstance(result, Result) else result)
+    row = {'application_id': result.application_id, 'file_type': file_type or _file_type(result.data),
+           'status': result.status}
+    if not rows:
+        for field in result.fields:
+            row.setdefault(field.code, _text(field.value))
+        yield row
+        return
+    for field_table in result.tables:
+        if table is not None and field_table.code != table:
+            continue
+        for index, record in enumerate(field_table.records()):
+            table_row = dict(row, table=field_table.code, row_index=index)
+            for code, value in record.items():
+                table_row.setdefault(code, _text(value))
+            yield table_row
+
+
+class _JsonlWriter(object):
+    def __init__(self, path, columns):
+        self.columns = columns
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def write(self, rows):
+        self._file.write(''.join(json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + '\n'
+                                 for row in rows))
+
+    def close(self):
+        self._file.close()
+
+
+class _CsvWriter(object):
+    def __init__(self, path, columns):
+        self.columns = columns
+        self._file = open(path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetWriter(object):
+    def __init__(self, path, columns):
+        self.columns = columns
+        self._schema = pyarrow.schema([(name, pyarrow.int64() if name == 'row_index' else pyarrow.string())
+                                       for name in columns])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+
+    def write(self, rows):
+        # every flush is one row group
+        data = {name: list(values) for name, values in zip(self.columns, zip(*rows))}
+        self._writer.write_table(pyarrow.Table.from_pydict(data, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+WRITERS = {'jsonl': _JsonlWriter, 'csv': _CsvWriter, 'parquet': _ParquetWriter}
+
+
+class _Output(object):
+    """
+    one exported file, whose rows are buffered until a row group is full
+    """
+
+    def __init__(self, path, format, base_columns, fields, row_group_size):
+        self.path = path
+        self.format = format
+        self.base_columns = base_columns
+        self.fields = fields
+        self.row_group_size = row_group_size
+        self.writer = None
+        self.rows = []
+        self.count = 0
+
+    def append(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        if self.writer is None:
+            fields = self.fields
+            if fields is None:
+                # schema of the file fixed by the field codes of its first row group
+                fields = list(dict.fromkeys(code for row in self.rows for code in row
+                                            if code not in self.base_columns))
+            columns = list(self.base_columns) + [f for f in fields if f not in self.base_columns] + [EXTRA_COLUMN]
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.writer = WRITERS[self.format](self.path, columns)
+        columns = self.writer.columns[:-1]
+        known = set(columns)
+        values = []
+        for row in self.rows:
+            extra = {code: value for code, value in row.items() if code not in known}
+            values.append([row.get(name) for name in columns] +
+                          [json.dumps(extra, ensure_ascii=False) if extra else None])
+        self.writer.write(values)
+        self.count += len(values)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ExportSummary(object):
+    """
+        The :class:`ExportSummary <ExportSummary>` object, which holds the outcome of a bulk export.
+    """
+
+    def __init__(self):
+        # path -> number of rows written
+        self.files = {}
+        self.results = 0
+        # (application id, exception) of the results which could not be fetched
+        self.failed = []
+
+    @property
+    def rows(self):
+        return sum(self.files.values())
+
+    def __repr__(self):
+        return f'<ExportSummary results={self.results} rows={self.rows} files={len(self.files)} ' \
+               f'failed={len(self.failed)}>'
+
+
+def _tasks(client, application_ids, history):
+    """
+    yield the (application id, file type) of the tasks to export
+    """
+    if application_ids is not None:
+        for task in application_ids:
+            if isinstance(task, dict):
+                yield str(task.get('applicationId', task.get('id'))), _file_type(task)
+            else:
+                yield str(task), None
+    if history is not None:
+        for record in iter_task_history(client, **history):
+            yield str(record.get('applicationId', record.get('id'))), _file_type(record)
+
+
+def export_results(client, dest, application_ids=None, history=None, format=None, fields=None, rows=False,
+                   table=None, file_type=None, max_concurrency=8, row_group_size=1000):
+    """
+    Fetch the extraction results of many tasks on a pool of worker threads and write them incrementally, one row
+    per result or per table row. The memory used is bounded by row_group_size rows per file and max_concurrency
+    results in flight, not by the number of tasks.
+
+    Every file has a stable schema: application_id, file_type and status, the table and row_index columns for the
+    table rows, a column per field code and an extra_fields column holding the json object of the fields which
+    have no column. The values are strings, except row_index. The field codes are given by fields, or otherwise
+    those of the first row group of the file.
+
+    :param client: :class:`sixe_idp.api.Client`
+    :param dest: path of the file, or a template such as 'out/{file_type}.parquet' writing a file per file type
+    :type dest: str
+    :param application_ids: iterable of application ids, or of task history records
+    :param history: filters of extraction_task_history_iter, e.g. {'fileTypeCode': 'CBKS', 'status': 3}, exporting
+        the tasks of the history, after the application_ids if both are given
+    :type history: dict
+    :param format: jsonl, csv or parquet, by default the extension of dest
+    :type format: str
+    :param fields: field codes of the columns, a list, or a dict of file type -> list
+    :param rows: export the rows of the table fields rather than one row per result
+    :type rows: bool
+    :param table: field code of the table whose rows are exported, all of them if None
+    :param file_type: file type of the tasks whose history record does not tell it
+    :param max_concurrency: number of results fetched at once
+    :type max_concurrency: int
+    :param row_group_size: rows buffered per file before being written, and rows per Parquet row group
+    :type row_group_size: int
+    :rtype: :class:`ExportSummary <ExportSummary>`
+    """
+    if application_ids is None and history is None:
+        raise IDPException('application_ids or history is required')
+    if format is None:
+        format = os.path.splitext(dest)[1].lstrip('.').lower()
+    if format not in FORMATS:
+        raise IDPException(f"format must be one of {', '.join(FORMATS)}")
+    if format == 'parquet' and pyarrow is None:
+        raise IDPException('pyarrow is required to export to Parquet: pip install 6estates-idp[parquet]')
+    if max_concurrency < 1:
+        raise IDPException('max_concurrency must be at least 1')
+    if row_group_size < 1:
+        raise IDPException('row_group_size must be at least 1')
+
+    base_columns = ROW_COLUMNS if rows else RESULT_COLUMNS
+    summary = ExportSummary()
+    outputs = {}
+    pending = {}
+
+    def write(result, task_file_type):
+        for row in result_rows(result, task_file_type, rows=rows, table=table):
+            path = dest.format(file_type=row['file_type'] or 'unknown') if '{file_type}' in dest else dest
+            output = outputs.get(path)
+            if output is None:
+                file_fields = fields.get(row['file_type']) if isinstance(fields, dict) else fields
+                output = outputs[path] = _Output(path, format, base_columns, file_fields, row_group_size)
+            output.append(row)
+
+    def finished(futures):
+        for future in futures:
+            application_id, task_file_type = pending.pop(future)
+            error = future.exception()
+            if error is not None:
+                summary.failed.append((application_id, error))
+                continue
+            write(future.result(), task_file_type)
+            summary.results += 1
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        try:
+            for application_id, task_file_type in _tasks(client, application_ids, history):
+                while len(pending) >= max_concurrency:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    finished(done)
+                future = executor.submit(client.extraction_result, application_id)
+                pending[future] = (application_id, task_file_type or file_type)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                finished(done)
+        finally:
+            for future in pending:
+                future.cancel()
+            for output in outputs.values():
+                output.close()
+                summary.files[output.path] = output.count
+    return summary
@@ -0,0 +1,336 @@
+"""
+Iteration over the IDP task history, see :meth:`sixe_idp.api.Client.extraction_task_history_iter`,
+and its local mirror :class:`HistoryStore`
+"""
+import calendar
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .api import IDPException
+
+# keys under which the records of a history page can be found
+RECORDS_KEYS = ('records', 'list', 'rows', 'content', 'data')
+# keys under which the total number of records can be found
+TOTAL_KEYS = ('total', 'totalCount', 'totalElements')
+
+
+def history_records(payload):
+    """
+    return the task records of a history page
+    """
+    data = payload.get('data') if isinstance(payload, dict) else None
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        for key in RECORDS_KEYS:
+            if isinstance(data.get(key), list):
+                return data[key]
+        return []
+    if data is None:
+        return []
+    raise IDPException(f'Unexpected task history page: {payload!r}')
+
+
+def history_total(payload):
+    """
+    return the total number of records matching the filters, if the page tells it
+    """
+    data = payload.get('data') if isinstance(payload, dict) else None
+    if isinstance(data, dict):
+        for key in TOTAL_KEYS:
+            if isinstance(data.get(key), int):
+                return data[key]
+    return None
+
+
+def iter_task_history(client, limit=100, prefetch=4, max_pages=None, **filters):
+    """
+    Iterate over all the task records matching the filters, in the order of the pages, fetching up to
+    prefetch pages at once. It stops after the last page, i.e. the first short or empty one.
+
+    :param client: :class:`sixe_idp.api.Client`
+    :param limit: records per page
+    :type limit: int
+    :param prefetch: number of pages fetched concurrently ahead of the one being consumed
+    :type prefetch: int
+    :param max_pages: stop after this many pages, None means no limit
+    :type max_pages: int
+    :param filters: params of extraction_task_history, e.g. status, fileTypeCode, edited, hitl, startCreateTime,
+        endCreateTime, sortColumn and sortOrder. Sorting by ascending create time keeps the walk stable
+        while new tasks are created.
+    """
+    if limit < 1:
+        raise IDPException("limit must be at least 1")
+    if prefetch < 1:
+        raise IDPException("prefetch must be at least 1")
+    filters.pop('page', None)
+    last_page = max_pages
+    next_page = 1
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=prefetch) as executor:
+        try:
+            while True:
+                while len(pending) < prefetch and (last_page is None or next_page <= last_page):
+                    pending.append((next_page, executor.submit(client.extraction_task_history, page=next_page,
+                                                               limit=limit, **filters)))
+                    next_page += 1
+                if not pending:
+                    return
+                page, future = pending.popleft()
+                payload = future.result()
+                records = history_records(payload)
+                total = history_total(payload)
+                if total is not None:
+                    pages = max(1, -(-total // limit))
+                    last_page = pages if last_page is None else min(last_page, pages)
+                if len(records) < limit:
+                    last_page = page
+                yield from records
+                if last_page is not None and page >= last_page:
+                    return
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+# history statuses of the tasks still being processed, whose record will change
+PENDING_HISTORY_STATUSES = {1, 5, '1', '5', 'Init', 'Doing', 'On Process', 'Processing', 'Pending'}
+
+
+def _field(record, *keys):
+    for key in keys:
+        if record.get(key) is not None:
+            return record[key]
+    return None
+
+
+def _create_time(record):
+    """
+    return the create time of a record as a sortable 'yyyy-MM-dd HH:mm:ss' string
+    """
+    value = _field(record, 'createTime', 'create_time', 'gmtCreate', 'createdAt')
+    if isinstance(value, (int, float)):
+        # epoch, in milliseconds when too large for seconds
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(value / 1000 if value > 1e11 else value))
+    return str(value) if value is not None else ''
+
+
+def _record_key(record):
+    task_id = _field(record, 'id', 'applicationId', 'taskId')
+    task_id = str(task_id) if task_id is not None else ''
+    return _create_time(record), int(task_id) if task_id.isdigit() else 0, task_id
+
+
+def _row(record, key):
+    status = _field(record, 'status', 'taskStatus')
+    return (str(_field(record, 'applicationId', 'id', 'taskId')), key[2], key[0],
+            None if status is None else str(status), _field(record, 'fileTypeCode', 'fileType'),
+            _field(record, 'fileName', 'name'), json.dumps(record), time.time())
+
+
+class HistoryStore(object):
+    def __init__(self, path):
+        """
+        Local mirror of the task history in a sqlite database, indexed by application id, status and file type.
+        sync() fetches only the tasks created since the last sync, i.e. the high-water mark on create time and id,
+        the tasks still being processed are fetched again until they finish.
+
+        :param path: path of the sqlite database
+        :type path: str
+
+            store = HistoryStore('/var/lib/idp/history.sqlite3')
+            store.sync(client)
+            failed = store.query(status=0, file_type='CBKS', since='2024-05-20')
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS tasks (application_id TEXT PRIMARY KEY, task_id TEXT, '
+                             'create_time TEXT, status TEXT, file_type TEXT, file_name TEXT, record TEXT NOT NULL, '
+                             'synced REAL NOT NULL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, create_time)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS tasks_file_type ON tasks (file_type, create_time)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS tasks_create_time ON tasks (create_time)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, create_time TEXT, '
+                             'task_number INTEGER, task_id TEXT, synced REAL)')
+
+    def high_water_mark(self, name='default'):
+        """
+        return the (create time, id) from which the next sync starts, None before the first one
+        """
+        with self._lock:
+            row = self._db.execute('SELECT create_time, task_number, task_id FROM sync_state WHERE name = ?',
+                                   (name,)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def sync(self, client, name='default', limit=100, prefetch=4, batch_size=500, **filters):
+        """
+        Fetch the tasks created since the high-water mark, newest first, and upsert them by batches, so that an
+        interrupted sync keeps what it fetched. The tasks stored as still being processed and created before the
+        mark are refreshed by listing again only the days they were created on.
+        :param client: :class:`sixe_idp.api.Client`
+        :param name: name of the high-water mark, different filters need different names
+        :param batch_size: records upserted at once
+        :param filters: filters of extraction_task_history, e.g. fileTypeCode
+        :returns: number of tasks upserted
+        """
+        mark = self.high_water_mark(name)
+        start = None
+        if mark is not None and mark[0]:
+            # one day earlier, the server filters on its local date
+            day = time.strptime(mark[0][:10], '%Y-%m-%d')
+            start = time.strftime('%Y-%m-%d', time.gmtime(calendar.timegm(day) - 86400))
+            filters.setdefault('startCreateTime', start)
+        count = 0
+        newest = mark
+        rows = []
+        for record in iter_task_history(client, limit=limit, prefetch=prefetch, sortColumn='create_time',
+                                        sortOrder='descending', **filters):
+            key = _record_key(record)
+            if mark is not None and key < mark:
+                break
+            newest = max(newest, key) if newest is not None else key
+            rows.append(_row(record, key))
+            if len(rows) >= batch_size:
+                count += self._upsert(rows)
+                rows = []
+        count += self._upsert(rows)
+        if start is not None:
+            count += self._refresh_pending(client, mark[0], limit, prefetch, filters)
+        if newest is not None and newest != mark:
+            with self._lock, self._db:
+                self._db.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?, ?)',
+                                 (name,) + newest + (time.time(),))
+        return count
+
+    def _upsert(self, rows):
+        if rows:
+            with self._lock, self._db:
+                self._db.executemany('INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def _refresh_pending(self, client, until, limit, prefetch, filters):
+        """
+        list again the days of the stored tasks still being processed and created until the high-water mark,
+        which the sync stopped at, and upsert their records
+        """
+        statuses = sorted(str(status) for status in PENDING_HISTORY_STATUSES)
+        sql = (f"SELECT DISTINCT substr(create_time, 1, 10) FROM tasks WHERE status IN "
+               f"({', '.join('?' * len(statuses))}) AND create_time <= ?")
+        params = statuses + [until]
+        if filters.get('fileTypeCode') is not None:
+            sql += ' AND file_type = ?'
+            params.append(filters['fileTypeCode'])
+        with self._lock:
+            days = [row[0] for row in self._db.execute(sql, params) if row[0]]
+        count = 0
+        for day in days:
+            day_filters = dict(filters, startCreateTime=day, endCreateTime=day)
+            rows = [_row(record, _record_key(record))
+                    for record in iter_task_history(client, limit=limit, prefetch=prefetch, **day_filters)]
+            count += self._upsert(rows)
+        return count
+
+    def query(self, status=None, file_type=None, since=None, until=None, limit=None):
+        """
+        return the stored task records matching the filters, newest first
+        :param status: status of the tasks, as returned by the history
+        :param file_type: file type code, e.g. CBKS
+        :param since: first create time, e.g. '2024-05-20' or '2024-05-20 08:00:00'
+        :param until: last create time, a date includes the whole day
+        """
+        clauses, params = [], []
+        if status is not None:
+            clauses.append('status = ?')
+            params.append(str(status))
+        if file_type is not None:
+            clauses.append('file_type = ?')
+            params.append(file_type)
+        if since is not None:
+            clauses.append('create_time >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('create_time <= ?')
+            params.append(until + ' 23:59:59.999' if len(until) == 10 else until)
+        sql = 'SELECT record FROM tasks'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY create_time DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            return [json.loads(row[0]) for row in self._db.execute(sql, params)]
+
+    def get(self, application_id):
+        with self._lock:
+            row = self._db.execute('SELECT record FROM tasks WHERE application_id = ?',
+                                   (str(application_id),)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM tasks').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def main(argv=None):
+    """
+    command line sync and query of a HistoryStore, the credentials are read from IDP_CLIENT_ID and
+    IDP_CLIENT_SECRET when not given
+    """
+    import argparse
+
+    from .api import Client, OauthClient
+
+    parser = argparse.ArgumentParser(prog='sixe-idp-history', description='Mirror the IDP task history locally')
+    parser.add_argument('--db', required=True, help='path of the sqlite database')
+    commands = parser.add_subparsers(dest='command', required=True)
+    sync = commands.add_parser('sync', help='fetch the tasks created since the last sync')
+    sync.add_argument('--host', default='https://idp-sea.6estates.com')
+    sync.add_argument('--oauth-url', default='https://oauth-sea.6estates.com/api/token')
+    sync.add_argument('--client-id', default=os.environ.get('IDP_CLIENT_ID'))
+    sync.add_argument('--client-secret', default=os.environ.get('IDP_CLIENT_SECRET'))
+    sync.add_argument('--file-type', help='only sync the tasks of this file type code')
+    sync.add_argument('--limit', type=int, default=100, help='tasks per page')
+    sync.add_argument('--prefetch', type=int, default=4, help='pages fetched at once')
+    query = commands.add_parser('query', help='print the stored tasks as json lines')
+    query.add_argument('--status')
+    query.add_argument('--file-type')
+    query.add_argument('--since')
+    query.add_argument('--until')
+    query.add_argument('--limit', type=int)
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.db)
+    try:
+        if args.command == 'sync':
+            if not args.client_id or not args.client_secret:
+                parser.error('--client-id and --client-secret (or IDP_CLIENT_ID and IDP_CLIENT_SECRET) are required')
+            oauth_client = OauthClient(oauth2_authorization_url=args.oauth_url, client_id=args.client_id,
+                                       client_secret=args.client_secret, auto_refresh=False)
+            client = Client(http_host=args.host, oauth_client=oauth_client)
+            filters = {'fileTypeCode': args.file_type} if args.file_type else {}
+            name = f'fileTypeCode={args.file_type}' if args.file_type else 'default'
+            count = store.sync(client, name=name, limit=args.limit, prefetch=args.prefetch, **filters)
+            print(f'{count} tasks synced, {len(store)} stored')
+        else:
+            for record in store.query(status=args.status, file_type=args.file_type, since=args.since,
+                                      until=args.until, limit=args.limit):
+                print(json.dumps(record))
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Lifecycle hooks of the api calls of :class:`sixe_idp.api.Client`, see :class:`Hooks`
+"""
+import threading
+
+BEFORE_REQUEST = 'before_request'
+AFTER_RESPONSE = 'after_response'
+ON_RETRY = 'on_retry'
+ON_TOKEN_REFRESH = 'on_token_refresh'
+ON_ERROR = 'on_error'
+EVENTS = (BEFORE_REQUEST, AFTER_RESPONSE, ON_RETRY, ON_TOKEN_REFRESH, ON_ERROR)
+
+
+class RequestEvent(object):
+    """
+    One attempt of an api call, passed to the hooks:
+
+    - **endpoint** name of the api, e.g. extraction_result or oauth_token
+    - **family** create, status, export or history
+    - **method** and **url** of the call
+    - **application_id** of the task the call is about, once known for the create calls
+    - **attempt** number of the attempt, from 1
+    - **status_code** http status of the response, None before it or when the call failed
+    - **bytes_sent** and **bytes_received** sizes of the bodies, None when unknown, e.g. for streamed exports
+      without a Content-Length
+    - **timings** seconds spent in each step: encode (multipart form), token (refresh), limiter (wait for a slot),
+      network (send and receive until the body is read, or its headers for streamed exports), decode (json)
+      and total
+    - **delay** seconds waited before the next attempt, for on_retry
+    - **error** exception of the call, for on_retry and on_error
+    - **payload** decoded json body of the response, for after_response, None for the exports
+    """
+    __slots__ = ('endpoint', 'family', 'method', 'url', 'application_id', 'attempt', 'status_code', 'bytes_sent',
+                 'bytes_received', 'timings', 'delay', 'error', 'payload')
+
+    def __init__(self, endpoint, family=None, method=None, url=None, application_id=None, attempt=1, timings=None):
+        self.endpoint = endpoint
+        self.family = family
+        self.method = method
+        self.url = url
+        self.application_id = application_id
+        self.attempt = attempt
+        self.status_code = None
+        self.bytes_sent = None
+        self.bytes_received = None
+        self.timings = timings if timings is not None else {}
+        self.delay = None
+        self.error = None
+        self.payload = None
+
+    def __repr__(self):
+        return f'<RequestEvent {self.endpoint} attempt={self.attempt} status={self.status_code}>'
+
+
+class Hooks(object):
+    def __init__(self):
+        """
+        Registry of the handlers called on the lifecycle events of the api calls, each with a
+        :class:`RequestEvent <RequestEvent>`:
+
+        - **before_request** before every attempt, the timings only hold the multipart encoding
+        - **after_response** once the response of the last attempt is received, and decoded if it is json
+        - **on_retry** after a failed attempt which is retried, before waiting the delay
+        - **on_token_refresh** after the oauth token was refreshed
+        - **on_error** when a call fails without a response to decode: network errors once the retries are
+          exhausted, throttling, a failed token refresh or a body which is not json. The http error statuses come
+          with after_response, and their status_code
+
+        The handlers run in the thread making the call, and their exceptions are raised by the call.
+        A client without handlers only pays a truth test per call.
+
+            client.hooks.register('after_response', lambda event: tracer.record(event.endpoint, event.timings))
+
+            @client.hooks.register('on_retry')
+            def retried(event):
+                print(event.endpoint, event.attempt, event.error or event.status_code, event.delay)
+        """
+        self._lock = threading.Lock()
+        # event -> tuple of handlers, the tuples are replaced rather than changed so that emit needs no lock
+        self._handlers = {}
+
+    def register(self, event, handler=None):
+        """
+        register handler(event) for the event, usable as a decorator when handler is not given
+        """
+        if event not in EVENTS:
+            # imported here, sixe_idp.api imports this module
+            from .api import IDPException
+
+            raise IDPException(f"event must be one of {', '.join(EVENTS)}")
+        if handler is None:
+            return lambda f: self.register(event, f)
+        with self._lock:
+            self._handlers[event] = self._handlers.get(event, ()) + (handler,)
+        return handler
+
+    def unregister(self, event, handler):
+        with self._lock:
+            handlers = tuple(h for h in self._handlers.get(event, ()) if h != handler)
+            if handlers:
+                self._handlers[event] = handlers
+            else:
+                self._handlers.pop(event, None)
+
+    def clear(self):
+        with self._lock:
+            self._handlers = {}
+
+    def __contains__(self, event):
+        return event in self._handlers
+
+    def __bool__(self):
+        return bool(self._handlers)
+
+    def emit(self, event, payload):
+        for handler in self._handlers.get(event, ()):
+            handler(payload)
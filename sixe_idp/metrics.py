@@ -0,0 +1,438 @@
+"""
+Counters and histograms of the api calls of :class:`sixe_idp.api.Client`, exposed in the Prometheus text format,
+see :func:`instrument` and :func:`start_http_server`
+"""
+import math
+import threading
+import weakref
+from collections import OrderedDict
+
+from .api import TERMINAL_STATUSES, IDPException
+from .cache import result_status
+from .hooks import AFTER_RESPONSE, ON_ERROR, ON_RETRY, ON_TOKEN_REFRESH
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# seconds, from a cached status call to a large export
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return f'{value:.1f}'
+    return repr(value)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric(object):
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        # label values -> value
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labels):
+            raise IDPException(f'{self.name} takes the labels {", ".join(self.labels)}')
+        return tuple(str(v) for v in labels)
+
+    def value(self, *labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        """
+        yield the (suffix, label values, extra label, value) of the metric
+        """
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, value in items:
+            yield '', values, None, value
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {_escape(self.documentation)}', f'# TYPE {self.name} {self.type}']
+        for suffix, values, extra, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(self.labels, values, extra)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, *labels, value):
+        """
+        set the counter, to mirror a counter kept by another object
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def set(self, *labels, value):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def replace(self, values):
+        """
+        set the series to values, a dict of label values tuple -> value, and the other series to 0
+        """
+        values = {self._key(labels): value for labels, value in values.items()}
+        with self._lock:
+            series = dict.fromkeys(self._values, 0)
+            series.update(values)
+            self._values = series
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *labels, value):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # one count per bucket, then the +Inf one, and the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def count(self, *labels):
+        counts = self._values.get(self._key(labels))
+        return sum(counts[:-1]) if counts is not None else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((values, list(counts)) for values, counts in self._values.items())
+        for values, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield '_bucket', values, ('le', _format_value(float(bound))), cumulative
+            yield '_sum', values, None, counts[-1]
+            yield '_count', values, None, cumulative
+
+
+class MetricsRegistry(object):
+    def __init__(self):
+        """
+        Metrics of one process, and the collectors refreshing the gauges read from other objects,
+        e.g. the caches, before each exposition
+        """
+        self._lock = threading.Lock()
+        self._metrics = OrderedDict()
+        self._collectors = []
+        # ClientMetrics shared by the clients given to instrument()
+        self.client_metrics = None
+
+    def _register(self, cls, name, documentation, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labels, **kwargs)
+            elif not isinstance(metric, cls) or metric.labels != tuple(labels):
+                raise IDPException(f'metric {name} is already registered with another type or labels')
+            return metric
+
+    def counter(self, name, documentation, labels=()):
+        """
+        return the counter of the name, created on first use
+        """
+        return self._register(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, labels=()):
+        return self._register(Gauge, name, documentation, labels)
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, documentation, labels, buckets=buckets)
+
+    def add_collector(self, collector):
+        """
+        call collector() before each exposition, to set the gauges read from other objects
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def exposition(self):
+        """
+        return the metrics in the Prometheus text format
+        """
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics.values())
+        for collector in collectors:
+            collector()
+        return '\n'.join(metric.exposition() for metric in metrics) + '\n'
+
+
+# registry of the module level functions
+REGISTRY = MetricsRegistry()
+
+
+class ClientMetrics(object):
+    def __init__(self, registry=REGISTRY, max_tracked_tasks=100000):
+        """
+        Metrics of the api calls of the clients given to instrument(), all of them sharing the same series:
+
+        - **sixe_idp_requests_total** calls per endpoint and http status, or error when no response was received
+        - **sixe_idp_request_duration_seconds** histogram of the call durations per endpoint, retries excluded
+        - **sixe_idp_request_phase_seconds_total** seconds spent per endpoint in each phase of the calls: encode,
+          token, limiter, network and decode
+        - **sixe_idp_retries_total** and **sixe_idp_errors_total** retried attempts and failed calls per endpoint
+        - **sixe_idp_uploaded_bytes_total** and **sixe_idp_downloaded_bytes_total** body sizes per endpoint
+        - **sixe_idp_token_refreshes_total** and **sixe_idp_token_refresh_seconds_total**
+        - **sixe_idp_tasks_submitted_total** per endpoint and **sixe_idp_tasks_finished_total** per final status
+        - **sixe_idp_tasks_inflight** tasks submitted or polled by this process and not finished, per last known status
+        - **sixe_idp_cache_lookups_total**, **sixe_idp_cache_hit_ratio** and **sixe_idp_cache_entries** per cache
+        - **sixe_idp_rate_limit_concurrency**, **sixe_idp_rate_limit_inflight** and
+          **sixe_idp_rate_limit_throttled_total** per endpoint family
+
+        :param registry: :class:`MetricsRegistry <MetricsRegistry>` of the metrics
+        :param max_tracked_tasks: number of unfinished tasks tracked for sixe_idp_tasks_inflight, the oldest ones
+            are forgotten beyond it
+        :type max_tracked_tasks: int
+        """
+        self.registry = registry
+        self.max_tracked_tasks = max_tracked_tasks
+        self.requests = registry.counter('sixe_idp_requests_total', 'IDP api calls', ('endpoint', 'status'))
+        self.duration = registry.histogram('sixe_idp_request_duration_seconds', 'Duration of the IDP api calls',
+                                           ('endpoint',))
+        self.phases = registry.counter('sixe_idp_request_phase_seconds_total',
+                                       'Seconds spent in each phase of the IDP api calls', ('endpoint', 'phase'))
+        self.retries = registry.counter('sixe_idp_retries_total', 'Retried IDP api call attempts', ('endpoint',))
+        self.errors = registry.counter('sixe_idp_errors_total', 'IDP api calls failed without a response',
+                                       ('endpoint', 'error'))
+        self.uploaded = registry.counter('sixe_idp_uploaded_bytes_total', 'Bytes sent to the IDP api',
+                                         ('endpoint',))
+        self.downloaded = registry.counter('sixe_idp_downloaded_bytes_total', 'Bytes received from the IDP api',
+                                           ('endpoint',))
+        self.token_refreshes = registry.counter('sixe_idp_token_refreshes_total', 'Oauth token refreshes')
+        self.token_refresh_seconds = registry.counter('sixe_idp_token_refresh_seconds_total',
+                                                      'Seconds spent refreshing the oauth token')
+        self.submitted = registry.counter('sixe_idp_tasks_submitted_total', 'Tasks submitted', ('endpoint',))
+        self.finished = registry.counter('sixe_idp_tasks_finished_total', 'Tasks seen finished', ('status',))
+        self.inflight = registry.gauge('sixe_idp_tasks_inflight', 'Unfinished tasks by last known status',
+                                       ('status',))
+        self.cache_lookups = registry.counter('sixe_idp_cache_lookups_total', 'Cache lookups',
+                                              ('cache', 'result'))
+        self.cache_hit_ratio = registry.gauge('sixe_idp_cache_hit_ratio', 'Share of the cache lookups found',
+                                              ('cache',))
+        self.cache_entries = registry.gauge('sixe_idp_cache_entries', 'Entries of the cache', ('cache',))
+        self.limiter_concurrency = registry.gauge('sixe_idp_rate_limit_concurrency',
+                                                  'Concurrency limit of the endpoint family', ('family',))
+        self.limiter_inflight = registry.gauge('sixe_idp_rate_limit_inflight', 'Calls in flight of the family',
+                                               ('family',))
+        self.limiter_throttled = registry.counter('sixe_idp_rate_limit_throttled_total',
+                                                  'Calls of the family throttled by the server', ('family',))
+        self._lock = threading.Lock()
+        # application id -> last known status of the unfinished tasks
+        self._tasks = OrderedDict()
+        # id -> object whose stats are collected, so that shared caches and limiters are counted once
+        self._sources = {}
+        # the clients whose hooks are registered, which are only registered once
+        self._clients = weakref.WeakSet()
+        registry.add_collector(self.collect)
+
+    def instrument(self, client):
+        """
+        register the hooks of the metrics on the client, and collect the stats of its caches and rate limiter,
+        a client already instrumented is left as is
+        """
+        with self._lock:
+            if client in self._clients:
+                return client
+            self._clients.add(client)
+        client.hooks.register(AFTER_RESPONSE, self.on_response)
+        client.hooks.register(ON_RETRY, self.on_retry)
+        client.hooks.register(ON_ERROR, self.on_error)
+        client.hooks.register(ON_TOKEN_REFRESH, self.on_token_refresh)
+        with self._lock:
+            for kind, source in (('submission', client.submission_cache), ('result', client.result_cache),
+                                 ('limiter', client.rate_limiter)):
+                if source is not None:
+                    self._sources[id(source)] = (kind, source)
+        return client
+
+    def on_response(self, event):
+        endpoint = event.endpoint
+        self.requests.inc(endpoint, event.status_code)
+        total = event.timings.get('total')
+        if total is not None:
+            self.duration.observe(endpoint, value=total)
+        for phase, seconds in event.timings.items():
+            if phase != 'total':
+                self.phases.inc(endpoint, phase, amount=seconds)
+        self._count_bytes(event)
+        if event.payload is None or event.application_id is None:
+            return
+        if event.family == 'create':
+            self.submitted.inc(endpoint)
+            self._track(event.application_id, 'Submitted')
+        elif event.family == 'status':
+            status = result_status(event.payload)
+            if status is not None:
+                self._track(event.application_id, status)
+
+    def on_retry(self, event):
+        self.retries.inc(event.endpoint)
+        self._count_bytes(event)
+
+    def on_error(self, event):
+        self.requests.inc(event.endpoint, event.status_code or 'error')
+        self.errors.inc(event.endpoint, type(event.error).__name__)
+
+    def on_token_refresh(self, event):
+        self.token_refreshes.inc()
+        self.token_refresh_seconds.inc(amount=event.timings.get('token', 0.0))
+
+    def _count_bytes(self, event):
+        if event.bytes_sent:
+            self.uploaded.inc(event.endpoint, amount=event.bytes_sent)
+        if event.bytes_received:
+            self.downloaded.inc(event.endpoint, amount=event.bytes_received)
+
+    def _track(self, application_id, status):
+        with self._lock:
+            if status in TERMINAL_STATUSES:
+                # counted once, when a tracked task is first seen finished
+                if self._tasks.pop(application_id, None) is not None:
+                    self.finished.inc(status)
+                return
+            self._tasks[application_id] = status
+            self._tasks.move_to_end(application_id)
+            while len(self._tasks) > self.max_tracked_tasks:
+                self._tasks.popitem(last=False)
+
+    def collect(self):
+        """
+        set the gauges of the tracked tasks, caches and rate limiters
+        """
+        with self._lock:
+            counts = {}
+            for status in self._tasks.values():
+                counts[status] = counts.get(status, 0) + 1
+            sources = list(self._sources.values())
+        self.inflight.replace({(status,): count for status, count in counts.items()})
+        # the caches and limiters of the same kind of several clients are summed into one series
+        caches = {}
+        families = {}
+        for kind, source in sources:
+            stats = source.stats
+            if kind == 'limiter':
+                for family, family_stats in stats.items():
+                    total = families.setdefault(family, {'limit': 0, 'inflight': 0, 'throttled': 0})
+                    for key in total:
+                        total[key] += family_stats[key]
+                continue
+            total = caches.setdefault(kind, {'hits': 0, 'misses': 0, 'size': 0})
+            total['hits'] += stats['hits'] + stats.get('disk_hits', 0)
+            total['misses'] += stats['misses']
+            total['size'] += stats['size']
+        for family, total in families.items():
+            self.limiter_concurrency.set(family, value=total['limit'])
+            self.limiter_inflight.set(family, value=total['inflight'])
+            self.limiter_throttled.set(family, value=total['throttled'])
+        for kind, total in caches.items():
+            lookups = total['hits'] + total['misses']
+            self.cache_lookups.set(kind, 'hit', value=total['hits'])
+            self.cache_lookups.set(kind, 'miss', value=total['misses'])
+            self.cache_hit_ratio.set(kind, value=total['hits'] / lookups if lookups else 0.0)
+            self.cache_entries.set(kind, value=total['size'])
+
+
+_instrument_lock = threading.Lock()
+
+
+def instrument(client, registry=None):
+    """
+    Record the metrics of the client calls in the registry, the module one by default
+    :param client: :class:`sixe_idp.api.Client`
+    :param registry: :class:`MetricsRegistry <MetricsRegistry>`, REGISTRY if None
+    :returns: the client
+
+        client = instrument(Client(http_host, oauth_client))
+        start_http_server(9464)
+    """
+    registry = registry if registry is not None else REGISTRY
+    with _instrument_lock:
+        if registry.client_metrics is None:
+            registry.client_metrics = ClientMetrics(registry)
+    return registry.client_metrics.instrument(client)
+
+
+def exposition(registry=REGISTRY):
+    """
+    return the metrics of the registry in the Prometheus text format
+    """
+    return registry.exposition()
+
+
+def metrics_app(registry=REGISTRY):
+    """
+    return a WSGI application serving the metrics of the registry, to mount in an existing web server
+    """
+    def app(environ, start_response):
+        body = registry.exposition().encode('utf-8')
+        start_response('200 OK', [('Content-Type', CONTENT_TYPE), ('Content-Length', str(len(body)))])
+        return [body]
+
+    return app
+
+
+def start_http_server(port, host='0.0.0.0', registry=REGISTRY):
+    """
+    serve the metrics of the registry on http://host:port/ from a daemon thread, and return the server,
+    call shutdown() on it to stop
+    """
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = make_server(host, port, metrics_app(registry), server_class=ThreadingWSGIServer,
+                         handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, name='sixe-idp-metrics', daemon=True).start()
+    return server
@@ -0,0 +1,557 @@
+"""
+Local stand-in of the IDP api for offline tests and load generation, see :class:`MockIDPServer`
+"""
+import hashlib
+import heapq
+import http.server
+import io
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from .api import build_sha256_str
+from .callback import SIGNATURE_HEADER, _boundary, _MultipartParser, send_callback
+
+# size of the chunks read from the request bodies
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def constant(seconds):
+    """
+    distribution always returning seconds
+    """
+    return lambda rng: seconds
+
+
+def uniform(low, high):
+    return lambda rng: rng.uniform(low, high)
+
+
+def exponential(mean):
+    return lambda rng: rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+
+
+def lognormal(median, sigma):
+    """
+    distribution with a long tail, e.g. lognormal(0.05, 0.5) for latencies around 50ms
+    """
+    return lambda rng: rng.lognormvariate(math.log(median), sigma)
+
+
+def _distribution(value):
+    if value is None:
+        return constant(0.0)
+    if callable(value):
+        return value
+    return constant(float(value))
+
+
+class _MockTask(object):
+    __slots__ = ('application_id', 'family', 'created', 'done_at', 'final_status', 'params', 'file_name',
+                 'file_size')
+
+    def __init__(self, application_id, family, created, done_at, final_status, params, file_name, file_size):
+        self.application_id = application_id
+        self.family = family
+        self.created = created
+        self.done_at = done_at
+        self.final_status = final_status
+        self.params = params
+        self.file_name = file_name
+        self.file_size = file_size
+
+    @property
+    def status(self):
+        return self.final_status if time.time() >= self.done_at else 'Doing'
+
+    def record(self):
+        """
+        the history record of the task
+        """
+        status = self.status
+        return {'id': int(self.application_id), 'applicationId': self.application_id, 'fileName': self.file_name,
+                'fileTypeCode': self.params.get('fileType'), 'taskStatus': status,
+                'status': {'Doing': 1, 'Done': 3}.get(status, 0),
+                'createTime': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.created)),
+                'customerParam': self.params.get('customerParam'), 'remark': self.params.get('remark')}
+
+
+# path -> (handler, task family)
+ROUTES = {
+    '/api/token': ('token', None),
+    '/customer/extraction/fields/async': ('create', 'extraction'),
+    '/customer/extraction/field/async/result': ('extraction_result', 'extraction'),
+    '/customer/extraction/history/list': ('history', 'extraction'),
+    '/customer/extraction/task/to_hitl': ('add_hitl', 'extraction'),
+    '/customer/extraction/faas/analysis': ('create', 'faas'),
+    '/customer/extraction/faas/analysis/status': ('faas_status', 'faas'),
+    '/customer/extraction/faas/analysis/result': ('faas_result', 'faas'),
+    '/customer/extraction/faas/analysis/export': ('export', 'faas'),
+    '/customer/extraction/doc_agent/analysis': ('create', 'doc_agent'),
+    '/customer/extraction/doc_agent/status': ('status', 'doc_agent'),
+    '/customer/extraction/doc_agent/analysis/export': ('export', 'doc_agent'),
+    '/customer/extraction/fields/sync/cards': ('card_fields', None),
+    '/customer/extraction/split/ext/fields/async': ('create', 'split_and_extraction'),
+    '/customer/extraction/split/ext/status': ('status', 'split_and_extraction'),
+    '/customer/extraction/split/ext/download/zip': ('export', 'split_and_extraction'),
+}
+# unauthenticated route returning the stats of the server, e.g. to a load generator running in another process
+STATS_PATH = '/mock/stats'
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # the headers and the body are written separately, Nagle would delay the body until the client ack
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.mock._count('connections')
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.mock._handle(self)
+
+    def do_POST(self):
+        self.server.mock._handle(self)
+
+    def reply(self, status, body, content_type='application/json', headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MockIDPServer(object):
+    def __init__(self, host='127.0.0.1', port=0, latency=None, completion_time=2.0, error_rate=0.0,
+                 throttle_rate=0.0, max_concurrency=None, retry_after=1, fail_rate=0.0, export_size=64 * 1024,
+                 clients=None, callback_secret=None, signature_header=SIGNATURE_HEADER, seed=None):
+        """
+        In-process HTTP stand-in of the IDP api: the oauth2 token endpoint and every /customer/extraction route
+        used by :class:`sixe_idp.api.Client`. Tasks complete after a random time, and send their signed callback
+        when they were submitted with one.
+
+        :param latency: seconds added to every call, a number or a distribution, e.g. lognormal(0.05, 0.5)
+        :param completion_time: seconds a task takes to complete, a number or a distribution
+        :param error_rate: share of the calls answered with a 500
+        :type error_rate: float
+        :param throttle_rate: share of the calls answered with a 429
+        :type throttle_rate: float
+        :param max_concurrency: calls in flight beyond this number are answered with a 429, None means no limit
+        :type max_concurrency: int
+        :param retry_after: Retry-After seconds of the 429 answers
+        :param fail_rate: share of the tasks completing with the Fail status
+        :type fail_rate: float
+        :param export_size: size in bytes of the exported zip files
+        :type export_size: int
+        :param clients: client_id -> client_secret accepted by the token endpoint, None accepts any client
+        :type clients: dict
+        :param callback_secret: secret signing the callbacks, they are not signed if None
+        :param signature_header: header of the callback signatures
+        :param seed: seed of the random distributions
+
+            with MockIDPServer(latency=lognormal(0.02, 0.5), completion_time=uniform(1, 3)) as server:
+                oauth_client = OauthClient(oauth2_authorization_url=server.token_url, client_id='id', client_secret='s')
+                client = Client(http_host=server.url, oauth_client=oauth_client)
+        """
+        self.host = host
+        self.port = port
+        self.latency = _distribution(latency)
+        self.completion_time = _distribution(completion_time)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+        self.fail_rate = fail_rate
+        self.export_size = export_size
+        self.clients = clients
+        self.callback_secret = callback_secret
+        self.signature_header = signature_header
+        self.rng = random.Random(seed)
+        self.tasks = {}
+        self.tokens = set()
+        self.stats = {}
+        self._ids = itertools.count(100000)
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._exports = {}
+        self._callbacks = []
+        self._callback_cond = threading.Condition(self._lock)
+        self._callback_executor = None
+        self._server = None
+        self._threads = []
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+    @property
+    def token_url(self):
+        return f'{self.url}/api/token'
+
+    def start(self):
+        """
+        start serving from background threads
+        """
+        self._server = http.server.ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        self.port = self._server.server_address[1]
+        self._callback_executor = ThreadPoolExecutor(max_workers=4)
+        self._threads = [threading.Thread(target=self._server.serve_forever, name='sixe-idp-mock-server',
+                                          daemon=True),
+                         threading.Thread(target=self._run_callbacks, name='sixe-idp-mock-callbacks', daemon=True)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            self._server = None
+            self._callback_cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._callback_executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + value
+
+    def _random(self):
+        with self._lock:
+            return self.rng.random()
+
+    def _sample(self, distribution):
+        with self._lock:
+            return max(0.0, distribution(self.rng))
+
+    # request handling
+
+    def _read_body(self, request):
+        """
+        return the json or form fields of the request, the uploaded files are only measured
+        """
+        length = int(request.headers.get('Content-Length') or 0)
+        content_type = request.headers.get('Content-Type', '')
+        self._count('bytes_received', length)
+        if not content_type.startswith('multipart/'):
+            body = request.rfile.read(length)
+            try:
+                return json.loads(body) if body else {}, []
+            except ValueError:
+                return {}, []
+        fields, files, part = {}, [], {}
+
+        def on_part(headers):
+            part.clear()
+            part.update(name=headers.get_param('name', header='content-disposition'),
+                        filename=headers.get_param('filename', header='content-disposition'), data=bytearray(),
+                        size=0)
+
+        def on_data(data):
+            if part['filename'] is None:
+                part['data'] += data
+            part['size'] += len(data)
+
+        def on_end():
+            if part['filename'] is None:
+                fields[part['name']] = part['data'].decode('utf-8')
+            else:
+                files.append((part['filename'], part['size']))
+
+        parser = _MultipartParser(_boundary(content_type), on_part, on_data, on_end)
+        while length > 0:
+            chunk = request.rfile.read(min(READ_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            parser.feed(chunk)
+        return fields, files
+
+    def _handle(self, request):
+        split = urlsplit(request.path)
+        if split.path == STATS_PATH:
+            with self._lock:
+                request.reply(200, dict(self.stats))
+            return
+        route = ROUTES.get(split.path)
+        if route is None:
+            request.reply(404, {'code': 404, 'message': f'No route {split.path}'})
+            return
+        name, family = route
+        self._count('requests')
+        self._count(f'requests:{name}')
+        body, files = self._read_body(request)
+        if request.command == 'GET':
+            body = {k: v[-1] for k, v in parse_qs(split.query).items()}
+        with self._lock:
+            self._inflight += 1
+            overloaded = self.max_concurrency is not None and self._inflight > self.max_concurrency
+        try:
+            if overloaded or self._random() < self.throttle_rate:
+                self._count('throttled')
+                request.reply(429, {'code': 429, 'message': 'Too many requests'},
+                              headers={'Retry-After': str(self.retry_after)})
+                return
+            time.sleep(self._sample(self.latency))
+            if self._random() < self.error_rate:
+                self._count('errors')
+                request.reply(500, {'code': 500, 'message': 'Injected error'})
+                return
+            if name != 'token' and request.headers.get('Authorization') not in self.tokens:
+                request.reply(401, {'code': 401, 'message': 'Invalid authorization'})
+                return
+            status, payload = getattr(self, f'_{name}')(family, body, files)
+            if isinstance(payload, bytes):
+                request.reply(status, payload, content_type='application/octet-stream')
+            else:
+                request.reply(status, payload)
+        finally:
+            with self._lock:
+                self._inflight -= 1
+
+    @staticmethod
+    def _ok(data):
+        return 200, {'code': 200, 'message': 'success', 'data': data}
+
+    @staticmethod
+    def _error(status, message):
+        return status, {'code': status, 'message': message}
+
+    def _task(self, body):
+        application_id = body.get('applicationId', body.get('application_id'))
+        return self.tasks.get(str(application_id))
+
+    # routes
+
+    def _token(self, family, body, files):
+        client_id, timestamp = body.get('clientId'), body.get('timestamp')
+        if self.clients is not None:
+            secret = self.clients.get(client_id)
+            if secret is None or body.get('signature') != build_sha256_str(client_id, secret, timestamp):
+                return self._error(401, 'Invalid client')
+        token = hashlib.sha256(f'{client_id}{timestamp}{self._random()}'.encode('utf-8')).hexdigest()
+        with self._lock:
+            self.tokens.add(token)
+        return self._ok({'value': token, 'expired': False})
+
+    def _create(self, family, body, files):
+        if not files:
+            return self._error(400, 'File is required')
+        now = time.time()
+        final_status = 'Fail' if self._random() < self.fail_rate else 'Done'
+        task = _MockTask(str(next(self._ids)), family, now, now + self._sample(self.completion_time), final_status,
+                         body, files[0][0], sum(size for _, size in files))
+        with self._lock:
+            self.tasks[task.application_id] = task
+            if body.get('callback') or body.get('callbackUrl'):
+                heapq.heappush(self._callbacks, (task.done_at, task.application_id))
+                self._callback_cond.notify_all()
+        self._count('tasks')
+        return self._ok(task.application_id)
+
+    def _fields(self, task):
+        return [{'fieldCode': f'F_{task.params.get("fileType", "DOC")}_{i}', 'value': f'value {i}'} for i in range(5)]
+
+    def _extraction_result(self, family, body, files):
+        task = self._task(body)
+        if task is None:
+            return self._error(400, 'Task not found')
+        data = {'applicationId': task.application_id, 'taskStatus': task.status,
+                'customerParam': task.params.get('customerParam'), 'fileName': task.file_name}
+        if task.status == 'Done':
+            data['fields'] = self._fields(task)
+        return self._ok(data)
+
+    def _faas_status(self, family, body, files):
+        task = self._task(body)
+        if task is None:
+            return self._error(400, 'Task not found')
+        return self._ok({'applicationId': task.application_id, 'analysisStatus': task.status})
+
+    def _faas_result(self, family, body, files):
+        task = self._task(body)
+        if task is None or task.status != 'Done':
+            return self._error(400, 'Insight analysis not finished')
+        return self._ok({'applicationId': task.application_id, 'analysisStatus': 'Done',
+                         'insight': {'monthlyAverageBalance': 1000.0, 'transactions': 42}})
+
+    def _status(self, family, body, files):
+        task = self._task(body)
+        if task is None:
+            return self._error(400, 'Task not found')
+        return self._ok({'applicationId': task.application_id, 'status': task.status})
+
+    def _export_bytes(self, size):
+        """
+        a zip file of about size bytes, built once per size
+        """
+        with self._lock:
+            content = self._exports.get(size)
+        if content is None:
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+                zf.writestr('result.json', random.Random(size).randbytes(max(0, size - 200))
+                            if hasattr(random.Random, 'randbytes') else b'\0' * max(0, size - 200))
+            content = buffer.getvalue()
+            with self._lock:
+                self._exports[size] = content
+        return content
+
+    def _export(self, family, body, files):
+        task = self._task(body)
+        if task is None or task.status != 'Done':
+            return 400, {'code': 400, 'errorCode': 'EXPORT_NOT_READY', 'message': 'Task not finished'}
+        if family == 'split_and_extraction':
+            return 200, self._split_export_bytes(task)
+        return 200, self._export_bytes(self.export_size)
+
+    def _split_export_bytes(self, task, pages=3):
+        """
+        a zip file of the pages split from the file of the task, a pdf and a json result per page
+        """
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for page in range(1, pages + 1):
+                zf.writestr(f'page_{page}.pdf', b'%PDF-1.4\n' + b'0' * max(0, self.export_size // pages - 9))
+                zf.writestr(f'page_{page}.json', json.dumps({'applicationId': task.application_id, 'page': page,
+                                                             'fields': self._fields(task)}))
+        return buffer.getvalue()
+
+    def _card_fields(self, family, body, files):
+        if not files:
+            return self._error(400, 'File is required')
+        return self._ok({'fields': [{'fieldCode': f'F_CARD_{i}', 'value': f'value {i}'} for i in range(5)]})
+
+    def _add_hitl(self, family, body, files):
+        task = self._task(body)
+        if task is None:
+            return self._error(400, 'Task not found')
+        task.done_at = time.time() + self._sample(self.completion_time)
+        task.params.update((k, v) for k, v in body.items() if k in ('callback', 'autoCallback', 'callbackMode'))
+        with self._lock:
+            if task.params.get('callback'):
+                heapq.heappush(self._callbacks, (task.done_at, task.application_id))
+                self._callback_cond.notify_all()
+        return self._ok(task.application_id)
+
+    def _history(self, family, body, files):
+        page, limit = int(body.get('page', 1)), int(body.get('limit', 10))
+        with self._lock:
+            tasks = [t for t in self.tasks.values() if t.family == 'extraction']
+        records = [t.record() for t in tasks]
+        for key, field in (('fileTypeCode', 'fileTypeCode'), ('fileName', 'fileName')):
+            if body.get(key):
+                records = [r for r in records if body[key].lower() in str(r[field] or '').lower()]
+        if body.get('status') is not None:
+            records = [r for r in records if str(r['status']) == str(body['status'])]
+        if body.get('startCreateTime'):
+            records = [r for r in records if r['createTime'] >= body['startCreateTime']]
+        if body.get('endCreateTime'):
+            records = [r for r in records if r['createTime'] <= body['endCreateTime'] + ' 23:59:59.999']
+        column = 'createTime' if body.get('sortColumn') == 'create_time' else 'id'
+        records.sort(key=lambda r: (r[column], r['id']), reverse=body.get('sortOrder') != 'ascending')
+        return self._ok({'records': records[(page - 1) * limit:page * limit], 'total': len(records),
+                         'page': page, 'limit': limit})
+
+    # callbacks
+
+    def _run_callbacks(self):
+        with self._lock:
+            while self._server is not None:
+                if not self._callbacks:
+                    self._callback_cond.wait()
+                    continue
+                delay = self._callbacks[0][0] - time.time()
+                if delay > 0:
+                    self._callback_cond.wait(delay)
+                    continue
+                _, application_id = heapq.heappop(self._callbacks)
+                self._callback_executor.submit(self._send_callback, self.tasks[application_id])
+
+    def _send_callback(self, task):
+        params = task.params
+        url = params.get('callback') or params.get('callbackUrl')
+        if str(params.get('autoCallback', 'true')).lower() == 'false':
+            return
+        mode = int(params.get('callbackMode') or 0)
+        result = {'applicationId': task.application_id, 'taskStatus': task.final_status, 'callbackMode': mode,
+                  'customerParam': params.get('customerParam')}
+        files = None
+        if mode >= 1:
+            result['fields'] = self._fields(task)
+        if mode >= 2:
+            files = {'file': (f'{task.application_id}.pdf', b'%PDF-1.4\n' + b'0' * task.file_size)}
+        if mode >= 3:
+            files['excel'] = (f'{task.application_id}.xlsx', self._export_bytes(4096))
+            files['json'] = (f'{task.application_id}.json', json.dumps(result).encode('utf-8'))
+        try:
+            r = send_callback(url, result, secret=self.callback_secret, files=files,
+                              signature_header=self.signature_header)
+            self._count('callbacks_sent' if r.ok else 'callback_failures')
+        except Exception:
+            self._count('callback_failures')
+
+
+def main(argv=None):
+    """
+    run a mock IDP server from the command line
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m sixe_idp.mock_server', description='Local mock of the IDP api')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='median latency of the calls in seconds')
+    parser.add_argument('--latency-sigma', type=float, default=0.0, help='log-normal spread of the latency')
+    parser.add_argument('--completion-time', type=float, default=2.0, help='mean task completion time in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--max-concurrency', type=int)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--export-size', type=int, default=64 * 1024)
+    parser.add_argument('--callback-secret')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+    latency = lognormal(args.latency, args.latency_sigma) if args.latency and args.latency_sigma else args.latency
+    server = MockIDPServer(host=args.host, port=args.port, latency=latency,
+                           completion_time=exponential(args.completion_time), error_rate=args.error_rate,
+                           throttle_rate=args.throttle_rate, max_concurrency=args.max_concurrency,
+                           fail_rate=args.fail_rate, export_size=args.export_size,
+                           callback_secret=args.callback_secret, seed=args.seed)
+    server.start()
+    print(f'mock IDP server on {server.url}, token url {server.token_url}', flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
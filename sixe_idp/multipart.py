@@ -0,0 +1,250 @@
+"""
+Streaming multipart/form-data bodies, the uploaded files are read from disk while being sent
+"""
+import mmap
+import os
+import tempfile
+import uuid
+
+# size of the parts read from the files
+READ_CHUNK_SIZE = 64 * 1024
+# files which cannot be measured are spooled to a temporary file, in memory up to this size
+SPOOL_MAX_SIZE = 1024 * 1024
+# the pages of a memory-mapped file already sent are released every this many bytes
+RELEASE_SIZE = 8 * 1024 * 1024
+
+# quoting of the header params, the same as urllib3 (HTML5 form submission)
+_QUOTED = {i: f'%{i:02X}' for i in range(0x20) if i != 0x1B}
+_QUOTED[ord('"')] = '%22'
+
+
+def _is_path(value):
+    return isinstance(value, (str, os.PathLike))
+
+
+def _quote(value):
+    return value.translate(_QUOTED)
+
+
+class _FilePart(object):
+    """
+    a file to upload, read from its current position, memory-mapped when it is a regular file
+    """
+
+    def __init__(self, value):
+        self.owned = False
+        self.mm = None
+        if _is_path(value):
+            value = open(value, 'rb')
+            self.owned = True
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            self.data = memoryview(value)
+            self.file = None
+            self.start = 0
+            self.size = len(self.data)
+            return
+        self.file = value
+        self.data = None
+        try:
+            self.start = value.tell()
+            self.size = os.fstat(value.fileno()).st_size - self.start
+        except (AttributeError, OSError, ValueError):
+            self._spool()
+            return
+        if self.size > 0:
+            try:
+                self.mm = mmap.mmap(value.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                self.mm = None
+            else:
+                self._madvise(getattr(mmap, 'MADV_SEQUENTIAL', None), 0, len(self.mm))
+        self.pos = self.start
+        self.released = 0
+
+    def _madvise(self, option, start, length):
+        if option is not None and hasattr(self.mm, 'madvise'):
+            try:
+                self.mm.madvise(option, start, length)
+            except OSError:
+                pass
+
+    def _release(self, end):
+        """
+        drop the mapped pages before end from the process memory, they are read again from disk if needed
+        """
+        end -= end % mmap.PAGESIZE
+        if end - self.released >= RELEASE_SIZE:
+            self._madvise(getattr(mmap, 'MADV_DONTNEED', None), self.released, end - self.released)
+            self.released = end
+
+    def _spool(self):
+        """
+        copy a file object of unknown size to a temporary file, so that the body length is known
+        """
+        spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        while True:
+            chunk = self.file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            spooled.write(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+        self.size = spooled.tell()
+        spooled.seek(0)
+        if self.owned:
+            self.file.close()
+        self.file = spooled
+        self.owned = True
+        self.start = 0
+        self.pos = 0
+        self.released = 0
+
+    def rewind(self):
+        self.pos = self.start
+        self.released = 0
+        if self.file is not None and self.mm is None:
+            self.file.seek(self.start)
+
+    def read(self, offset, size):
+        """
+        return up to size bytes found at offset of the part
+        """
+        if self.data is not None:
+            return bytes(self.data[offset:offset + size])
+        if self.mm is not None:
+            chunk = self.mm[self.start + offset:self.start + offset + size]
+            self._release(self.start + offset)
+            return chunk
+        if self.pos != self.start + offset:
+            self.file.seek(self.start + offset)
+        chunk = self.file.read(size)
+        self.pos = self.start + offset + len(chunk)
+        return chunk
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.owned and self.file is not None:
+            self.file.close()
+
+
+class MultipartEncoder(object):
+    def __init__(self, data=None, files=None, boundary=None):
+        """
+        multipart/form-data request body streamed from the files, so the memory used for an upload stays flat
+        whatever the size of the files. The fields and files are encoded the same way as requests does.
+        :param data: form fields, list values are sent as repeated fields, None values are skipped
+        :type data: dict
+        :param files: files to upload, name -> file, where a file is a path, a binary file object, bytes, or a
+            (filename, file[, content_type]) tuple. Files given as paths are opened and closed by the encoder.
+        :type files: dict
+        :param boundary: multipart boundary, a random one by default
+
+            with MultipartEncoder({'fileType': 'CBKS'}, {'file': '/path/to/file.pdf'}) as body:
+                requests.post(url, data=body, headers={'Content-Type': body.content_type})
+        """
+        self.boundary = boundary or uuid.uuid4().hex
+        self._segments = []
+        self._files = []
+        try:
+            self._build(data or {}, files or {})
+        except BaseException:
+            self.close()
+            raise
+        self._length = sum(len(s) if isinstance(s, bytes) else s.size for s in self._segments)
+        self._index = 0
+        self._offset = 0
+
+    def _header(self, name, filename=None, content_type=None):
+        disposition = f'form-data; name="{_quote(name)}"'
+        if filename is not None:
+            disposition += f'; filename="{_quote(filename)}"'
+        header = f'--{self.boundary}\r\nContent-Disposition: {disposition}\r\n'
+        if content_type:
+            header += f'Content-Type: {content_type}\r\n'
+        return (header + '\r\n').encode('utf-8')
+
+    def _build(self, data, files):
+        for name, value in data.items():
+            if value is None:
+                continue
+            for v in value if isinstance(value, (list, tuple)) else [value]:
+                if not isinstance(v, bytes):
+                    v = str(v).encode('utf-8')
+                self._segments.append(self._header(name) + v + b'\r\n')
+        for name, value in files.items() if hasattr(files, 'items') else files:
+            content_type = None
+            if isinstance(value, (list, tuple)):
+                if len(value) > 2:
+                    content_type = value[2]
+                filename, value = value[0], value[1]
+            elif _is_path(value):
+                filename = os.path.basename(value)
+            else:
+                filename = getattr(value, 'name', None)
+                filename = os.path.basename(filename) if isinstance(filename, str) else name
+            part = _FilePart(value)
+            self._files.append(part)
+            self._segments.append(self._header(name, filename, content_type))
+            self._segments.append(part)
+            self._segments.append(b'\r\n')
+        self._segments.append(f'--{self.boundary}--\r\n'.encode('utf-8'))
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        """
+        return the next bytes of the body, at most size of them (or a part of the body if size is -1)
+        """
+        if size is None or size < 0:
+            size = READ_CHUNK_SIZE
+        while self._index < len(self._segments):
+            segment = self._segments[self._index]
+            if isinstance(segment, bytes):
+                chunk = segment[self._offset:self._offset + size]
+            else:
+                chunk = segment.read(self._offset, min(size, segment.size - self._offset))
+            if chunk:
+                self._offset += len(chunk)
+                return chunk
+            self._index += 1
+            self._offset = 0
+        return b''
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(READ_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def iter_files(self):
+        """
+        iterate over the content of the files only, in order, e.g. to sign them, rewind() before sending the body
+        """
+        for part in self._files:
+            for offset in range(0, part.size, READ_CHUNK_SIZE):
+                yield part.read(offset, min(READ_CHUNK_SIZE, part.size - offset))
+
+    def rewind(self):
+        """
+        restart the body from the beginning, e.g. to send it again
+        """
+        for part in self._files:
+            part.rewind()
+        self._index = 0
+        self._offset = 0
+
+    def close(self):
+        for part in self._files:
+            part.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,253 @@
+"""
+Split-and-extract pipeline running the uploads, the waits and the downloads of many files as overlapping stages,
+see :class:`SplitExtractionPipeline`
+"""
+import os
+import queue
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .api import IDPException
+from .poller import StatusPoller
+from .results import loads
+
+FAMILY = 'split_and_extraction'
+# end of the input files, which may hold None
+_END = object()
+
+
+class Page(object):
+    """
+        The :class:`Page <Page>` object, which holds the members of a split export sharing one name, e.g.
+        page_1.pdf and page_1.json: files maps their names to their bytes, or to their paths when the pipeline
+        writes them to disk, and result is the decoded json member, if any.
+    """
+    __slots__ = ('name', 'files', 'result')
+
+    def __init__(self, name):
+        self.name = name
+        self.files = {}
+        self.result = None
+
+    def __repr__(self):
+        return f"<Page {self.name} {', '.join(self.files)}>"
+
+
+class PipelineResult(object):
+    """
+        The :class:`PipelineResult <PipelineResult>` object, which holds the pages split and extracted from one
+        input file, or the error of the stage which failed.
+    """
+    __slots__ = ('file', 'application_id', 'status', 'pages', 'error')
+
+    def __init__(self, file):
+        self.file = file
+        self.application_id = None
+        self.status = None
+        self.pages = []
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.ok:
+            return f'<PipelineResult {self.application_id} pages={len(self.pages)}>'
+        return f'<PipelineResult {self.application_id} error={self.error!r}>'
+
+
+def _member_path(directory, filename):
+    """
+    return the path of a zip member under directory, refusing the names escaping it
+    """
+    path = os.path.normpath(os.path.join(directory, filename))
+    if os.path.isabs(filename) or not path.startswith(os.path.normpath(directory) + os.sep):
+        raise IDPException(f'Unsafe zip member name: {filename}')
+    return path
+
+
+class SplitExtractionPipeline(object):
+    def __init__(self, client, group_id, lang='EN', hitl=None, extract_mode=None, upload_workers=4,
+                 download_workers=4, max_inflight=32, requests_per_second=10, poll_workers=4, timeout=3600,
+                 output_dir=None):
+        """
+        Runs split_and_extraction_async_create, the wait for the task and the download and unpacking of its zip
+        export as concurrent stages: the first files are downloaded while the next ones are uploaded and
+        processed, instead of running one phase at a time. The tasks are waited for by a
+        :class:`sixe_idp.poller.StatusPoller`, and the exports are unpacked as they download.
+
+        :param client: :class:`sixe_idp.api.Client`
+        :param group_id: group id of the split_and_extraction tasks, lang, hitl and extract_mode are also theirs
+        :param upload_workers: number of files uploaded at once
+        :type upload_workers: int
+        :param download_workers: number of exports downloaded at once
+        :type download_workers: int
+        :param max_inflight: maximum number of files between the start of their upload and their result being
+            yielded, which bounds the queues between the stages and the memory held
+        :type max_inflight: int
+        :param requests_per_second: budget of the status calls
+        :type requests_per_second: float
+        :param poll_workers: number of status calls in flight at once
+        :type poll_workers: int
+        :param timeout: seconds after which a task is given up with an IDPException, None means no limit, and run()
+            waits for every task however long it takes
+        :type timeout: float
+        :param output_dir: directory the page files are written to, under a directory per application id,
+            instead of being kept in memory
+
+            pipeline = SplitExtractionPipeline(client, group_id='my-group', output_dir='/data/pages')
+            for result in pipeline.run(glob.iglob('/data/inbox/*.pdf')):
+                for page in result.pages:
+                    print(result.file, page.name, page.result)
+        """
+        if upload_workers < 1 or download_workers < 1:
+            raise IDPException('upload_workers and download_workers must be at least 1')
+        if max_inflight < 1:
+            raise IDPException('max_inflight must be at least 1')
+        self.client = client
+        self.group_id = group_id
+        self.lang = lang
+        self.hitl = hitl
+        self.extract_mode = extract_mode
+        self.upload_workers = upload_workers
+        self.download_workers = download_workers
+        self.max_inflight = max_inflight
+        self.requests_per_second = requests_per_second
+        self.poll_workers = poll_workers
+        self.timeout = timeout
+        self.output_dir = output_dir
+
+    def _upload(self, result):
+        task = self.client.split_and_extraction_async_create(file=result.file, group_id=self.group_id,
+                                                             lang=self.lang, hitl=self.hitl,
+                                                             extract_mode=self.extract_mode)
+        result.application_id = task.task_id
+        return result
+
+    def _download(self, result):
+        pages = {}
+        for member in self.client.split_and_extraction_export_members(result.application_id):
+            if member.is_dir():
+                continue
+            name, extension = os.path.splitext(member.filename)
+            page = pages.get(name)
+            if page is None:
+                page = pages[name] = Page(name)
+                result.pages.append(page)
+            content = None
+            if extension.lower() == '.json':
+                content = member.read()
+                page.result = loads(content)
+            if self.output_dir is None:
+                page.files[member.filename] = content if content is not None else member.read()
+                continue
+            path = _member_path(os.path.join(self.output_dir, str(result.application_id)), member.filename)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                if content is not None:
+                    f.write(content)
+                else:
+                    shutil.copyfileobj(member, f)
+            page.files[member.filename] = path
+        return result
+
+    def run(self, files):
+        """
+        Process the files and yield a :class:`PipelineResult <PipelineResult>` for each one as soon as its pages
+        are downloaded, in completion order. The iterable is consumed lazily, so it can be a generator over a huge
+        directory. Failed files are yielded with their error rather than raised.
+
+        :param files: iterable of pdf files, paths or file objects
+        """
+        done = queue.Queue()
+        closed = threading.Event()
+        uploads = ThreadPoolExecutor(max_workers=self.upload_workers)
+        downloads = ThreadPoolExecutor(max_workers=self.download_workers)
+        # the events are only handled by polled(), the poller keeps none of them
+        poller = StatusPoller(self.client, requests_per_second=self.requests_per_second, workers=self.poll_workers,
+                              timeout=self.timeout, keep_events=False)
+
+        # the executors keep running their queued work once shut down, which is skipped after an early close, so
+        # that no task is created that nobody polls (shutdown(cancel_futures=True) needs python 3.9)
+        def upload(result):
+            if closed.is_set():
+                result.error = IDPException('The pipeline was closed before the upload')
+                return result
+            return self._upload(result)
+
+        def download(result):
+            if closed.is_set():
+                result.error = IDPException('The pipeline was closed before the download')
+                return result
+            return self._download(result)
+
+        # the callbacks put every result in done exactly once, even when they fail, run() counts on it
+        def polled(event):
+            result = event.context
+            try:
+                result.status = event.status
+                if event.error is not None:
+                    result.error = event.error
+                elif event.status != 'Done':
+                    result.error = IDPException(f'Task {result.application_id} finished with status {event.status}')
+                if result.error is not None or closed.is_set():
+                    done.put(result)
+                    return
+                downloads.submit(download, result).add_done_callback(
+                    lambda future: done.put(_result_of(future, result)))
+            except Exception as e:
+                result.error = e
+                done.put(result)
+
+        def uploaded(future, result):
+            try:
+                error = future.exception()
+                if error is not None:
+                    result.error = error
+                    done.put(result)
+                elif closed.is_set():
+                    done.put(result)
+                else:
+                    poller.add(result.application_id, family=FAMILY, callback=polled, context=result)
+            except Exception as e:
+                # e.g. a task created without an application id
+                result.error = e
+                done.put(result)
+
+        inflight = 0
+        files = iter(files)
+        exhausted = False
+        poller.start()
+        try:
+            while True:
+                while not exhausted and inflight < self.max_inflight:
+                    file = next(files, _END)
+                    if file is _END:
+                        exhausted = True
+                        break
+                    result = PipelineResult(file)
+                    uploads.submit(upload, result).add_done_callback(
+                        lambda future, result=result: uploaded(future, result))
+                    inflight += 1
+                if not inflight:
+                    return
+                result = done.get()
+                inflight -= 1
+                yield result
+        finally:
+            closed.set()
+            poller.stop()
+            uploads.shutdown(wait=False)
+            downloads.shutdown(wait=False)
+
+
+def _result_of(future, result):
+    """
+    return the result of a download, with its error if it failed
+    """
+    error = future.exception()
+    if error is not None:
+        result.error = error
+    return result
@@ -0,0 +1,291 @@
+"""
+One background poller for many outstanding IDP applications, see :class:`StatusPoller`
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .api import IDPException, IDPRateLimitException
+from .polling import FAMILIES, PENDING_STATUSES, PollBackoff
+from .ratelimit import TokenBucket
+from .retry import is_transient_error
+
+
+class CompletionEvent(object):
+    """
+        The :class:`CompletionEvent <CompletionEvent>` object, emitted when a polled application leaves the poller.
+    """
+    __slots__ = ('application_id', 'family', 'status', 'result', 'error', 'context')
+
+    def __init__(self, application_id, family, status=None, result=None, error=None, context=None):
+        self.application_id = application_id
+        self.family = family
+        self.status = status
+        self.result = result
+        self.error = error
+        self.context = context
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return f'<CompletionEvent {self.family} {self.application_id} status={self.status} error={self.error!r}>'
+
+
+class _Entry(object):
+    __slots__ = ('application_id', 'family', 'callback', 'context', 'submitted_at', 'deadline', 'attempt',
+                 'last_pending', 'errors')
+
+    def __init__(self, application_id, family, callback, context, submitted_at, deadline):
+        self.application_id = application_id
+        self.family = family
+        self.callback = callback
+        self.context = context
+        self.submitted_at = submitted_at
+        self.deadline = deadline
+        self.attempt = 0
+        self.last_pending = None
+        # consecutive failed status calls
+        self.errors = 0
+
+
+class StatusPoller(object):
+    def __init__(self, client, requests_per_second=10, workers=4, timeout=None, max_errors=5, keep_events=True):
+        """
+        Polls all the outstanding applications from one background thread, ordered by the time each one is due,
+        under a global requests-per-second budget. Applications are dropped once they reach a terminal status,
+        and a :class:`CompletionEvent <CompletionEvent>` is passed to their callback and to completed().
+
+        :param client: :class:`sixe_idp.api.Client`, its per-family PollBackoff schedules the polls
+        :param requests_per_second: budget of status calls per second shared by all the applications
+        :type requests_per_second: float
+        :param workers: number of status calls in flight at once
+        :type workers: int
+        :param timeout: default seconds after which an application is given up with an IDPException error event
+        :type timeout: float
+        :param max_errors: consecutive transient failures of the status calls (network errors, throttling) after
+            which an application is given up with the last error, the other errors give it up at once.
+            None means no limit.
+        :type max_errors: int
+        :param keep_events: whether the events are queued for completed(), False when they are only handled by the
+            callbacks, so that the events and their context are not held until completed() reads them
+        :type keep_events: bool
+
+            with StatusPoller(client, requests_per_second=20) as poller:
+                for task_id in task_ids:
+                    poller.add(task_id, family='extraction')
+                for event in poller.completed():
+                    print(event.application_id, event.status)
+        """
+        self.client = client
+        self.bucket = TokenBucket(requests_per_second)
+        self.workers = workers
+        self.timeout = timeout
+        self.max_errors = max_errors
+        self.keep_events = keep_events
+        self._heap = []
+        self._entries = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._slots = threading.Semaphore(workers)
+        self._events = deque()
+        self._executor = None
+        self._thread = None
+        self._running = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._entries)
+
+    def _backoff(self, family):
+        return self.client.poll_backoffs.setdefault(family, PollBackoff())
+
+    def _schedule(self, entry, due):
+        heapq.heappush(self._heap, (due, next(self._seq), entry))
+        self._cond.notify_all()
+
+    def add(self, application_id, family='extraction', callback=None, context=None, submitted_at=None,
+            timeout=None):
+        """
+        Start polling an application
+        :param application_id: application id of the task
+        :param family: extraction, faas, doc_agent or split_and_extraction
+        :param callback: function called with the CompletionEvent, from a worker thread
+        :param context: any value passed back in the CompletionEvent
+        :param submitted_at: time.time() at which the task was submitted, defaults to now
+        :param timeout: seconds after which the application is given up, defaults to the poller timeout
+        """
+        if family not in FAMILIES:
+            raise IDPException(f"family must be one of {', '.join(FAMILIES)}")
+        if application_id is None:
+            raise IDPException("applicationId is required")
+        now = time.time()
+        submitted_at = submitted_at if submitted_at is not None else now
+        timeout = timeout if timeout is not None else self.timeout
+        deadline = submitted_at + timeout if timeout is not None else None
+        entry = _Entry(application_id, family, callback, context, submitted_at, deadline)
+        expected = self._backoff(family).expected_duration
+        due = submitted_at + expected if expected is not None else now
+        with self._cond:
+            self._entries[(family, application_id)] = entry
+            self._schedule(entry, due)
+        return self
+
+    def remove(self, application_id, family='extraction'):
+        """
+        Stop polling an application, without emitting an event
+        """
+        with self._cond:
+            self._entries.pop((family, application_id), None)
+            # completed() may be waiting for this last application
+            self._cond.notify_all()
+
+    def start(self):
+        """
+        Start the background polling thread
+        """
+        with self._cond:
+            if self._running:
+                return self
+            self._running = True
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._thread = threading.Thread(target=self._run, name='sixe-idp-status-poller', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, wait=True):
+        """
+        Stop the background polling thread, the outstanding applications are kept
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None and wait:
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+        self._thread = None
+        self._executor = None
+
+    def _next_due_entry(self):
+        """
+        wait for the earliest due application still outstanding, return None once stopped
+        """
+        with self._cond:
+            while self._running:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due, _, entry = self._heap[0]
+                if self._entries.get((entry.family, entry.application_id)) is not entry:
+                    heapq.heappop(self._heap)
+                    continue
+                delay = due - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                return entry
+            return None
+
+    def _run(self):
+        while True:
+            entry = self._next_due_entry()
+            if entry is None:
+                return
+            self._slots.acquire()
+            self.bucket.acquire()
+            with self._cond:
+                if not self._running:
+                    # keep the application outstanding for a later start()
+                    self._schedule(entry, time.time())
+                    self._slots.release()
+                    return
+            self._executor.submit(self._poll, entry)
+
+    def _finish(self, entry, status=None, result=None, error=None):
+        event = CompletionEvent(entry.application_id, entry.family, status=status, result=result, error=error,
+                                context=entry.context)
+        with self._cond:
+            if self._entries.get((entry.family, entry.application_id)) is not entry:
+                return
+            del self._entries[(entry.family, entry.application_id)]
+            if self.keep_events:
+                self._events.append(event)
+            self._cond.notify_all()
+        if entry.callback is not None:
+            entry.callback(event)
+
+    def _poll(self, entry):
+        try:
+            task_family = FAMILIES[entry.family]
+            backoff = self._backoff(entry.family)
+            try:
+                status, response = task_family.poll(self.client, entry.application_id)
+            except Exception as e:
+                status, response, error = None, None, e
+            else:
+                error = None
+            now = time.time()
+            if error is None and status not in PENDING_STATUSES:
+                backoff.record(((entry.last_pending or entry.submitted_at) + now) / 2 - entry.submitted_at)
+                try:
+                    if task_family.result_method is not None:
+                        self.bucket.acquire()
+                    result = task_family.final_result(self.client, entry.application_id, status, response)
+                except Exception as e:
+                    self._finish(entry, status=status, error=e)
+                else:
+                    self._finish(entry, status=status, result=result)
+                return
+            if error is None:
+                entry.last_pending = now
+                entry.errors = 0
+            else:
+                entry.errors += 1
+                transient = is_transient_error(error) or isinstance(error, IDPRateLimitException)
+                if not transient or (self.max_errors is not None and entry.errors >= self.max_errors):
+                    # e.g. an unknown application id, which no later poll will find
+                    self._finish(entry, error=error)
+                    return
+            entry.attempt += 1
+            if entry.deadline is not None and now >= entry.deadline:
+                self._finish(entry, status=status,
+                             error=error or IDPException(f'Task timeout exceeded: {entry.deadline - entry.submitted_at}'))
+                return
+            due = now + backoff.next_delay(now - entry.submitted_at, entry.attempt)
+            if entry.deadline is not None:
+                due = min(due, entry.deadline)
+            with self._cond:
+                if self._entries.get((entry.family, entry.application_id)) is entry:
+                    self._schedule(entry, due)
+        finally:
+            self._slots.release()
+
+    def completed(self, timeout=None):
+        """
+        Iterate over the CompletionEvents as they happen, until no application is outstanding
+        :param timeout: maximum seconds to wait for the next event, None means no limit
+        """
+        while True:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            with self._cond:
+                while not self._events and self._entries:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return
+                    self._cond.wait(remaining)
+                if not self._events:
+                    return
+                event = self._events.popleft()
+            yield event
@@ -0,0 +1,176 @@
+"""
+Waiting for IDP tasks to finish, with adaptive jittered backoff, see :meth:`sixe_idp.api.Client.extraction_wait`
+"""
+import random
+import threading
+import time
+
+from .api import IDPException
+from .results import Result
+
+# statuses of tasks still being processed, any other status is terminal
+PENDING_STATUSES = frozenset(['Init', 'Doing', 'On Process', 'Processing', 'Pending'])
+
+
+def data_status(response):
+    """
+    return the status of a status api response, found as data.status or data.taskStatus
+    """
+    data = response['data']
+    if isinstance(data, dict):
+        return data.get('status', data.get('taskStatus'))
+    return data
+
+
+def task_status(response):
+    """
+    return the status of an extraction result, read without decoding a lazy result
+    """
+    if isinstance(response, Result):
+        return response.status
+    return response['data']['taskStatus']
+
+
+class TaskFamily(object):
+    def __init__(self, name, status_method, status_of, result_method=None):
+        """
+        Describes how to poll the tasks of one api family
+        :param name: name of the family
+        :param status_method: name of the Client method polling the status of an application id
+        :param status_of: function returning the status of the value returned by status_method
+        :param result_method: name of the Client method fetching the result of a Done task, if the status
+            method does not already return it
+        """
+        self.name = name
+        self.status_method = status_method
+        self.status_of = status_of
+        self.result_method = result_method
+
+    def poll(self, client, application_id):
+        """
+        return the (status, response) of one status call
+        """
+        response = getattr(client, self.status_method)(application_id)
+        return self.status_of(response), response
+
+    def final_result(self, client, application_id, status, response):
+        if self.result_method is None:
+            return response
+        if status != 'Done':
+            raise IDPException(f'Task {application_id} finished with status {status}')
+        return getattr(client, self.result_method)(application_id)
+
+
+FAMILIES = {
+    'extraction': TaskFamily('extraction', 'extraction_result', task_status),
+    'faas': TaskFamily('faas', 'extraction_faas_status', lambda status: status,
+                       result_method='extraction_faas_result'),
+    'doc_agent': TaskFamily('doc_agent', 'extraction_doc_agent_status', data_status),
+    'split_and_extraction': TaskFamily('split_and_extraction', 'split_and_extraction_status', data_status),
+}
+
+
+class PollBackoff(object):
+    def __init__(self, min_interval=1.0, max_interval=60.0, multiplier=1.6, jitter=0.2, smoothing=0.2):
+        """
+        Adaptive polling schedule of one task family, tuned with the durations of the tasks seen so far
+        :param min_interval: shortest delay between two polls, in seconds
+        :param max_interval: longest delay between two polls, in seconds
+        :param multiplier: growth factor of the delay while a task takes longer than expected
+        :param jitter: relative random spread applied to every delay, so that many waiters do not poll in lockstep
+        :param smoothing: weight of the newest duration in the moving average of task durations
+
+        Before any task finished, the delay starts at min_interval and grows by multiplier. Once durations are known,
+        the first poll is aimed at the expected completion time, and tasks running late are polled with a delay
+        growing from a fraction of the expected duration.
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.smoothing = smoothing
+        self._expected = None
+        self._lock = threading.Lock()
+
+    @property
+    def expected_duration(self):
+        """
+        moving average of the observed task durations in seconds, None before any task finished
+        """
+        return self._expected
+
+    def record(self, duration):
+        """
+        record the duration of a finished task, in seconds
+        """
+        with self._lock:
+            if self._expected is None:
+                self._expected = duration
+            else:
+                self._expected += self.smoothing * (duration - self._expected)
+
+    def next_delay(self, elapsed, attempt):
+        """
+        return the seconds to sleep before the next poll
+        :param elapsed: seconds since the task was submitted
+        :param attempt: number of polls already done for the task
+        """
+        expected = self._expected
+        if expected is not None and elapsed < expected:
+            delay = expected - elapsed
+        else:
+            base = self.min_interval if expected is None else max(self.min_interval, expected * 0.1)
+            delay = base * self.multiplier ** max(attempt - 1, 0)
+        delay = min(max(delay, self.min_interval), self.max_interval)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+def wait_for(client, family, application_id, timeout=600, submitted_at=None, backoff=None):
+    """
+    Poll an application until it reaches a terminal status and return its final result
+    :param client: :class:`sixe_idp.api.Client`
+    :param family: extraction, faas, doc_agent or split_and_extraction
+    :param application_id: application id of the task
+    :param timeout: seconds to wait before raising an IDPException
+    :param submitted_at: time.time() at which the task was submitted, defaults to now
+    :param backoff: :class:`PollBackoff <PollBackoff>` of the family, defaults to the client's one
+    """
+    if family not in FAMILIES:
+        raise IDPException(f"family must be one of {', '.join(FAMILIES)}")
+    if application_id is None:
+        raise IDPException("applicationId is required")
+    task_family = FAMILIES[family]
+    cache = getattr(client, 'submission_cache', None)
+    if cache is not None:
+        result = cache.result(family, application_id)
+        if result is not None:
+            return result
+    if backoff is None:
+        backoff = client.poll_backoffs.setdefault(family, PollBackoff())
+    now = time.time()
+    started = submitted_at if submitted_at is not None else now
+    deadline = now + timeout
+    last_pending = None
+    attempt = 0
+    while True:
+        expected = backoff.expected_duration
+        if attempt or expected is None or time.time() - started >= expected:
+            status, response = task_family.poll(client, application_id)
+            polled_at = time.time()
+            if status not in PENDING_STATUSES:
+                if last_pending is not None or submitted_at is not None:
+                    # the task finished between the last two polls
+                    backoff.record(((last_pending or started) + polled_at) / 2 - started)
+                if cache is not None and status != 'Done':
+                    # a failed task is submitted again rather than reused
+                    cache.discard(family, application_id)
+                result = task_family.final_result(client, application_id, status, response)
+                if cache is not None and status == 'Done':
+                    cache.put_result(family, application_id, result)
+                return result
+            last_pending = polled_at
+        attempt += 1
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise IDPException(f'Task timeout exceeded: {timeout}')
+        time.sleep(min(backoff.next_delay(time.time() - started, attempt), remaining))
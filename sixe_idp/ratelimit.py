@@ -0,0 +1,243 @@
+"""
+Client side rate limiting of the IDP api calls
+"""
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+
+
+class TokenBucket(object):
+    def __init__(self, rate, capacity=None):
+        """
+        Thread-safe token bucket, refilled with rate tokens per second up to capacity
+        :param rate: tokens added per second, i.e. the sustained number of calls per second
+        :type rate: float
+        :param capacity: maximum number of tokens, i.e. the allowed burst, defaults to max(1, rate)
+        :type capacity: float
+        """
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """
+        return True and take the tokens if they are available right now
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        take the tokens, waiting for them to be refilled if needed
+        :param timeout: maximum seconds to wait, None means no limit
+        :returns: False if the tokens could not be taken before the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None:
+                if now + wait > deadline:
+                    return False
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        take no tokens for the next seconds, e.g. after the server asked to retry later
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+# api families sharing a limit, see sixe_idp.api.Client._request
+API_FAMILIES = ('create', 'status', 'export', 'history')
+
+
+def is_throttled(status_code):
+    """
+    return whether an http status tells the server is overloaded
+    """
+    return status_code == 429 or status_code >= 500
+
+
+def parse_retry_after(value):
+    """
+    return the seconds of a Retry-After header, given in seconds or as an http date, None if not usable
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+class AdaptiveConcurrency(object):
+    def __init__(self, initial=4, minimum=1, maximum=64, increase=1.0, decrease=0.5):
+        """
+        AIMD limit of the calls in flight: it grows by increase per limit successful calls, and is multiplied by
+        decrease when the server throttles, once per window of calls sent at the same limit
+        :param initial: starting limit
+        :param minimum: lowest limit
+        :param maximum: highest limit
+        """
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError('1 <= minimum <= initial <= maximum is required')
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.limit = float(initial)
+        self.inflight = 0
+        self.throttled = 0
+        self._epoch = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """
+        wait for a free slot, return the ticket to release it with
+        """
+        with self._cond:
+            while self.inflight >= int(self.limit):
+                self._cond.wait()
+            self.inflight += 1
+            return self._epoch
+
+    def release(self, ticket, throttled=False):
+        with self._cond:
+            self.inflight -= 1
+            if throttled:
+                self.throttled += 1
+                # the calls sent before the last decrease say nothing about the new limit
+                if ticket == self._epoch:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._epoch += 1
+            else:
+                self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            self._cond.notify_all()
+
+
+class _Family(object):
+    def __init__(self, bucket, concurrency):
+        self.bucket = bucket
+        self.concurrency = concurrency
+        self.resume_at = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds):
+        with self.lock:
+            self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+        if self.bucket is not None:
+            self.bucket.pause(seconds)
+
+    def wait_resume(self):
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class _Slot(object):
+    """
+    one call holding a concurrency slot of its family
+    """
+
+    def __init__(self, family):
+        self.family = family
+        self.status_code = None
+        self.retry_after = None
+        self.ticket = None
+
+    def __enter__(self):
+        self.family.wait_resume()
+        self.ticket = self.family.concurrency.acquire()
+        if self.family.bucket is not None:
+            self.family.bucket.acquire()
+        return self
+
+    def record(self, status_code, retry_after=None):
+        """
+        record the http status of the call, and its Retry-After header if any
+        """
+        self.status_code = status_code
+        self.retry_after = parse_retry_after(retry_after)
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.status_code is not None:
+            throttled = is_throttled(self.status_code)
+        else:
+            # timeouts and refused connections are a sign of overload too
+            throttled = exc_type is not None and issubclass(exc_type, (OSError, requests.exceptions.RequestException))
+        self.family.concurrency.release(self.ticket, throttled)
+        if self.retry_after:
+            self.family.pause(self.retry_after)
+
+
+class RateLimiter(object):
+    def __init__(self, rates=None, initial_concurrency=4, min_concurrency=1, max_concurrency=64):
+        """
+        Client side limits of the api calls, per family of endpoints: create, status (and results), export and
+        history. Each family has an optional token bucket, and an AIMD limit of the calls in flight which backs off
+        when the server answers 429 or 5xx, honoring Retry-After, and ramps up again while the calls succeed.
+
+        :param rates: calls per second, a number for all the families or a dict family -> number,
+            None means no fixed rate, only the adaptive concurrency
+        :type rates: float or dict
+        :param initial_concurrency: starting number of calls in flight of each family
+        :type initial_concurrency: int
+        :param min_concurrency: lowest number of calls in flight of each family
+        :type min_concurrency: int
+        :param max_concurrency: highest number of calls in flight of each family
+        :type max_concurrency: int
+
+            limiter = RateLimiter(rates={'create': 5, 'status': 20})
+            client = Client(http_host, oauth_client, rate_limiter=limiter)
+        """
+        if not isinstance(rates, dict):
+            rates = {family: rates for family in API_FAMILIES}
+        unknown = set(rates) - set(API_FAMILIES)
+        if unknown:
+            raise ValueError(f"unknown families {', '.join(sorted(unknown))}, they must be in {', '.join(API_FAMILIES)}")
+        self._families = {}
+        for family in API_FAMILIES:
+            rate = rates.get(family)
+            self._families[family] = _Family(TokenBucket(rate) if rate else None,
+                                             AdaptiveConcurrency(initial_concurrency, min_concurrency,
+                                                                 max_concurrency))
+
+    def slot(self, family):
+        """
+        return the context manager holding a slot of the family for the time of a call
+        """
+        return _Slot(self._families[family])
+
+    @property
+    def stats(self):
+        """
+        current concurrency limit, calls in flight and throttled calls of each family
+        """
+        return {name: {'limit': f.concurrency.limit, 'inflight': f.concurrency.inflight,
+                       'throttled': f.concurrency.throttled} for name, f in self._families.items()}
@@ -0,0 +1,290 @@
+"""
+Lazily decoded, slotted result objects, see :class:`ExtractionResult`. The json bodies are decoded with orjson
+when it is installed (``pip install 6estates-idp[fast]``), and with the standard json module otherwise.
+"""
+import json
+import re
+from collections.abc import Mapping
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# name of the json module used by loads
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+
+# status keys of the result payloads, read from the raw body without decoding it when they are keys of the data
+# object itself, as the nested objects of the fields may have keys of the same name
+_STATUS_PATTERN = re.compile(rb'"(?:taskStatus|analysisStatus)"\s*:\s*"([^"\\]*)"')
+_APPLICATION_ID_PATTERN = re.compile(rb'"applicationId"\s*:\s*"?([^",}\s]+)')
+# json strings, removed before counting the nesting depth of a body
+_STRING_PATTERN = re.compile(rb'"(?:[^"\\]|\\.)*"')
+# matches of a key looked at before decoding the body instead
+_MAX_SCANNED_MATCHES = 4
+
+
+def _depth(text):
+    """
+    return the nesting depth of json text without strings, after its last character
+    """
+    return text.count(b'{') + text.count(b'[') - text.count(b'}') - text.count(b']')
+
+
+def loads(content):
+    """
+    decode a json body, bytes or str, with the fastest json module available
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def dumps(result):
+    """
+    return the json text of a result, a dict or a :class:`Result <Result>`, which is not decoded to be dumped
+    """
+    if isinstance(result, Result):
+        return result.json()
+    return json.dumps(result)
+
+
+class Field(object):
+    """
+    One extracted field of a result, a view of its raw dict
+    """
+    __slots__ = ('raw',)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    @property
+    def code(self):
+        return self.raw.get('fieldCode', self.raw.get('code'))
+
+    @property
+    def name(self):
+        return self.raw.get('fieldName', self.raw.get('name'))
+
+    @property
+    def value(self):
+        return self.raw.get('value')
+
+    @property
+    def type(self):
+        return self.raw.get('fieldType', self.raw.get('type'))
+
+    @property
+    def is_table(self):
+        return isinstance(self.value, list) or str(self.type).lower() == 'table'
+
+    def __repr__(self):
+        return f'<Field {self.code}={self.value!r}>' if not self.is_table else f'<Field {self.code} table>'
+
+
+class Table(object):
+    """
+    A table field of a result, e.g. the transactions of a bank statement, whose rows are lists of fields
+    or dicts
+    """
+    __slots__ = ('field',)
+
+    def __init__(self, field):
+        self.field = field
+
+    @property
+    def code(self):
+        return self.field.code
+
+    @property
+    def name(self):
+        return self.field.name
+
+    @property
+    def rows(self):
+        value = self.field.value
+        return value if isinstance(value, list) else []
+
+    def records(self):
+        """
+        yield every row as a dict of field code -> value
+        """
+        for row in self.rows:
+            if isinstance(row, dict):
+                yield row
+            else:
+                yield {cell.get('fieldCode', cell.get('code')): cell.get('value')
+                       for cell in row if isinstance(cell, dict)}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return self.records()
+
+    def __repr__(self):
+        return f'<Table {self.code} rows={len(self)}>'
+
+
+class Result(Mapping):
+    __slots__ = ('_content', '_raw')
+
+    def __init__(self, content=None, raw=None):
+        """
+        Result payload of a task, decoded on first access to its content. The status and application id are read
+        from the raw body without decoding it, so a consumer only checking them never pays for the decoding.
+        It is a read-only mapping of the payload, result['data'] works as with the decoded dict.
+
+        :param content: json body of the response, bytes or str
+        :param raw: decoded payload, instead of the content
+        :type raw: dict
+        """
+        if content is None and raw is None:
+            # imported here, sixe_idp.api imports this module
+            from .api import IDPException
+
+            raise IDPException('content or raw is required')
+        self._content = content
+        self._raw = raw
+
+    @classmethod
+    def from_response(cls, r):
+        return cls(content=r.content)
+
+    @property
+    def decoded(self):
+        """
+        whether the payload was decoded
+        """
+        return self._raw is not None
+
+    @property
+    def raw(self):
+        """
+        decoded payload, the body is decoded and released on first access
+        """
+        if self._raw is None:
+            self._raw = loads(self._content)
+            self._content = None
+        return self._raw
+
+    def json(self):
+        """
+        return the json text of the payload
+        """
+        if self._content is not None:
+            content = self._content
+            return content.decode('utf-8') if isinstance(content, bytes) else content
+        return json.dumps(self._raw)
+
+    def _scan(self, pattern):
+        """
+        return the value of the first match of the pattern which is a key of the data object, i.e. at depth 2 of
+        the body, None when the first matches are all nested deeper or inside strings, the body is then decoded
+        """
+        content = self._content
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        for i, match in enumerate(pattern.finditer(content)):
+            if i == _MAX_SCANNED_MATCHES:
+                break
+            prefix = _STRING_PATTERN.sub(b'', content[:match.start()])
+            # a quote left means the match is inside a string
+            if b'"' not in prefix and _depth(prefix) == 2:
+                return match.group(1).decode('utf-8')
+        return None
+
+    @property
+    def data(self):
+        data = self.raw.get('data') if isinstance(self.raw, dict) else None
+        return data if data is not None else {}
+
+    @property
+    def status(self):
+        """
+        status of the task, e.g. Doing or Done
+        """
+        if self._raw is None:
+            status = self._scan(_STATUS_PATTERN)
+            if status is not None:
+                return status
+        data = self.data
+        if isinstance(data, dict):
+            for key in ('taskStatus', 'analysisStatus', 'status'):
+                if data.get(key) is not None:
+                    return data[key]
+        return None
+
+    @property
+    def application_id(self):
+        if self._raw is None:
+            application_id = self._scan(_APPLICATION_ID_PATTERN)
+            if application_id is not None:
+                return application_id
+        data = self.data
+        application_id = data.get('applicationId') if isinstance(data, dict) else None
+        return str(application_id) if application_id is not None else None
+
+    def __getitem__(self, key):
+        return self.raw[key]
+
+    def __iter__(self):
+        return iter(self.raw)
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.application_id} status={self.status}>'
+
+
+class ExtractionResult(Result):
+    __slots__ = ('_fields', '_index')
+
+    def __init__(self, content=None, raw=None):
+        """
+        Result of an extraction task, whose fields and tables are built on demand
+
+            result = client.extraction_result(application_id)  # with Client(lazy_results=True)
+            if result.status == 'Done':
+                print(result.value('F_CBKS_1'))
+                for table in result.tables:
+                    for row in table:
+                        print(row)
+        """
+        super().__init__(content, raw)
+        self._fields = None
+        self._index = None
+
+    @property
+    def fields(self):
+        """
+        tuple of the :class:`Field <Field>` of the result
+        """
+        if self._fields is None:
+            data = self.data
+            fields = data.get('fields') if isinstance(data, dict) else None
+            self._fields = tuple(Field(f) for f in fields or () if isinstance(f, dict))
+        return self._fields
+
+    def field(self, code):
+        """
+        return the :class:`Field <Field>` of the code, or None
+        """
+        if self._index is None:
+            index = {}
+            for field in self.fields:
+                index.setdefault(field.code, field)
+            self._index = index
+        return self._index.get(code)
+
+    def value(self, code, default=None):
+        field = self.field(code)
+        return field.value if field is not None else default
+
+    @property
+    def tables(self):
+        """
+        list of the :class:`Table <Table>` fields of the result
+        """
+        return [Table(field) for field in self.fields if field.is_table]
@@ -0,0 +1,110 @@
+"""
+Retries of the IDP api calls, see :class:`RetryPolicy`
+"""
+import random
+import time
+
+import requests
+import urllib3
+
+# http statuses of calls worth retrying
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def is_transient_error(exc):
+    """
+    return whether a requests exception may go away when the call is sent again
+    """
+    return isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                            requests.exceptions.ChunkedEncodingError))
+
+
+def was_not_sent(exc):
+    """
+    return whether a requests exception happened before the request reached the server,
+    so that even a create call can be sent again
+    """
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.exceptions.ConnectionError) and exc.args:
+        reason = getattr(exc.args[0], 'reason', exc.args[0])
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+    return False
+
+
+class RetryPolicy(object):
+    def __init__(self, max_attempts=4, backoff=0.5, max_backoff=30.0, deadline=300.0,
+                 retry_statuses=RETRY_STATUSES, retry_creates=False):
+        """
+        How the api calls are retried. Read-only calls (status, result, export and history) are retried on
+        connection errors, timeouts and retry_statuses, with full-jitter exponential backoff. Create calls are only
+        retried when they certainly did not reach the server (connection refused or not established, or 429),
+        unless retry_creates is set: an extraction_async_create given a customer_param or a remark is then also
+        retried after an ambiguous failure, once the task history shows it was not created. That needs the history
+        records to carry the customerParam or remark of the tasks, otherwise the create is not retried.
+
+        :param max_attempts: maximum number of attempts of a call, 1 turns retries off
+        :type max_attempts: int
+        :param backoff: base delay in seconds, doubled at each attempt
+        :type backoff: float
+        :param max_backoff: maximum delay between two attempts
+        :type max_backoff: float
+        :param deadline: maximum seconds spent in a call across all its attempts, None means no limit,
+            the read timeout of the last attempts is shortened to fit in it
+        :type deadline: float
+        :param retry_statuses: http statuses retried
+        :param retry_creates: retry the create calls carrying a customer_param or remark after checking the history
+        :type retry_creates: bool
+
+            client = Client(http_host, oauth_client, retry_policy=RetryPolicy(max_attempts=6, deadline=60))
+        """
+        if max_attempts < 1:
+            raise ValueError('max_attempts must be at least 1')
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_creates = retry_creates
+
+    def delay(self, attempt, retry_after=None):
+        """
+        return the seconds to wait after a failed attempt, at least the Retry-After asked by the server
+        """
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def remaining(self, started):
+        """
+        return the seconds left before the deadline of a call started at time.monotonic() started, or None
+        """
+        if self.deadline is None:
+            return None
+        return self.deadline - (time.monotonic() - started)
+
+    def can_retry(self, attempt, started, delay):
+        """
+        return whether another attempt can be made after waiting delay
+        """
+        if attempt >= self.max_attempts:
+            return False
+        remaining = self.remaining(started)
+        return remaining is None or delay < remaining
+
+    def timeout(self, timeout, started):
+        """
+        return the requests timeout of an attempt, the read timeout shortened to the time left before the deadline
+        """
+        remaining = self.remaining(started)
+        if remaining is None:
+            return timeout
+        remaining = max(remaining, 0.001)
+        if timeout is None:
+            return remaining
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return (remaining if connect is None else min(connect, remaining),
+                    remaining if read is None else min(read, remaining))
+        return min(timeout, remaining)
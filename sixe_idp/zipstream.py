@@ -0,0 +1,286 @@
+"""
+Streaming reader of zip files, yielding the members of an archive while it is being downloaded, see :func:`iter_zip`
+"""
+import io
+import struct
+import zlib
+
+from .api import IDPException
+
+LOCAL_HEADER = b'PK\x03\x04'
+DATA_DESCRIPTOR = b'PK\x07\x08'
+# signatures found after the last member
+END_SIGNATURES = (b'PK\x01\x02', b'PK\x05\x06', b'PK\x06\x06', b'PK\x06\x07')
+_LOCAL_HEADER = struct.Struct('<HHHHHIIIHH')
+ZIP64_EXTRA = 0x0001
+STORED = 0
+DEFLATED = 8
+# flags of the local header
+_ENCRYPTED = 0x1
+_DESCRIPTOR = 0x8
+_UTF8 = 0x800
+# bytes read and decompressed at once
+READ_SIZE = 64 * 1024
+
+
+class _Source(object):
+    """
+    bytes of an iterator of chunks, read by size, the data read too far can be pushed back
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._iter = iter(chunks)
+        self._chunk = b''
+        self._offset = 0
+
+    def read_some(self, size):
+        """
+        return up to size bytes, b'' at the end of the stream
+        """
+        while self._offset >= len(self._chunk):
+            chunk = next(self._iter, None)
+            if chunk is None:
+                return b''
+            self._chunk, self._offset = chunk, 0
+        data = self._chunk[self._offset:self._offset + size]
+        self._offset += len(data)
+        return data
+
+    def read(self, size):
+        data = self.read_some(size)
+        while len(data) < size:
+            more = self.read_some(size - len(data))
+            if not more:
+                raise IDPException('Truncated zip file')
+            data += more
+        return data
+
+    def unread(self, data):
+        if data:
+            self._chunk, self._offset = data + self._chunk[self._offset:], 0
+
+    def close(self):
+        close = getattr(self._chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+class ZipMember(io.RawIOBase):
+    def __init__(self, source, filename, flags, compress_type, date_time, crc, compress_size, file_size, zip64):
+        """
+        One member of a streamed zip file, a read-only binary stream of its uncompressed content, which is only
+        readable until the next member is reached. Its CRC is checked once it is read to the end.
+        The file_size, compress_size and CRC are None until then when the archive was written as a stream.
+        """
+        super().__init__()
+        self._source = source
+        self.filename = filename
+        self.flags = flags
+        self.compress_type = compress_type
+        self.date_time = date_time
+        self.CRC = crc
+        self.compress_size = compress_size
+        self.file_size = file_size
+        self._zip64 = zip64
+        self._known_size = not flags & _DESCRIPTOR
+        self._remaining = compress_size if self._known_size else None
+        self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS) if compress_type == DEFLATED else None
+        self._buffer = bytearray()
+        self._crc = 0
+        self._size = 0
+        self._eof = False
+        self._skipped = False
+        # stored data of unknown size, read ahead while looking for its data descriptor
+        self._pending = bytearray()
+
+    def is_dir(self):
+        return self.filename.endswith('/')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._skipped:
+            raise IDPException(f'{self.filename} was skipped, the members are only readable in order')
+        while not self._buffer and not self._eof:
+            self._fill()
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        del self._buffer[:size]
+        return size
+
+    def _compressed(self, size):
+        """
+        return up to size bytes of the compressed data, b'' at its end when its size is known
+        """
+        if self._remaining is not None:
+            size = min(size, self._remaining)
+            if not size:
+                return b''
+        data = self._source.read_some(size)
+        if not data:
+            raise IDPException(f'Truncated zip file, in {self.filename}')
+        if self._remaining is not None:
+            self._remaining -= len(data)
+        return data
+
+    def _fill(self):
+        """
+        read and decompress the next block of the member
+        """
+        decompressor = self._decompressor
+        if decompressor is None and not self._known_size:
+            return self._fill_until_descriptor()
+        if decompressor is None:
+            data = self._compressed(READ_SIZE)
+            if not data:
+                return self._finish()
+        else:
+            data = decompressor.decompress(decompressor.unconsumed_tail or self._compressed(READ_SIZE), READ_SIZE)
+            if decompressor.eof:
+                # the data after the end of the deflate stream belongs to the next records
+                self._source.unread(decompressor.unused_data)
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self._buffer += data
+        if decompressor is not None and decompressor.eof:
+            self._finish()
+        elif decompressor is not None and not data and self._remaining == 0 and not decompressor.unconsumed_tail:
+            raise IDPException(f'Truncated deflate stream, in {self.filename}')
+
+    def _fill_until_descriptor(self):
+        """
+        read stored data whose size is only given by the data descriptor after it, found by its signature followed by
+        the crc and sizes of the data before it
+        """
+        data = self._source.read_some(READ_SIZE)
+        if not data:
+            raise IDPException(f'Truncated zip file, in {self.filename}')
+        pending = self._pending
+        pending += data
+        size_format = '<QQ' if self._zip64 else '<II'
+        length = 8 + struct.calcsize(size_format)
+        index = pending.find(DATA_DESCRIPTOR)
+        while index != -1 and index + length <= len(pending):
+            crc = struct.unpack_from('<I', pending, index + 4)[0]
+            compress_size, file_size = struct.unpack_from(size_format, pending, index + 8)
+            size = self._size + index
+            if compress_size == file_size == size and crc == zlib.crc32(pending[:index], self._crc):
+                self._source.unread(bytes(pending[index + length:]))
+                self._release(bytes(pending[:index]))
+                self.CRC, self.compress_size, self.file_size = crc, compress_size, file_size
+                self._known_size = True
+                return self._finish()
+            index = pending.find(DATA_DESCRIPTOR, index + 1)
+        # the last bytes may be the start of the descriptor
+        self._release(bytes(pending[:max(0, len(pending) - length + 1)]))
+
+    def _release(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self._buffer += data
+        del self._pending[:len(data)]
+
+    def _finish(self):
+        self._eof = True
+        if not self._known_size:
+            # data descriptor: optional signature, crc and the sizes, 8 bytes each in zip64 files
+            crc = self._source.read(4)
+            if crc == DATA_DESCRIPTOR:
+                crc = self._source.read(4)
+            self.CRC = struct.unpack('<I', crc)[0]
+            size_format = '<QQ' if self._zip64 else '<II'
+            self.compress_size, self.file_size = struct.unpack(size_format,
+                                                               self._source.read(struct.calcsize(size_format)))
+        if self._crc != self.CRC:
+            raise IDPException(f'Bad CRC-32 for {self.filename}')
+        if self._size != self.file_size:
+            raise IDPException(f'Bad size for {self.filename}: {self._size} bytes instead of {self.file_size}')
+
+    def _skip(self):
+        """
+        read the rest of the member without keeping it, to reach the next one
+        """
+        while not self._eof:
+            self._fill()
+            self._buffer.clear()
+        self._skipped = True
+
+    def __repr__(self):
+        return f'<ZipMember {self.filename} size={self.file_size}>'
+
+
+def _zip64_sizes(extra, file_size, compress_size):
+    """
+    return the sizes of the zip64 extra field, which holds those set to 0xFFFFFFFF in the header
+    """
+    offset = 0
+    while offset + 4 <= len(extra):
+        tag, size = struct.unpack_from('<HH', extra, offset)
+        if tag == ZIP64_EXTRA:
+            values = list(struct.unpack_from(f'<{size // 8}Q', extra, offset + 4))
+            if file_size == 0xFFFFFFFF and values:
+                file_size = values.pop(0)
+            if compress_size == 0xFFFFFFFF and values:
+                compress_size = values.pop(0)
+            return True, file_size, compress_size
+        offset += 4 + size
+    return False, file_size, compress_size
+
+
+def _read_member(source):
+    (_, flags, compress_type, mod_time, mod_date, crc, compress_size, file_size, name_length,
+     extra_length) = _LOCAL_HEADER.unpack(source.read(_LOCAL_HEADER.size))
+    raw_name = source.read(name_length)
+    extra = source.read(extra_length)
+    filename = raw_name.decode('utf-8' if flags & _UTF8 else 'cp437')
+    if flags & _ENCRYPTED:
+        raise IDPException(f'{filename} is encrypted')
+    if compress_type not in (STORED, DEFLATED):
+        raise IDPException(f'{filename} is compressed with the unsupported method {compress_type}')
+    zip64, file_size, compress_size = _zip64_sizes(extra, file_size, compress_size)
+    date_time = ((mod_date >> 9) + 1980, (mod_date >> 5) & 0xF, mod_date & 0x1F,
+                 mod_time >> 11, (mod_time >> 5) & 0x3F, (mod_time & 0x1F) * 2)
+    if flags & _DESCRIPTOR:
+        crc = compress_size = file_size = None
+    return ZipMember(source, filename, flags, compress_type, date_time, crc, compress_size, file_size, zip64)
+
+
+def iter_zip(chunks):
+    """
+    Yield the :class:`ZipMember <ZipMember>` of a zip file as they arrive, reading its local headers rather than
+    its central directory, which comes last. A member is only readable until the next one is yielded, and what
+    was not read of it is skipped. The chunks are closed when the iteration ends, which releases the connection of
+    a streamed export.
+
+    :param chunks: iterator of bytes chunks, e.g. of :meth:`sixe_idp.api.Client.extraction_faas_export_stream`,
+        or a binary file object
+
+        for member in iter_zip(client.split_and_extraction_export_stream(application_id)):
+            if member.filename.endswith('.json'):
+                process(json.load(member))
+    """
+    if hasattr(chunks, 'read'):
+        chunks = iter(lambda f=chunks: f.read(READ_SIZE), b'')
+    source = _Source(chunks)
+    member = None
+    try:
+        while True:
+            if member is not None:
+                member._skip()
+            signature = source.read_some(4)
+            if not signature:
+                return
+            if len(signature) < 4:
+                signature += source.read(4 - len(signature))
+            if signature in END_SIGNATURES:
+                return
+            if signature != LOCAL_HEADER:
+                if member is None:
+                    raise IDPException('Not a zip file')
+                raise IDPException(f'Bad zip record after {member.filename}')
+            member = _read_member(source)
+            yield member
+    finally:
+        source.close()
@@ -0,0 +1,36 @@
+import pytest
+
+from sixe_idp.api import Client, OauthClient
+from sixe_idp.mock_server import MockIDPServer
+from sixe_idp.polling import FAMILIES, PollBackoff
+
+SECRET = 'secret'
+
+
+@pytest.fixture
+def server():
+    with MockIDPServer(completion_time=0.2, callback_secret=SECRET, seed=1) as server:
+        yield server
+
+
+def make_client(server, **kwargs):
+    """
+    return a client of the mock server, polling every 50 to 200ms
+    """
+    oauth_client = OauthClient(oauth2_authorization_url=server.token_url, client_id='id', client_secret=SECRET)
+    client = Client(http_host=server.url, oauth_client=oauth_client, **kwargs)
+    for family in FAMILIES:
+        client.poll_backoffs[family] = PollBackoff(min_interval=0.05, max_interval=0.2, jitter=0)
+    return client
+
+
+@pytest.fixture
+def client(server):
+    return make_client(server)
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    path = tmp_path / 'statement.pdf'
+    path.write_bytes(b'%PDF-1.4\n' + bytes(range(256)) * 40)
+    return str(path)
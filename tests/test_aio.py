@@ -0,0 +1,75 @@
+import asyncio
+import inspect
+
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+
+from sixe_idp import aio  # noqa: E402
+from sixe_idp.aio import AsyncClient, AsyncOauthClient  # noqa: E402
+from sixe_idp.api import Client  # noqa: E402
+from sixe_idp.mock_server import constant  # noqa: E402
+
+from .conftest import SECRET  # noqa: E402
+
+
+def _client(server, **kwargs):
+    oauth_client = AsyncOauthClient(client_id='id', client_secret=SECRET, oauth2_authorization_url=server.token_url)
+    return AsyncClient(server.url, oauth_client, **kwargs)
+
+
+def test_signatures_mirror_the_sync_client():
+    for name, method in inspect.getmembers(AsyncClient, inspect.iscoroutinefunction):
+        if not name.startswith('_') and hasattr(Client, name):
+            assert inspect.signature(method) == inspect.signature(getattr(Client, name)), name
+
+
+def test_create_result_and_history(server, pdf):
+    server.tasks.clear()
+
+    async def main():
+        async with _client(server) as client:
+            tasks = await asyncio.gather(*(client.extraction_async_create(file=pdf, file_type='CBKS')
+                                           for _ in range(5)))
+            server.tasks[tasks[0].task_id].done_at = 0
+            result = await client.extraction_result(tasks[0].task_id)
+            history = await client.extraction_task_history(1, 3)
+            return tasks, result, history
+
+    tasks, result, history = asyncio.run(main())
+    assert len({task.task_id for task in tasks}) == 5
+    assert result['data']['taskStatus'] == 'Done'
+    assert len(history['data']['records']) == 3 and history['data']['total'] == 5
+    assert server.stats['requests:token'] == 1
+
+
+def test_path_files_closed_when_the_request_fails(server, pdf, monkeypatch):
+    opened = []
+
+    def tracking_open(*args, **kwargs):
+        opened.append(open(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(aio, 'open', tracking_open, raising=False)
+    server.error_rate = 1.0
+
+    async def main():
+        async with _client(server) as client:
+            client.oauth_client.token_header = {'Authorization': 'token'}
+            client.oauth_client.last_authorization_time = 10 ** 15
+            with pytest.raises(Exception):
+                await client.extraction_async_create(file=pdf, file_type='CBKS')
+
+    asyncio.run(main())
+    assert opened and all(f.closed for f in opened)
+
+
+def test_timeout(server):
+    server.latency = constant(1.0)
+
+    async def main():
+        async with _client(server, timeout=(1, 0.2)) as client:
+            await client.extraction_result('1')
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(main())
@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+from sixe_idp.api import IDPException
+
+
+def _paths(tmp_path, count, size=1000):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f'f{i}.pdf'
+        path.write_bytes(b'%PDF-1.4\n' + b'0' * size)
+        paths.append(str(path))
+    return paths
+
+
+def test_every_job_yields_a_result(server, client, tmp_path):
+    paths = _paths(tmp_path, 10)
+    results = list(client.submit_many(iter(paths + [str(tmp_path / 'missing.pdf')]), max_concurrency=3,
+                                      file_type='CBKS'))
+    assert sorted(r.job for r in results if r.ok) == paths
+    assert [type(r.error) for r in results if not r.ok] == [FileNotFoundError]
+    assert {server.tasks[r.task_id].file_name for r in results if r.ok} == {f'f{i}.pdf' for i in range(10)}
+
+
+def test_jobs_with_their_own_params(server, client, tmp_path):
+    paths = _paths(tmp_path, 2)
+    jobs = [{'file': paths[0], 'file_type': 'CINV'}, paths[1]]
+    results = {r.job if isinstance(r.job, str) else r.job['file']: r for r in client.submit_many(jobs,
+                                                                                              file_type='CBKS')}
+    assert server.tasks[results[paths[0]].task_id].params['fileType'] == 'CINV'
+    assert server.tasks[results[paths[1]].task_id].params['fileType'] == 'CBKS'
+
+
+@pytest.mark.parametrize('as_file', [False, True])
+def test_faas_jobs_given_as_files(server, client, tmp_path, as_file):
+    paths = _paths(tmp_path, 3)
+    jobs = [open(path, 'rb') for path in paths] if as_file else paths
+    try:
+        results = list(client.submit_many(jobs, endpoint='extraction_faas_create', customerType=1))
+    finally:
+        for job in jobs:
+            if as_file:
+                job.close()
+    assert all(r.ok for r in results), results
+    assert {server.tasks[r.task_id].family for r in results} == {'faas'}
+
+
+def test_concurrency_and_bytes_are_bounded(client, tmp_path, monkeypatch):
+    paths = _paths(tmp_path, 12, size=100000)
+    lock, inflight, peak = threading.Lock(), [0], [0]
+    create = client.extraction_async_create
+
+    def counting_create(**kwargs):
+        with lock:
+            inflight[0] += 1
+            peak[0] = max(peak[0], inflight[0])
+        try:
+            return create(**kwargs)
+        finally:
+            with lock:
+                inflight[0] -= 1
+
+    monkeypatch.setattr(client, 'extraction_async_create', counting_create)
+    results = list(client.submit_many(paths, max_concurrency=4, max_inflight_bytes=250000, file_type='CBKS'))
+    assert len(results) == 12 and all(r.ok for r in results)
+    assert peak[0] == 2
+
+
+def test_unknown_endpoint(client):
+    with pytest.raises(IDPException):
+        list(client.submit_many([], endpoint='extraction_result'))
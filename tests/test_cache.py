@@ -0,0 +1,92 @@
+import io
+import time
+
+import pytest
+
+from sixe_idp.cache import ResultCache, SubmissionCache, submission_key
+
+from .conftest import make_client
+
+ENDPOINT = 'extraction_async_create'
+DATA = {'fileType': 'CBKS', 'lang': 'EN'}
+
+
+def test_key_of_the_same_file_given_in_any_form(pdf):
+    with open(pdf, 'rb') as f:
+        content = f.read()
+        f.seek(10)
+        keys = {submission_key(ENDPOINT, DATA, {'file': file})
+                for file in (pdf, content, io.BytesIO(content), ('other.pdf', content))}
+        assert f.tell() == 10
+    assert len(keys) == 1
+
+
+def test_key_of_all_the_params_but_the_callbacks(pdf):
+    key = submission_key(ENDPOINT, DATA, {'file': pdf})
+    assert submission_key(ENDPOINT, dict(DATA, lang='CH'), {'file': pdf}) != key
+    for name, value in (('fileTypeFrom', 2), ('hitl', True), ('autoChecks', 1), ('extractMode', 1)):
+        assert submission_key(ENDPOINT, dict(DATA, **{name: value}), {'file': pdf}) != key, name
+    assert submission_key(ENDPOINT, dict(DATA, customerParam='batch-1', callback='http://x/'), {'file': pdf}) == key
+    assert submission_key('split_and_extraction_async_create', DATA, {'file': pdf}) != key
+    split = submission_key('split_and_extraction_async_create', {'groupId': '1'}, {'file': pdf})
+    assert submission_key('split_and_extraction_async_create', {'groupId': '1', 'hitl': True}, {'file': pdf}) != split
+    assert submission_key(ENDPOINT, DATA, {'file': b'other'}) != key
+
+
+def test_faas_key(pdf):
+    endpoint = 'extraction_faas_create'
+    key = submission_key(endpoint, {'fileType': 'CBKS'}, {'file': pdf})
+    assert submission_key(endpoint, {'fileType': 'CBKS', 'remark': 'r'}, {'file': pdf}) == key
+    assert submission_key(endpoint, {'fileType': 'CBKS', 'extra': 1}, {'file': pdf}) != key
+
+
+def test_no_key_of_unreadable_files():
+    class Stream(object):
+        def read(self, size=-1):
+            return b''
+
+    assert submission_key(ENDPOINT, DATA, {'file': Stream()}) is None
+
+
+def test_identical_submission_reuses_the_task(server, pdf):
+    client = make_client(server, submission_cache=SubmissionCache(':memory:'))
+    first = client.extraction_async_create(file=pdf, file_type='CBKS')
+    again = client.extraction_async_create(file=pdf, file_type='CBKS', customer_param='retry')
+    other = client.extraction_async_create(file=pdf, file_type='CINV')
+    hitl = client.extraction_async_create(file=pdf, file_type='CBKS', hitl=True)
+    assert again.task_id == first.task_id != other.task_id != hitl.task_id != first.task_id
+    assert server.stats['tasks'] == 3
+
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_result_cache_keeps_terminal_results_only(server, pdf, lazy):
+    cache = ResultCache()
+    client = make_client(server, result_cache=cache, lazy_results=lazy)
+    task = client.extraction_async_create(file=pdf, file_type='CBKS')
+    client.extraction_result(task.task_id)
+    assert cache.get('extraction', task.task_id) is None
+    server.tasks[task.task_id].done_at = 0
+    first = client.extraction_result(task.task_id)
+    assert client.extraction_result(task.task_id) is first
+    assert server.stats['requests:extraction_result'] == 2
+
+
+def test_result_cache_evicts_the_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    for application_id in ('1', '2', '3'):
+        cache.put('extraction', application_id, {'id': application_id})
+        cache.get('extraction', '1')
+    assert [cache.get('extraction', i) is not None for i in ('1', '2', '3')] == [True, False, True]
+    assert cache.stats['size'] == 2
+
+
+def test_result_cache_on_disk_is_shared_and_expires(tmp_path):
+    path = str(tmp_path / 'results.sqlite3')
+    ResultCache(path=path).put('faas', 1, {'data': 'x'})
+    cache = ResultCache(path=path, ttl=60)
+    assert cache.get('faas', '1') == {'data': 'x'} and cache.stats['disk_hits'] == 1
+    cache.ttl = 0
+    time.sleep(0.01)
+    assert cache.get('faas', '1') is None
+    cache.close()
@@ -0,0 +1,53 @@
+import json
+import threading
+
+import pytest
+
+from sixe_idp.callback import CallbackReceiver, make_server, send_callback
+
+from .conftest import SECRET
+
+# file parts of the mock callbacks per mode
+MODE_FILES = {0: set(), 1: set(), 2: {'file'}, 3: {'file', 'excel', 'json'}}
+
+
+@pytest.fixture
+def receiver(tmp_path):
+    receiver = CallbackReceiver(secret=SECRET, spool_dir=str(tmp_path))
+    server = make_server(receiver, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    receiver.url = f'http://127.0.0.1:{server.server_port}/'
+    yield receiver
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize('mode', [0, 1, 2, 3])
+def test_signed_callback_of_each_mode(server, client, receiver, pdf, mode):
+    future = receiver.expect(customer_param=f'mode-{mode}')
+    task = client.extraction_async_create(file=pdf, file_type='CBKS', customer_param=f'mode-{mode}',
+                                          callback=receiver.url, callback_mode=mode)
+    with future.result(timeout=10) as event:
+        assert event.verified is True
+        assert event.application_id == task.task_id
+        assert event.status == 'Done'
+        assert event.mode == mode
+        assert set(event.files) == MODE_FILES[mode]
+        assert ('fields' in event.result) == (mode >= 1)
+        if mode >= 2:
+            assert event.files['file'].read().startswith(b'%PDF')
+        if mode == 3:
+            assert json.loads(event.files['json'].read()) == event.result
+
+
+@pytest.mark.parametrize('mode', [0, 2, 3])
+def test_rejected_signatures(receiver, mode):
+    result = {'applicationId': '1', 'taskStatus': 'Done', 'callbackMode': mode}
+    files = {'file': ('1.pdf', b'%PDF-1.4')} if mode >= 2 else None
+    if mode == 3:
+        files.update(excel=('1.xlsx', b'xlsx'), json=('1.json', json.dumps(result).encode('utf-8')))
+    assert send_callback(receiver.url, result, secret='other', files=files).status_code == 401
+    assert send_callback(receiver.url, result, secret=None, files=files).status_code == 401
+    assert send_callback(receiver.url, result, secret=SECRET, files=files).status_code == 200
+
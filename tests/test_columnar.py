@@ -0,0 +1,28 @@
+import math
+
+import pytest
+
+from sixe_idp.columnar import fields_table, parse_number
+
+
+@pytest.mark.parametrize('text, number', [
+    ('1,234.50', 1234.5), ('-12.00', -12.0), ('(12.00)', -12.0), ('12.00-', -12.0), ('.5', 0.5), ('1e3', 1000.0),
+    ('(-12)', None), ('-12-', None), ('(+12)', None), ('(12', None), ('abc', None), ('', None),
+])
+def test_parse_number(text, number):
+    assert parse_number(text) == number
+
+
+def _result(application_id, **fields):
+    return {'data': {'applicationId': application_id, 'taskStatus': 'Done',
+                     'fields': [{'fieldCode': code, 'value': value} for code, value in fields.items()]}}
+
+
+def test_amounts_detected_and_ids_kept():
+    results = [_result('1', AMOUNT='1,234.00', ID='001234', COUNT='3'), _result('2', AMOUNT='12', ID='001235'),
+               _result('3', ID='001236', COUNT='4')]
+    table = fields_table(results)
+    assert list(table['AMOUNT'][:2]) == [1234.0, 12.0] and math.isnan(table['AMOUNT'][2])
+    assert list(table['ID']) == ['001234', '001235', '001236']
+    assert list(table['COUNT']) == ['3', None, '4']
+    assert list(fields_table(results, numeric=['COUNT'])['COUNT'][::2]) == [3.0, 4.0]
@@ -0,0 +1,47 @@
+import io
+import json
+
+import pytest
+
+from sixe_idp.api import IDPException
+
+
+def _done_faas_task(server, client, pdf):
+    task = client.extraction_faas_create(files={'files': open(pdf, 'rb')}, customerType=1)
+    server.tasks[task.task_id].done_at = 0
+    return task.task_id
+
+
+def test_export_streamed_to_a_file(server, client, pdf, tmp_path):
+    server.export_size = 512 * 1024
+    application_id = _done_faas_task(server, client, pdf)
+    dest = tmp_path / 'export.zip'
+    written = client.extraction_faas_export_to_file(application_id, str(dest), chunk_size=16 * 1024)
+    assert written == dest.stat().st_size > server.export_size * 0.9
+    assert dest.read_bytes() == client.extraction_faas_export(application_id)
+    chunks = list(client.extraction_faas_export_stream(application_id, chunk_size=16 * 1024))
+    assert len(chunks) > 1 and max(len(chunk) for chunk in chunks) <= 16 * 1024
+
+
+def test_export_of_an_unfinished_task_raises_before_writing(server, client, pdf):
+    task = client.extraction_faas_create(files={'files': open(pdf, 'rb')}, customerType=1)
+    dest = io.BytesIO()
+    with pytest.raises(IDPException, match='Task not finished'):
+        client.extraction_faas_export_to_file(task.task_id, dest)
+    assert dest.getvalue() == b''
+
+
+def test_json_export_content_is_streamed(server, client, pdf, monkeypatch):
+    content = json.dumps({'errorCode': None, 'fields': [{'fieldCode': f'F{i}'} for i in range(1000)]}).encode()
+    monkeypatch.setattr(server, '_export_bytes', lambda size: content)
+    application_id = _done_faas_task(server, client, pdf)
+    chunks = list(client.extraction_faas_export_stream(application_id, chunk_size=1024))
+    assert len(chunks) > 1 and b''.join(chunks) == content
+
+
+def test_json_error_answered_with_http_200(server, client, pdf, monkeypatch):
+    monkeypatch.setattr(server, '_export', lambda family, body, files: (200, {'errorCode': 'E1', 'message': 'no'}))
+    application_id = _done_faas_task(server, client, pdf)
+    with pytest.raises(IDPException, match='E1'):
+        list(client.extraction_faas_export_stream(application_id))
+
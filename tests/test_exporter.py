@@ -0,0 +1,65 @@
+import csv
+import json
+
+import pytest
+
+from sixe_idp.api import IDPException
+from sixe_idp.exporter import export_results
+
+
+def _done_tasks(server, client, file_type, count):
+    task_ids = [client.extraction_async_create(file=(f'{i}.pdf', b'%PDF-1.4'), file_type=file_type).task_id
+                for i in range(count)]
+    for task_id in task_ids:
+        server.tasks[task_id].done_at = 0
+    return task_ids
+
+
+def test_history_exported_to_a_parquet_file_per_file_type(server, client, tmp_path):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    _done_tasks(server, client, 'CBKS', 5)
+    _done_tasks(server, client, 'CINV', 2)
+    summary = export_results(client, str(tmp_path / 'out' / '{file_type}.parquet'), history={'limit': 3},
+                             max_concurrency=3, row_group_size=2)
+    assert summary.results == 7 and summary.rows == 7 and not summary.failed
+    assert summary.files[str(tmp_path / 'out' / 'CBKS.parquet')] == 5
+    table = parquet.read_table(str(tmp_path / 'out' / 'CBKS.parquet'))
+    assert table.column_names == ['application_id', 'file_type', 'status'] + \
+        [f'F_CBKS_{i}' for i in range(5)] + ['extra_fields']
+    assert set(table.column('status').to_pylist()) == {'Done'}
+    assert parquet.ParquetFile(str(tmp_path / 'out' / 'CBKS.parquet')).num_row_groups == 3
+
+
+def test_csv_columns_of_the_given_fields(server, client, tmp_path):
+    task_ids = _done_tasks(server, client, 'CBKS', 2)
+    dest = tmp_path / 'results.csv'
+    summary = export_results(client, str(dest), application_ids=task_ids + ['999'], fields=['F_CBKS_0'],
+                             file_type='CBKS')
+    assert summary.results == 2 and [application_id for application_id, _ in summary.failed] == ['999']
+    with open(dest, newline='') as f:
+        rows = sorted(csv.DictReader(f), key=lambda row: row['application_id'])
+    assert [row['application_id'] for row in rows] == sorted(task_ids)
+    assert rows[0]['F_CBKS_0'] == 'value 0' and json.loads(rows[0]['extra_fields'])['F_CBKS_4'] == 'value 4'
+
+
+def test_table_rows_to_jsonl(tmp_path):
+    class ResultClient(object):
+        def extraction_result(self, application_id):
+            return {'data': {'applicationId': application_id, 'taskStatus': 'Done', 'fileTypeCode': 'CBKS',
+                             'fields': [{'fieldCode': 'NAME', 'value': 'Jane'},
+                                        {'fieldCode': 'TX', 'value': [{'D': '2024-05-20', 'A': 1}, {'D': None}]}]}}
+
+    dest = tmp_path / 'rows.jsonl'
+    summary = export_results(ResultClient(), str(dest), application_ids=['1', {'applicationId': '2'}], rows=True)
+    rows = sorted((json.loads(line) for line in dest.read_text().splitlines()),
+                  key=lambda row: (row['application_id'], row['row_index']))
+    assert summary.rows == 4 and len(rows) == 4
+    assert rows[0] == {'application_id': '1', 'file_type': 'CBKS', 'status': 'Done', 'table': 'TX', 'row_index': 0,
+                       'D': '2024-05-20', 'A': '1', 'extra_fields': None}
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'application_ids': [], 'format': 'xml'},
+                                    {'application_ids': [], 'max_concurrency': 0}])
+def test_invalid_arguments(kwargs, tmp_path):
+    with pytest.raises(IDPException):
+        export_results(None, str(tmp_path / 'out.jsonl'), **kwargs)
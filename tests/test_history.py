@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from sixe_idp.api import IDPException
+from sixe_idp.history import HistoryStore, history_records, history_total, iter_task_history
+from sixe_idp.mock_server import constant
+
+
+def _create(client, count, file_type='CBKS'):
+    return [client.extraction_async_create(file=(f'{i}.pdf', b'%PDF-1.4'), file_type=file_type).task_id
+            for i in range(count)]
+
+
+def test_every_page_iterated_in_order(server, client):
+    task_ids = _create(client, 25)
+    records = list(client.extraction_task_history_iter(limit=10, prefetch=3, sortColumn='id', sortOrder='ascending'))
+    assert [record['applicationId'] for record in records] == task_ids
+    assert server.stats['requests:history'] == 3
+
+
+def test_max_pages_and_filters(server, client):
+    _create(client, 12)
+    _create(client, 3, file_type='CINV')
+    assert len(list(client.extraction_task_history_iter(limit=5, max_pages=2))) == 10
+    records = list(client.extraction_task_history_iter(limit=2, fileTypeCode='CINV'))
+    assert len(records) == 3 and {record['fileTypeCode'] for record in records} == {'CINV'}
+
+
+def test_pages_without_total_end_at_the_first_short_one():
+    pages = {1: {'data': [{'id': 1}, {'id': 2}]}, 2: {'data': {'list': [{'id': 3}]}}}
+
+    class HistoryClient(object):
+        def extraction_task_history(self, page, limit, **filters):
+            return pages.get(page, {'data': None})
+
+    assert [record['id'] for record in iter_task_history(HistoryClient(), limit=2)] == [1, 2, 3]
+
+
+def test_page_formats():
+    assert history_records({'data': {'rows': [1]}, 'code': 200}) == [1]
+    assert history_records({'data': None}) == []
+    assert history_total({'data': {'totalCount': 7}}) == 7
+    assert history_total({'data': []}) is None
+    with pytest.raises(IDPException):
+        history_records({'data': 'oops'})
+    with pytest.raises(IDPException):
+        list(iter_task_history(None, limit=0))
+
+
+def test_store_syncs_the_new_tasks_only(server, client, tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.sqlite3'))
+    _create(client, 5)
+    assert store.sync(client, limit=2) == 5 and len(store) == 5
+    task_ids = _create(client, 2, file_type='CINV')
+    store.sync(client, limit=2)
+    assert len(store) == 7 and len(store.query(file_type='CINV')) == 2
+    assert store.get(task_ids[1])['fileTypeCode'] == 'CINV'
+
+
+def test_store_refreshes_the_pending_tasks_older_than_the_mark(server, client, tmp_path):
+    server.completion_time = constant(60)
+    store = HistoryStore(str(tmp_path / 'history.sqlite3'))
+    first = _create(client, 1)[0]
+    time.sleep(1.1)
+    second = _create(client, 1)[0]
+    store.sync(client)
+    assert {store.get(task_id)['taskStatus'] for task_id in (first, second)} == {'Doing'}
+    for task_id in (first, second):
+        server.tasks[task_id].done_at = 0
+    store.sync(client)
+    assert {store.get(task_id)['taskStatus'] for task_id in (first, second)} == {'Done'}
+    assert len(store.query(status=3)) == 2
@@ -0,0 +1,38 @@
+import hashlib
+import hmac
+import io
+
+from sixe_idp.api import (HmacVerifier, verify_app_header, verify_app_header_for_mode2,
+                          verify_app_header_for_mode3)
+
+from .conftest import SECRET
+
+
+def _signature(*parts):
+    return hmac.new(SECRET.encode('utf-8'), b''.join(parts), hashlib.sha256).hexdigest()
+
+
+def test_parts_signed_without_being_joined():
+    pdf = bytes(range(256)) * 1000
+    expected = _signature(b'{"taskStatus":"Done"}', pdf)
+    for file in (pdf, io.BytesIO(pdf), io.BufferedReader(io.BytesIO(pdf)), iter([pdf[:10], memoryview(pdf[10:])])):
+        verifier = HmacVerifier(SECRET).update('{"taskStatus":"Done"}').update(None).update(file)
+        assert verifier.hexdigest() == expected
+        assert HmacVerifier(SECRET).update(['{"taskStatus":"Done"}', pdf]).verify(expected.encode('ascii'))
+
+
+def test_invalid_signatures_are_rejected():
+    verifier = HmacVerifier(SECRET).update(b'payload')
+    assert not verifier.verify('0' * 64)
+    assert not verifier.verify(b'\xff' * 64)
+    assert not verify_app_header(b'payload', 'not hex', SECRET)
+
+
+def test_signatures_match_the_verify_functions():
+    result, pdf, excel, json_bytes = '{"taskStatus":"Done"}', b'%PDF-1.4', b'xlsx', b'{}'
+    assert verify_app_header(result, _signature(result.encode('utf-8')), SECRET)
+    assert verify_app_header_for_mode2(result.encode('utf-8'), io.BytesIO(pdf),
+                                       _signature(result.encode('utf-8'), pdf), SECRET)
+    signature = _signature(result.encode('utf-8'), pdf, excel, json_bytes)
+    assert verify_app_header_for_mode3(result.encode('utf-8'), pdf, excel, json_bytes, signature, SECRET)
+    assert not verify_app_header_for_mode3(result.encode('utf-8'), pdf, json_bytes, excel, signature, SECRET)
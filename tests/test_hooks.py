@@ -0,0 +1,72 @@
+from collections import defaultdict
+
+import pytest
+import requests
+
+from sixe_idp.api import IDPException
+from sixe_idp.hooks import Hooks
+from sixe_idp.retry import RetryPolicy
+
+from .conftest import make_client
+
+
+def _recorded(client):
+    events = defaultdict(list)
+    for name in ('before_request', 'after_response', 'on_retry', 'on_token_refresh', 'on_error'):
+        client.hooks.register(name, events[name].append)
+    return events
+
+
+def test_events_of_successful_calls(server, client, pdf):
+    events = _recorded(client)
+    task = client.extraction_async_create(file=pdf, file_type='CBKS')
+    client.extraction_result(task.task_id)
+    before, after = events['before_request'], events['after_response']
+    assert [event.endpoint for event in before] == ['extraction_async_create', 'extraction_result']
+    assert [event.endpoint for event in after] == ['extraction_async_create', 'extraction_result']
+    create, result = after
+    assert create.family == 'create' and create.application_id == task.task_id and create.status_code == 200
+    assert {'encode', 'token', 'limiter', 'network', 'decode', 'total'} <= set(create.timings)
+    assert create.bytes_sent > 10000
+    assert result.application_id == task.task_id and result.payload['data']['applicationId'] == task.task_id
+    assert not events['on_retry'] and not events['on_error']
+
+
+def test_retries_and_errors(server, pdf):
+    client = make_client(server, retry_policy=RetryPolicy(max_attempts=3, backoff=0.01))
+    events = _recorded(client)
+    server.error_rate = 1.0
+    with pytest.raises(IDPException):
+        client.extraction_result('1')
+    assert [event.attempt for event in events['on_retry']] == [1, 2]
+    assert all(event.status_code == 500 and event.delay is not None for event in events['on_retry'])
+    assert [event.status_code for event in events['after_response']] == [500]
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client._request('status', 'POST', 'http://127.0.0.1:1/', json={})
+    assert isinstance(events['on_error'][-1].error, requests.exceptions.ConnectionError)
+
+
+def test_token_refresh(server, client):
+    events = _recorded(client)
+    client.refresh_token()
+    assert not events['on_token_refresh']
+    client.oauth_client.last_authorization_time = 0
+    client.refresh_token()
+    assert [event.endpoint for event in events['on_token_refresh']] == ['oauth_token']
+
+
+def test_registry():
+    hooks = Hooks()
+    assert not hooks
+
+    @hooks.register('on_error')
+    def handler(event):
+        raise ValueError(event)
+
+    assert hooks and 'on_error' in hooks
+    with pytest.raises(ValueError):
+        hooks.emit('on_error', 'event')
+    hooks.unregister('on_error', handler)
+    assert not hooks
+    with pytest.raises(IDPException):
+        hooks.register('after_upload', print)
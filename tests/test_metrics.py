@@ -0,0 +1,59 @@
+import pytest
+import requests
+
+from sixe_idp.api import IDPException
+from sixe_idp.cache import ResultCache
+from sixe_idp.metrics import MetricsRegistry, instrument, start_http_server
+
+from .conftest import make_client
+
+
+def _samples(registry):
+    return dict(line.rsplit(' ', 1) for line in registry.exposition().splitlines() if not line.startswith('#'))
+
+
+def test_clients_counted_once_and_caches_summed(server, pdf):
+    registry = MetricsRegistry()
+    first = make_client(server, result_cache=ResultCache())
+    second = make_client(server, result_cache=ResultCache())
+    instrument(first, registry)
+    instrument(first, registry)
+    instrument(second, registry)
+    task = first.extraction_async_create(file=pdf, file_type='CBKS')
+    server.tasks[task.task_id].done_at = 0
+    for client in (first, second):
+        client.extraction_result(task.task_id)
+        client.extraction_result(task.task_id)
+    samples = _samples(registry)
+    assert samples['sixe_idp_requests_total{endpoint="extraction_async_create",status="200"}'] == '1'
+    assert samples['sixe_idp_requests_total{endpoint="extraction_result",status="200"}'] == '2'
+    assert samples['sixe_idp_cache_lookups_total{cache="result",result="hit"}'] == '2'
+    assert samples['sixe_idp_cache_entries{cache="result"}'] == '2'
+
+
+def test_histogram_and_exposition_format():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('latency_seconds', 'Latency', labels=('endpoint',), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe('a"b', value=value)
+    registry.counter('calls_total', 'Calls').inc(amount=2)
+    text = registry.exposition()
+    assert '# TYPE latency_seconds histogram' in text
+    samples = _samples(registry)
+    assert samples['latency_seconds_bucket{endpoint="a\\"b",le="0.1"}'] == '1'
+    assert samples['latency_seconds_bucket{endpoint="a\\"b",le="+Inf"}'] == '3'
+    assert samples['latency_seconds_count{endpoint="a\\"b"}'] == '3' and samples['calls_total'] == '2'
+    with pytest.raises(IDPException):
+        registry.gauge('calls_total', 'Calls')
+
+
+def test_served_over_http():
+    registry = MetricsRegistry()
+    registry.gauge('up', 'Up').set(value=1)
+    server = start_http_server(0, host='127.0.0.1', registry=registry)
+    try:
+        r = requests.get(f'http://127.0.0.1:{server.server_port}/')
+        assert r.headers['Content-Type'].startswith('text/plain') and 'up 1' in r.text
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,49 @@
+import json
+import urllib.request
+
+import pytest
+import requests
+
+from sixe_idp.api import IDPException, OauthClient
+from sixe_idp.mock_server import STATS_PATH, MockIDPServer, constant
+
+from .conftest import SECRET, make_client
+
+
+def test_tasks_complete_after_the_completion_time(server, client, pdf):
+    server.completion_time = constant(60)
+    task = client.extraction_async_create(file=pdf, file_type='CBKS')
+    assert client.extraction_result(task.task_id)['data']['taskStatus'] == 'Doing'
+    server.tasks[task.task_id].done_at = 0
+    result = client.extraction_result(task.task_id)['data']
+    assert result['taskStatus'] == 'Done' and result['fields']
+
+
+def test_unknown_clients_and_tokens_are_rejected(pdf):
+    with MockIDPServer(clients={'id': SECRET}) as server:
+        assert make_client(server).extraction_async_create(file=pdf, file_type='CBKS').task_id
+        with pytest.raises(IDPException, match='Invalid client'):
+            OauthClient(oauth2_authorization_url=server.token_url, client_id='id', client_secret='other')
+        r = requests.post(f'{server.url}/customer/extraction/field/async/result', json={'applicationId': '1'},
+                          headers={'Authorization': 'forged'})
+        assert r.status_code == 401
+
+
+@pytest.mark.parametrize('settings, status', [({'error_rate': 1.0}, 500), ({'throttle_rate': 1.0}, 429)])
+def test_injected_errors(settings, status):
+    with MockIDPServer(retry_after=3, **settings) as server:
+        r = requests.post(server.token_url, json={'clientId': 'id'})
+        assert r.status_code == status
+        if status == 429:
+            assert r.headers['Retry-After'] == '3'
+        stats = json.loads(urllib.request.urlopen(f'{server.url}{STATS_PATH}').read())
+        assert stats['errors' if status == 500 else 'throttled'] == 1
+
+
+def test_history_filters(server, client, tmp_path):
+    for name, file_type in (('a.pdf', 'CBKS'), ('b.pdf', 'CINV'), ('ab.pdf', 'CBKS')):
+        client.extraction_async_create(file=(name, b'%PDF-1.4'), file_type=file_type)
+    records = client.extraction_task_history(page=1, limit=10, fileTypeCode='CBKS')['data']['records']
+    assert sorted(r['fileName'] for r in records) == ['a.pdf', 'ab.pdf']
+    records = client.extraction_task_history(page=1, limit=10, fileName='b.', sortOrder='ascending')['data']
+    assert [r['fileName'] for r in records['records']] == ['b.pdf', 'ab.pdf'] and records['total'] == 2
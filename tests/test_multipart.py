@@ -0,0 +1,62 @@
+import io
+
+import pytest
+import requests
+
+from sixe_idp.callback import _boundary
+from sixe_idp.multipart import MultipartEncoder
+
+
+def _requests_body(data, files):
+    request = requests.Request('POST', 'http://idp.local/', data=data, files=files).prepare()
+    return request.body, _boundary(request.headers['Content-Type']).decode('ascii')
+
+
+def _files(pdf):
+    with open(pdf, 'rb') as f:
+        content = f.read()
+    return content, [
+        {'file': ('statement.pdf', content)},
+        {'file': ('statement.pdf', content, 'application/pdf')},
+        {'file': ('relevé "mars".pdf', content)},
+        {'file': ('a.pdf', content), 'other': ('b.pdf', b'')},
+    ]
+
+
+@pytest.mark.parametrize('index', range(4))
+def test_body_matches_requests(pdf, index):
+    data = {'fileType': 'CBKS', 'lang': 'EN', 'hitl': None, 'codes': ['A', 'B'], 'empty': ''}
+    _, files = _files(pdf)
+    expected, boundary = _requests_body(data, files[index])
+    with MultipartEncoder(data, files[index], boundary=boundary) as body:
+        assert len(body) == len(expected)
+        assert b''.join(body) == expected
+
+
+def test_files_as_path_file_object_and_bytes(pdf):
+    content, _ = _files(pdf)
+    expected, boundary = _requests_body({'fileType': 'CBKS'}, {'file': ('statement.pdf', content)})
+    with open(pdf, 'rb') as f:
+        for file in (pdf, f, ('statement.pdf', io.BytesIO(content))):
+            with MultipartEncoder({'fileType': 'CBKS'}, {'file': file}, boundary=boundary) as body:
+                assert b''.join(body) == expected
+
+
+def test_read_in_small_chunks_and_rewind(pdf):
+    content, files = _files(pdf)
+    with MultipartEncoder({'fileType': 'CBKS'}, files[0]) as body:
+        chunks = iter(lambda: body.read(7), b'')
+        first = b''.join(chunks)
+        assert len(first) == len(body)
+        assert b''.join(body.iter_files()) == content
+        body.rewind()
+        assert b''.join(body) == first
+
+
+def test_upload_received_by_the_server(server, client, pdf):
+    content, _ = _files(pdf)
+    task = client.extraction_async_create(file=pdf, file_type='CBKS')
+    received = server.tasks[task.task_id]
+    assert received.file_name == 'statement.pdf'
+    assert received.file_size == len(content)
+    assert received.params['fileType'] == 'CBKS'
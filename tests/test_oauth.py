@@ -0,0 +1,47 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sixe_idp.api import OauthClient
+
+from .conftest import SECRET, make_client
+
+
+def _oauth_client(server, **kwargs):
+    return OauthClient(oauth2_authorization_url=server.token_url, client_id='id', client_secret=SECRET, **kwargs)
+
+
+def test_concurrent_refreshes_make_one_token_request(server):
+    client = make_client(server)
+    client.oauth_client.last_authorization_time -= 2000 * 1000
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda _: client.refresh_token(1000), range(32)))
+    assert server.stats['requests:token'] == 2
+
+
+def test_no_refresh_thread_by_default(server):
+    _oauth_client(server)
+    assert not [thread for thread in threading.enumerate() if thread.name == 'sixe-idp-token-refresh']
+
+
+def test_auto_refresh(server):
+    oauth_client = _oauth_client(server, auto_refresh=True, refresh_interval=1.5, refresh_ahead=1)
+    try:
+        first = oauth_client.token_header
+        deadline = time.monotonic() + 5
+        while oauth_client.token_header is first and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert server.stats['requests:token'] >= 2 and oauth_client.token_header is not first
+    finally:
+        oauth_client.stop_auto_refresh()
+
+
+def test_assigned_headers_last_until_the_token_is_refreshed(server):
+    client = make_client(server)
+    client.headers = {'Authorization': 'other'}
+    assert client.headers == {'Authorization': 'other'}
+    client.refresh_token(0)
+    assert client.headers == {'Authorization': 'other'}
+    client.oauth_client.last_authorization_time = 0
+    client.refresh_token(1)
+    assert client.headers is client.oauth_client.token_header
@@ -0,0 +1,56 @@
+import io
+import time
+
+from sixe_idp.mock_server import MockIDPServer, constant
+from sixe_idp.pipeline import SplitExtractionPipeline
+
+from .conftest import make_client
+
+
+def test_pipeline_yields_every_file(client):
+    files = [('f%d.pdf' % i, io.BytesIO(b'%PDF-1.4')) for i in range(6)] + [None]
+    results = list(SplitExtractionPipeline(client, group_id='g', max_inflight=3, requests_per_second=100,
+                                           timeout=10).run(files))
+    assert len(results) == 7
+    assert sum(not result.ok for result in results) == 1
+    for result in results:
+        if result.ok:
+            assert [page.name for page in sorted(result.pages, key=lambda p: p.name)] == ['page_1', 'page_2',
+                                                                                        'page_3']
+
+
+def test_pipeline_reports_failed_tasks_and_callback_errors():
+    with MockIDPServer(completion_time=0.1, fail_rate=1.0, seed=1) as server:
+        client = make_client(server)
+        results = list(SplitExtractionPipeline(client, group_id='g', timeout=10).run(
+            [('a.pdf', io.BytesIO(b'%PDF-1.4'))] * 2))
+        assert [result.status for result in results] == ['Fail', 'Fail']
+
+        class WithoutApplicationId(SplitExtractionPipeline):
+            def _upload(self, result):
+                result.application_id = None
+                return result
+
+        results = list(WithoutApplicationId(client, group_id='g').run([('a.pdf', io.BytesIO(b'%PDF-1.4'))] * 2))
+        assert [str(result.error) for result in results] == ['applicationId is required'] * 2
+
+
+def test_pipeline_closed_early(client):
+    files = (('f%d.pdf' % i, io.BytesIO(b'%PDF-1.4')) for i in range(100))
+    run = SplitExtractionPipeline(client, group_id='g', max_inflight=4, requests_per_second=100).run(files)
+    assert next(run).ok
+    run.close()
+    assert len(list(files)) < 100
+
+
+def test_pipeline_closed_early_creates_no_more_tasks(server, client):
+    server.completion_time = constant(60)
+    server.latency = constant(0.05)
+    files = (('f%d.pdf' % i, io.BytesIO(b'%PDF-1.4')) for i in range(100))
+    pipeline = SplitExtractionPipeline(client, group_id='g', upload_workers=1, max_inflight=20, timeout=0.2)
+    run = pipeline.run(files)
+    next(run)
+    run.close()
+    created = len(server.tasks)
+    time.sleep(0.3)
+    assert len(server.tasks) == created < 20
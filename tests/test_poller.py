@@ -0,0 +1,62 @@
+import io
+import threading
+import time
+
+from sixe_idp.api import IDPException
+from sixe_idp.mock_server import constant
+from sixe_idp.poller import StatusPoller
+
+
+def _create(client, count):
+    return [client.extraction_async_create(file=('a.pdf', io.BytesIO(b'%PDF-1.4')), file_type='CBKS').task_id
+            for _ in range(count)]
+
+
+def test_completed_ends_with_the_last_task(client):
+    task_ids = _create(client, 5)
+    with StatusPoller(client, requests_per_second=100) as poller:
+        for task_id in task_ids:
+            poller.add(task_id)
+        events = list(poller.completed(timeout=10))
+    assert sorted(event.application_id for event in events) == sorted(task_ids)
+    assert all(event.ok and event.status == 'Done' for event in events)
+    assert len(poller) == 0
+
+
+def test_unknown_task_is_given_up(client):
+    with StatusPoller(client, requests_per_second=100) as poller:
+        poller.add('404')
+        events = list(poller.completed(timeout=10))
+    assert len(events) == 1 and isinstance(events[0].error, IDPException)
+
+
+def test_timeout(server, client):
+    server.completion_time = constant(60)
+    task_ids = _create(client, 1)
+    started = time.monotonic()
+    with StatusPoller(client, requests_per_second=100, timeout=0.3) as poller:
+        poller.add(task_ids[0])
+        events = list(poller.completed(timeout=10))
+    assert len(events) == 1 and 'timeout' in str(events[0].error)
+    assert time.monotonic() - started < 5
+
+
+def test_remove_wakes_completed(server, client):
+    server.completion_time = constant(60)
+    task_ids = _create(client, 1)
+    with StatusPoller(client, requests_per_second=100) as poller:
+        poller.add(task_ids[0])
+        threading.Timer(0.2, poller.remove, (task_ids[0],)).start()
+        started = time.monotonic()
+        assert list(poller.completed(timeout=10)) == []
+        assert time.monotonic() - started < 5
+
+
+def test_callbacks_without_keeping_the_events(client):
+    task_ids = _create(client, 3)
+    received = []
+    with StatusPoller(client, requests_per_second=100, keep_events=False) as poller:
+        for task_id in task_ids:
+            poller.add(task_id, callback=received.append)
+        assert list(poller.completed(timeout=10)) == []
+    assert sorted(event.application_id for event in received) == sorted(task_ids)
@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+from sixe_idp.api import IDPException
+from sixe_idp.mock_server import constant
+from sixe_idp.polling import PollBackoff, wait_for
+
+
+def test_extraction_wait_returns_the_final_result(server, client, pdf):
+    task = client.extraction_async_create(file=pdf, file_type='CBKS')
+    result = client.extraction_wait(task.task_id, timeout=5)
+    assert result['data']['taskStatus'] == 'Done'
+    assert server.stats['requests:extraction_result'] >= 2
+    assert 0.1 < client.poll_backoffs['extraction'].expected_duration < 0.5
+
+
+def test_faas_wait_fetches_the_result(server, client, pdf):
+    task = client.extraction_faas_create(files={'files': open(pdf, 'rb')}, customerType=1)
+    result = client.extraction_faas_wait(task.task_id, timeout=5)
+    assert result['data']['applicationId'] == task.task_id
+
+
+def test_failed_faas_task_raises(server, client, pdf):
+    server.fail_rate = 1.0
+    task = client.extraction_faas_create(files={'files': open(pdf, 'rb')}, customerType=1)
+    with pytest.raises(IDPException, match='Fail'):
+        client.extraction_faas_wait(task.task_id, timeout=5)
+
+
+def test_timeout(server, client, pdf):
+    server.completion_time = constant(60)
+    task = client.extraction_async_create(file=pdf, file_type='CBKS')
+    with pytest.raises(IDPException, match='timeout'):
+        client.extraction_wait(task.task_id, timeout=0.3)
+
+
+def test_first_poll_aimed_at_the_expected_duration(server, client, pdf):
+    backoff = PollBackoff(min_interval=0.05, max_interval=1, jitter=0)
+    backoff.record(0.3)
+    submitted_at = time.time()
+    task = client.extraction_async_create(file=pdf, file_type='CBKS')
+    wait_for(client, 'extraction', task.task_id, timeout=5, submitted_at=submitted_at, backoff=backoff)
+    assert server.stats['requests:extraction_result'] == 1
+
+
+def test_backoff_schedule():
+    backoff = PollBackoff(min_interval=1, max_interval=10, multiplier=2, jitter=0, smoothing=0.5)
+    assert [backoff.next_delay(0, attempt) for attempt in (1, 2, 3, 5)] == [1, 2, 4, 10]
+    backoff.record(20)
+    backoff.record(40)
+    assert backoff.expected_duration == 30
+    assert backoff.next_delay(25, 0) == 5
+    assert backoff.next_delay(35, 1) == 3
+
+
+def test_unknown_family(client):
+    with pytest.raises(IDPException):
+        wait_for(client, 'other', '1')
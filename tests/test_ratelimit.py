@@ -0,0 +1,77 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+
+import pytest
+
+from sixe_idp.mock_server import constant
+from sixe_idp.ratelimit import AdaptiveConcurrency, RateLimiter, TokenBucket, parse_retry_after
+from sixe_idp.retry import RetryPolicy
+
+from .conftest import make_client
+
+
+def test_token_bucket_burst_then_rate():
+    bucket = TokenBucket(rate=20, capacity=5)
+    assert all(bucket.try_acquire() for _ in range(5)) and not bucket.try_acquire()
+    started = time.monotonic()
+    assert bucket.acquire(2)
+    assert 0.08 < time.monotonic() - started < 0.3
+    assert not bucket.acquire(5, timeout=0.05)
+    bucket.pause(1)
+    assert not bucket.acquire(timeout=0.5)
+
+
+def test_retry_after_in_seconds_or_as_a_date():
+    assert parse_retry_after('3') == 3.0
+    assert 8 < parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert parse_retry_after(formatdate(time.time() - 10, usegmt=True)) == 0.0
+    assert parse_retry_after('soon') is None and parse_retry_after(None) is None
+
+
+def test_aimd_limit():
+    concurrency = AdaptiveConcurrency(initial=4, minimum=2, maximum=5)
+    tickets = [concurrency.acquire() for _ in range(4)]
+    for ticket in tickets[:2]:
+        concurrency.release(ticket, throttled=True)
+    # the calls sent at the same limit only halve it once
+    assert concurrency.limit == 2 and concurrency.throttled == 2
+    for ticket in tickets[2:]:
+        concurrency.release(ticket, throttled=True)
+    assert concurrency.limit == 2
+    concurrency.release(concurrency.acquire(), throttled=True)
+    assert concurrency.limit == 2
+    for _ in range(20):
+        concurrency.release(concurrency.acquire())
+    assert concurrency.limit == 5
+    with pytest.raises(ValueError):
+        AdaptiveConcurrency(initial=8, maximum=4)
+
+
+def test_retry_after_pauses_the_family():
+    limiter = RateLimiter()
+    with limiter.slot('status') as slot:
+        slot.record(429, '0.2')
+    started = time.monotonic()
+    with limiter.slot('status') as slot:
+        slot.record(200)
+    with limiter.slot('create') as slot:
+        slot.record(200)
+    assert time.monotonic() - started >= 0.18
+    assert limiter.stats['status']['throttled'] == 1 and limiter.stats['create']['throttled'] == 0
+    with pytest.raises(ValueError):
+        RateLimiter(rates={'upload': 1})
+
+
+def test_backs_off_when_the_server_throttles(server):
+    server.max_concurrency = 2
+    server.latency = constant(0.1)
+    server.retry_after = 0
+    limiter = RateLimiter(initial_concurrency=8)
+    client = make_client(server, rate_limiter=limiter, retry_policy=RetryPolicy(max_attempts=20, backoff=0.05))
+    task_id = client.extraction_async_create(file=('a.pdf', b'%PDF-1.4'), file_type='CBKS').task_id
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda _: client.extraction_result(task_id), range(16)))
+    assert all(result['data']['applicationId'] == task_id for result in results)
+    assert server.stats['throttled'] > 0
+    assert limiter.stats['status']['throttled'] > 0 and limiter.stats['status']['limit'] < 8
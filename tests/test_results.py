@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from sixe_idp import results
+from sixe_idp.cache import ResultCache, result_status
+from sixe_idp.results import ExtractionResult, Result, dumps, loads
+
+from .conftest import make_client
+
+BODY = json.dumps({'code': 200, 'data': {
+    'applicationId': '12', 'taskStatus': 'Done', 'fields': [
+        {'fieldCode': 'F1', 'fieldName': 'Name', 'value': 'Jane'},
+        {'fieldCode': 'T1', 'fieldType': 'table', 'value': [
+            [{'fieldCode': 'D', 'value': '2024-05-20'}, {'fieldCode': 'A', 'value': '10'}],
+            {'D': '2024-05-21', 'A': '20'}]}]}}).encode('utf-8')
+
+
+def test_status_read_without_decoding():
+    result = ExtractionResult(content=BODY)
+    assert (result.status, result.application_id) == ('Done', '12') and not result.decoded
+    assert dumps(result) == BODY.decode('utf-8') and not result.decoded
+    assert result['data']['applicationId'] == '12' and result.decoded
+
+
+def test_fields_and_tables():
+    result = ExtractionResult(content=BODY)
+    assert result.value('F1') == 'Jane' and result.value('X', 'none') == 'none'
+    assert [field.code for field in result.fields] == ['F1', 'T1']
+    (table,) = result.tables
+    assert list(table) == [{'D': '2024-05-20', 'A': '10'}, {'D': '2024-05-21', 'A': '20'}]
+
+
+@pytest.mark.parametrize('body, status', [
+    (b'{"data":{"fields":[{"taskStatus":"Doing"}],"taskStatus":"Done","applicationId":"1"}}', 'Done'),
+    (b'{"data":{"fields":[{"taskStatus":"Doing"}],"applicationId":"1"}}', None),
+    (b'{"data":{"fields":[{"value":"a \\"taskStatus\\":\\"Doing\\""}],"status":"Fail"}}', 'Fail'),
+    (b'{"data":{"applicationId":"1","analysisStatus":"Done"}}', 'Done'),
+])
+def test_status_of_the_data_rather_than_its_nested_fields(body, status):
+    assert Result(content=body).status == status
+    assert result_status(Result(content=body)) == status
+    assert ResultCache().is_terminal('extraction', '1', Result(content=body)) == (status is not None)
+
+
+def test_json_backend_fallback(monkeypatch):
+    monkeypatch.setattr(results, 'orjson', None)
+    assert loads(BODY) == json.loads(BODY)
+    assert dict(Result(content=BODY.decode('utf-8'))) == json.loads(BODY)
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_client_results(server, pdf, lazy):
+    client = make_client(server, lazy_results=lazy)
+    task = client.extraction_async_create(file=pdf, file_type='CBKS')
+    server.tasks[task.task_id].done_at = 0
+    result = client.extraction_result(task.task_id)
+    assert isinstance(result, ExtractionResult) == lazy
+    assert result['data']['taskStatus'] == 'Done' and result['data']['fields']
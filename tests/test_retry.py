@@ -0,0 +1,82 @@
+import time
+
+import pytest
+import requests
+
+from sixe_idp.api import IDPException, IDPRateLimitException
+from sixe_idp.retry import RetryPolicy
+
+from .conftest import make_client
+
+
+def _client(server, **kwargs):
+    return make_client(server, retry_policy=RetryPolicy(backoff=0.01, **kwargs))
+
+
+def _lose_first_response(client, monkeypatch, sent):
+    """
+    make the first create fail like a read timeout, after (sent) or before reaching the server
+    """
+    post = client._post_multipart
+    calls = []
+
+    def flaky_post(url, data, files):
+        calls.append(url)
+        if len(calls) == 1:
+            if sent:
+                post(url, data, files)
+            raise requests.exceptions.ReadTimeout('lost')
+        return post(url, data, files)
+
+    monkeypatch.setattr(client, '_post_multipart', flaky_post)
+    return calls
+
+
+def test_read_only_calls_retried_on_server_errors(server, pdf):
+    client = _client(server, max_attempts=10)
+    task_id = client.extraction_async_create(file=pdf, file_type='CBKS').task_id
+    server.error_rate = 0.5
+    for _ in range(5):
+        assert client.extraction_result(task_id)['data']['applicationId'] == task_id
+    assert server.stats['errors'] > 0
+
+
+def test_creates_not_retried_after_reaching_the_server(server, pdf):
+    client = _client(server)
+    server.error_rate = 1.0
+    with pytest.raises(IDPException):
+        client.extraction_async_create(file=pdf, file_type='CBKS')
+    assert server.stats['requests:create'] == 1
+
+
+def test_throttled_calls_raise_once_the_attempts_are_spent(server, pdf):
+    client = _client(server, max_attempts=2)
+    server.throttle_rate = 1.0
+    server.retry_after = 0
+    with pytest.raises(IDPRateLimitException) as info:
+        client.extraction_async_create(file=pdf, file_type='CBKS')
+    assert info.value.retry_after == 0 and server.stats['requests:create'] == 2
+
+
+@pytest.mark.parametrize('sent', [True, False])
+def test_ambiguous_create_retried_once_the_history_tells(server, pdf, monkeypatch, sent):
+    client = _client(server, retry_creates=True)
+    calls = _lose_first_response(client, monkeypatch, sent)
+    task = client.extraction_async_create(file=pdf, file_type='CBKS', customer_param='batch-1')
+    assert server.stats['tasks'] == 1 and server.tasks[task.task_id].params['customerParam'] == 'batch-1'
+    assert len(calls) == (1 if sent else 2)
+
+
+def test_ambiguous_create_without_marker_not_retried(server, pdf, monkeypatch):
+    client = _client(server, retry_creates=True)
+    _lose_first_response(client, monkeypatch, sent=False)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.extraction_async_create(file=pdf, file_type='CBKS')
+
+
+def test_timeout_shortened_to_the_deadline():
+    policy = RetryPolicy(deadline=10)
+    assert policy.timeout((3, 60), started=time.monotonic() - 5)[1] <= 5
+    assert policy.timeout(None, started=0) == 0.001
+    assert RetryPolicy(deadline=None).timeout(7, started=0) == 7
+    assert RetryPolicy(max_backoff=1).delay(10, retry_after=3) == 3
@@ -0,0 +1,41 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sixe_idp.api import HttpTransport
+
+from .conftest import make_client
+
+
+def _status_calls(server, client, count, threads=1):
+    task_id = client.extraction_async_create(file=('a.pdf', b'%PDF-1.4'), file_type='CBKS').task_id
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(lambda _: client.extraction_result(task_id), range(count)))
+    return server.stats['connections']
+
+
+def test_connections_are_kept_alive(server):
+    assert _status_calls(server, make_client(server), 20) <= 2
+
+
+def test_connections_shared_by_the_threads(server):
+    client = make_client(server, transport=HttpTransport(pool_maxsize=4, pool_block=True))
+    assert _status_calls(server, client, 40, threads=4) <= 6
+
+
+def test_connections_closed_without_keep_alive(server):
+    client = make_client(server, transport=HttpTransport(keep_alive=False))
+    assert _status_calls(server, client, 5) >= 6
+
+
+def test_session_per_thread_and_default_timeout(monkeypatch):
+    transport = HttpTransport(timeout=(1, 2))
+    sessions = []
+    thread = threading.Thread(target=lambda: sessions.append(transport.session))
+    thread.start()
+    thread.join()
+    assert transport.session is transport.session is not sessions[0]
+    calls = []
+    monkeypatch.setattr(transport.session, 'request', lambda method, url, **kwargs: calls.append(kwargs))
+    transport.post('http://idp.local/')
+    transport.get('http://idp.local/', timeout=5)
+    assert [call['timeout'] for call in calls] == [(1, 2), 5]
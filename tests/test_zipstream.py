@@ -0,0 +1,100 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from sixe_idp.api import IDPException
+from sixe_idp.zipstream import DATA_DESCRIPTOR, iter_zip
+
+MEMBERS = {
+    'page_1.json': b'{"page": 1}',
+    'page_1.pdf': b'%PDF-1.4\n' + os.urandom(70000),
+    # stored data holding the data descriptor signature, which only ends it with a matching crc and size
+    'tricky.bin': b'abc' + DATA_DESCRIPTOR + b'\x00' * 20 + b'def',
+    'empty.txt': b'',
+    'dir/': b'',
+}
+
+
+class _Unseekable(io.RawIOBase):
+    """
+    output of a zip written as a stream, whose members then end with data descriptors
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.data += b
+        return len(b)
+
+
+def _zip(compression, streamed, zip64=False):
+    output = _Unseekable() if streamed else io.BytesIO()
+    with zipfile.ZipFile(output, 'w', compression) as zf:
+        for name, content in MEMBERS.items():
+            if name.endswith('/'):
+                zf.writestr(name, content)
+                continue
+            with zf.open(zipfile.ZipInfo(name), 'w', force_zip64=zip64) as member:
+                member.write(content)
+    return bytes(output.data) if streamed else output.getvalue()
+
+
+def _chunks(data, size):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+def _read(chunks):
+    return {member.filename: member.read() for member in iter_zip(chunks)}
+
+
+@pytest.mark.parametrize('compression', [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+@pytest.mark.parametrize('streamed', [False, True])
+@pytest.mark.parametrize('zip64', [False, True])
+@pytest.mark.parametrize('chunk_size', [1, 7, 65536])
+def test_members(compression, streamed, zip64, chunk_size):
+    data = _zip(compression, streamed, zip64)
+    if streamed:
+        assert any(info.flag_bits & 0x8 for info in zipfile.ZipFile(io.BytesIO(data)).infolist())
+    assert _read(_chunks(data, chunk_size)) == MEMBERS
+
+
+def test_sizes_of_the_data_descriptors_once_read():
+    data = _zip(zipfile.ZIP_DEFLATED, streamed=True, zip64=True)
+    for member in iter_zip(_chunks(data, 4096)):
+        assert member.file_size is None and member.CRC is None
+        content = member.read()
+        assert member.file_size == len(content)
+
+
+def test_file_object_and_skipped_members():
+    data = _zip(zipfile.ZIP_DEFLATED, streamed=True)
+    members = list(iter_zip(io.BytesIO(data)))
+    assert [m.filename for m in members] == list(MEMBERS)
+    with pytest.raises(IDPException):
+        members[0].read()
+
+
+def test_corrupted_archives():
+    data = bytearray(_zip(zipfile.ZIP_STORED, streamed=False))
+    offset = data.index(b'%PDF')
+    data[offset + 100] ^= 0xFF
+    with pytest.raises(IDPException, match='CRC'):
+        _read(_chunks(bytes(data), 1000))
+    with pytest.raises(IDPException, match='Truncated'):
+        _read(_chunks(bytes(data[:offset + 1000]), 1000))
+    with pytest.raises(IDPException, match='Not a zip file'):
+        _read([b'%PDF-1.4 not a zip'])
+
+
+def test_export_members_from_the_server(server, client, pdf):
+    task = client.split_and_extraction_async_create(file=pdf, group_id='g')
+    server.tasks[task.task_id].done_at = 0
+    names = [member.filename for member in client.split_and_extraction_export_members(task.task_id)]
+    assert sorted(names) == sorted(f'page_{page}.{extension}' for page in (1, 2, 3) for extension in ('pdf', 'json'))